@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+#
+# Copyright 2026 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+
+# Load modules from $CHARM_DIR/lib
+_path = os.path.dirname(os.path.realpath(__file__))
+_lib = os.path.abspath(os.path.join(_path, '../lib'))
+_root = os.path.abspath(os.path.join(_path, '..'))
+
+
+def _add_path(path):
+    if path not in sys.path:
+        sys.path.insert(1, path)
+
+
+_add_path(_lib)
+_add_path(_root)
+
+from charms.layer import basic  # noqa: E402
+basic.bootstrap_charm_deps()
+
+import charms_openstack.bus  # noqa: E402
+import charms_openstack.charm as charm  # noqa: E402
+import charmhelpers.core.hookenv as hookenv  # noqa: E402
+
+charms_openstack.bus.discover()
+
+
+def _require_active_active(charm_instance):
+    if not charm_instance.active_active:
+        raise RuntimeError('The grace db is only used with '
+                           'ganesha-active-active')
+
+
+def _format_members(members):
+    return '\n'.join('{}: {}'.format(nodeid, flags or '-')
+                     for nodeid, flags in sorted(members.items()))
+
+
+def _format_unreclaimed(unreclaimed):
+    return '\n'.join('{}: {}'.format(nodeid, ', '.join(clients) or '-')
+                     for nodeid, clients in sorted(unreclaimed.items()))
+
+
+def show_grace(*args):
+    """Report the rados_cluster grace db."""
+    with charm.provide_charm_instance() as charm_instance:
+        _require_active_active(charm_instance)
+        status = charm_instance.grace_status()
+        hookenv.action_set({
+            'current-epoch': status['cur'],
+            'recovery-epoch': status['rec'],
+            'in-grace': status['rec'] != 0,
+            'members': _format_members(status['members']),
+            'unreclaimed': _format_unreclaimed(
+                charm_instance.unreclaimed_clients(status)) or 'none',
+        })
+
+
+def lift_grace(*args):
+    """Lift the grace period of the requested rados_cluster nodes."""
+    with charm.provide_charm_instance() as charm_instance:
+        _require_active_active(charm_instance)
+        nodeids = (hookenv.action_get('nodes') or '').split()
+        lifted = charm_instance.lift_grace(
+            nodeids, force=bool(hookenv.action_get('force')))
+        status = charm_instance.grace_status()
+        hookenv.action_set({
+            'lifted': ' '.join(lifted) or 'none',
+            'in-grace': status['rec'] != 0,
+            'members': _format_members(status['members']),
+        })
+
+
+def run_deferred_restarts(*args):
+    """Run the restarts deferred by enable-auto-restarts=False."""
+    with charm.provide_charm_instance() as charm_instance:
+        restarted = charm_instance.run_deferred_restarts()
+        hookenv.action_set({
+            'restarted': ', '.join(restarted) or 'none',
+        })
+        charm_instance.assess_status()
+
+
+def _format_stats(rows, key):
+    return '\n'.join(
+        '{}: {} ops/s, {} bytes/s, {} ms'.format(
+            key(row), row['ops_per_sec'], row['bytes_per_sec'],
+            row['mean_latency_ms'])
+        for row in rows) or 'none'
+
+
+def _export_name(export):
+    return '{} ({}, export {})'.format(export['share_id'] or 'unknown share',
+                                       export['path'], export['export_id'])
+
+
+def show_nfs_stats(*args):
+    """Report the busiest exports and clients of this unit."""
+    with charm.provide_charm_instance() as charm_instance:
+        stats = charm_instance.nfs_stats(
+            window=hookenv.action_get('window'),
+            top=hookenv.action_get('top'),
+            sort_by=hookenv.action_get('sort-by'))
+        hookenv.action_set({
+            'window': stats['window'],
+            'exports': _format_stats(stats['exports'], _export_name),
+            'clients': _format_stats(stats['clients'],
+                                     lambda client: client['client']),
+        })
+
+
+def _format_client(client):
+    state = 'connected' if client['connected'] else 'not connected'
+    if client['connected']:
+        state += ' ({}, idle {}s)'.format(
+            ' '.join(client['protocols']) or 'no protocol',
+            client['idle_seconds'])
+    records = ', '.join(
+        '{} {}'.format(record['clientid'], record['owner'] or '')
+        .strip() for record in client['records'])
+    return '{}: {}, recovery records: {}{}'.format(
+        client['client'], state, records or 'none',
+        ', EXPIRED' if client['expired'] else '')
+
+
+def list_nfs_clients(*args):
+    """Report the NFS clients and their recovery db records."""
+    with charm.provide_charm_instance() as charm_instance:
+        listing = charm_instance.nfs_clients()
+        results = {
+            'clients': '\n'.join(
+                _format_client(client)
+                for client in listing['clients']) or 'none',
+            'expired': ' '.join(
+                client['client'] for client in listing['clients']
+                if client['expired']) or 'none',
+        }
+        if not listing['ganesha']:
+            results['message'] = ('nfs-ganesha cannot be reached on this '
+                                  'unit, only recovery records are listed')
+        hookenv.action_set(results)
+
+
+def evict_nfs_clients(*args):
+    """Evict the requested, or expired, NFS clients."""
+    with charm.provide_charm_instance() as charm_instance:
+        clients = (hookenv.action_get('clients') or '').split()
+        expired = hookenv.action_get('expired')
+        if not clients and not expired:
+            raise ValueError('Give the clients to evict or set expired=true')
+        evicted = charm_instance.evict_nfs_clients(clients, expired=expired)
+        hookenv.action_set({
+            'evicted': '\n'.join(
+                '{}: {} records removed'.format(client['client'],
+                                                client['records'])
+                for client in evicted) or 'none',
+        })
+
+
+def _format_names(names, limit=50):
+    if len(names) > limit:
+        return '{} and {} more'.format(' '.join(names[:limit]),
+                                       len(names) - limit)
+    return ' '.join(names) or 'none'
+
+
+def _format_index_report(report):
+    return {
+        'entries': report['entries'],
+        'exports': report['exports'],
+        'duplicates': _format_names(report['duplicates']),
+        'dangling': _format_names(report['dangling']),
+        'foreign': _format_names(report['foreign']),
+        'index-bytes': report['index_bytes'],
+        'export-bytes': report['export_bytes'],
+    }
+
+
+def show_export_index(*args):
+    """Report the entries of the RADOS export index."""
+    with charm.provide_charm_instance() as charm_instance:
+        hookenv.action_set(_format_index_report(
+            charm_instance.export_index_report()))
+
+
+def compact_export_index(*args):
+    """Drop the duplicate and dangling entries of the export index."""
+    with charm.provide_charm_instance() as charm_instance:
+        report = charm_instance.export_index_report(compact=True)
+        results = _format_index_report(report)
+        results.update({
+            'removed': report['removed'],
+            'rewritten': report['rewritten'],
+        })
+        hookenv.action_set(results)
+
+
+# Actions to function mapping, to allow for illegal python action names that
+# can map to a python function.
+ACTIONS = {
+    'show-grace': show_grace,
+    'lift-grace': lift_grace,
+    'run-deferred-restarts': run_deferred_restarts,
+    'show-nfs-stats': show_nfs_stats,
+    'list-nfs-clients': list_nfs_clients,
+    'evict-nfs-clients': evict_nfs_clients,
+    'show-export-index': show_export_index,
+    'compact-export-index': compact_export_index,
+}
+
+
+def main(args):
+    action_name = os.path.basename(args[0])
+    try:
+        action = ACTIONS[action_name]
+    except KeyError:
+        return 'Action {} undefined'.format(action_name)
+    else:
+        try:
+            action(args)
+        except Exception as e:
+            hookenv.action_fail(str(e))
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -14,9 +14,18 @@
 
 import collections
 import errno
+import grp
+import hashlib
+import ipaddress
+import json
 import os
+import pwd
+import re
 import socket
 import subprocess
+import tempfile
+
+import yaml
 
 import charms_openstack.charm
 import charms_openstack.adapters
@@ -25,20 +34,31 @@ import charms_openstack.charm.utils
 import charmhelpers.contrib.network.ip as ch_net_ip
 import charms.reactive as reactive
 import charms.reactive.relations as relations
+import charmhelpers.contrib.openstack.ha.utils as os_ha_utils
+import charmhelpers.contrib.openstack.templating as os_templating
+import charmhelpers.contrib.openstack.utils as ch_os_utils
+import charmhelpers.core.templating as ch_templating
+from charmhelpers.core import unitdata
 from charmhelpers.core.host import (
     cmp_pkgrevno,
     service_pause,
     mkdir,
-    path_hash,
     write_file,
 )
 from charmhelpers.core.hookenv import (
     ERROR,
+    atexit,
     config,
     goal_state,
+    is_leader,
+    leader_get,
+    leader_set,
     local_unit,
     log,
     network_get,
+    related_units,
+    relation_get,
+    relation_ids,
 )
 from charmhelpers.contrib.hahelpers.cluster import (
     is_clustered,
@@ -46,9 +66,24 @@ from charmhelpers.contrib.hahelpers.cluster import (
 )
 from charmhelpers.contrib.storage.linux.ceph import (
     CephBrokerRq,
+    is_request_complete,
 )
 import charmhelpers.core as ch_core
 
+from lib.ganesha_export_watcher import (
+    install_export_watcher,
+    remove_export_watcher,
+)
+from lib.ganesha_exporter import (
+    install_exporter,
+    remove_exporter,
+)
+from lib.manila_share_endpoints import (
+    endpoint_service,
+    install_endpoint,
+    installed_endpoints,
+    remove_endpoint,
+)
 from lib.nfs_ganesha_nrpe import (
     install_nrpe_checks,
     install_nrpe_plugins,
@@ -65,6 +100,7 @@ MANILA_CLIENT_CA_FILE = MANILA_SSL_DIR + "ca.crt"
 MANILA_LOGGING_CONF = MANILA_DIR + "logging.conf"
 MANILA_API_PASTE_CONF = MANILA_DIR + "api-paste.ini"
 CEPH_CONF = '/etc/ceph/ceph.conf'
+CEPH_KEYRING = '/etc/ceph/ceph.client.{}.keyring'
 GANESHA_CONF = '/etc/ganesha/ganesha.conf'
 
 CEPH_CAPABILITIES = [
@@ -77,6 +113,15 @@ CEPH_CAPABILITIES = [
     "allow command \"auth get\", "
     "allow command \"auth get-or-create\""]
 
+# Replica count of the pools requested from ceph-mon when
+# ceph-pool-replicas is unset, the ceph-mon default.
+DEFAULT_CEPH_POOL_REPLICAS = 3
+
+# Share of the cluster data, in percent, requested for a separate
+# recovery-pool. It only holds the omap records of the recovery db and the
+# grace db, so it needs very few placement groups.
+RECOVERY_POOL_WEIGHT = 1
+
 # include/crm/common/results.h crm_exit_e enum specifies
 # OS-independent status codes.
 CRM_EX_ERROR = 1
@@ -84,6 +129,321 @@ CRM_EX_NOSUCH = 105
 
 CRM_ERR_MSG = 'Unexpected crm return code: {} {}'
 
+# unitdata keys used to coalesce restarts and skip unchanged keyrings.
+PENDING_RESTARTS_KEY = 'manila-ganesha.pending-restarts'
+PENDING_RELOADS_KEY = 'manila-ganesha.pending-reloads'
+# Content hashes of the rendered files the services run with, and of the
+# files whose restart or reload is queued, which become applied once it ran.
+APPLIED_HASHES_KEY = 'manila-ganesha.applied-hashes'
+PENDING_HASHES_KEY = 'manila-ganesha.pending-hashes'
+DEFERRED_RESTARTS_KEY = 'manila-ganesha.deferred-restarts'
+RECOVERY_LOCATION_KEY = 'manila-ganesha.recovery-location'
+CEPH_KEY_HASH_KEY = 'manila-ganesha.ceph-key-hash'
+GANESHA_CONFIG_APPLIED_KEY = 'manila-ganesha.ganesha-config-applied'
+
+GANESHA_PACKAGE = 'nfs-ganesha-ceph'
+
+# RADOS objects, in the application's pool, shared by manila and Ganesha. The
+# index holds one %url line per export object written by manila.
+GANESHA_EXPORT_INDEX = 'ganesha-export-index'
+GANESHA_EXPORT_COUNTER = 'ganesha-export-counter'
+
+# With ganesha-shared-config, the leader renders the blocks that are the same
+# on every unit to this object, and publishes the digests of the whole and of
+# its restart-only blocks in these leader settings.
+GANESHA_CONFIG_OBJECT = 'ganesha-config'
+GANESHA_CORE_TEMPLATE = 'ganesha-core.conf'
+GANESHA_CONFIG_HASH_KEY = 'ganesha-config-hash'
+GANESHA_CONFIG_FIXED_HASH_KEY = 'ganesha-config-fixed-hash'
+
+# Manila share backends. Without the share-backends option a single backend
+# with this name is rendered. Each backend has its own export index and
+# counter; the one in slot 0 keeps the objects above, so that existing
+# shares stay with it.
+DEFAULT_SHARE_BACKEND = 'cephfsnfs1'
+SHARE_BACKEND_NAME_RE = re.compile(r'^[A-Za-z0-9_-]+$')
+SHARE_BACKEND_KEYS = (
+    'name', 'filesystem', 'share-backend-name', 'reserved-share-percentage',
+    'max-over-subscription-ratio', 'filter-function', 'goodness-function',
+    'vip')
+# Ganesha export ids are 16 bit. The counter of the backend in slot n starts
+# at n * GANESHA_EXPORT_ID_RANGE so that backends never hand out the same id.
+GANESHA_EXPORT_ID_RANGE = 10000
+MAX_SHARE_BACKENDS = 6
+# Pacemaker colocation score keeping the VIP groups of the share backends
+# on different units while there are enough of them.
+SHARE_ENDPOINT_SPREAD_SCORE = '-100'
+# Leader settings mapping each backend name to its slot, naming the backend
+# that owns slot 0 and its objects for good, and listing the problems found
+# with the export counters.
+SHARE_BACKEND_SLOTS_KEY = 'share-backend-slots'
+SHARE_BACKEND_SLOT0_KEY = 'share-backend-slot0'
+SHARE_BACKEND_PROBLEMS_KEY = 'share-backend-problems'
+# The Pacemaker resources of the share endpoints last configured.
+SHARE_ENDPOINT_RESOURCES_KEY = 'manila-ganesha.share-endpoint-resources'
+# With several backends, send new shares to the one with the lowest share of
+# its capacity allocated, unless a backend sets its own goodness-function.
+DEFAULT_GOODNESS_FUNCTION = (
+    '100 - min(100, 100 * capabilities.allocated_capacity_gb / '
+    'max(capabilities.total_capacity_gb, 1))')
+
+# Helper run with the system python3, which has the dbus and rados modules
+# the charm venv lacks, to query Ganesha for the actions. Relative to the
+# charm directory.
+GANESHA_ADMIN = 'files/ganesha_admin'
+SYSTEM_PYTHON = '/usr/bin/python3'
+
+# RADOS_URLS watch_url, which makes Ganesha re-read its exports when the
+# watched object is notified, was added in nfs-ganesha 3.0.
+GANESHA_WATCH_URL_SINCE = '3.0'
+
+# Recovery backends keeping the client records in the RADOS_KV pool. The
+# 'fs' backend keeps them on the local filesystem of the unit.
+RADOS_RECOVERY_BACKENDS = ('rados_kv', 'rados_ng', 'rados_cluster')
+
+# The namespace option of RADOS_KV, and --ns of ganesha-rados-grace, which
+# keep the recovery db apart from the exports, were added in nfs-ganesha 3.0.
+GANESHA_RADOS_NAMESPACE_SINCE = '3.0'
+
+# Capabilities of the per-unit cephx identities used by Ganesha in
+# active/active mode. They are created with the application key, which is
+# allowed to run "auth get-or-create" (see CEPH_CAPABILITIES).
+GANESHA_UNIT_CAPABILITIES = [
+    "mds", "allow rw",
+    "mon", "allow r",
+    "osd", "allow rw"]
+
+# Metadata caching profiles selected with the cache-profile option. Each one
+# sets the MDCACHE block of ganesha.conf and the attribute expiry applied to
+# every export. 'coherent' matches the upstream FSAL_CEPH sample, which leaves
+# caching to libcephfs so that all clients see changes immediately. The other
+# profiles let Ganesha answer GETATTR and READDIR from its own cache for a
+# few seconds, which saves MDS round trips on trees that rarely change.
+CACHE_PROFILES = {
+    'coherent': {
+        'mdcache': [
+            ('Dir_Chunk', 0),
+        ],
+        'attr_expiration_time': 0,
+    },
+    'read-mostly': {
+        'mdcache': [
+            ('Entries_HWMark', 250000),
+            ('Chunks_HWMark', 100000),
+            ('Dir_Chunk', 128),
+            ('LRU_Run_Interval', 90),
+        ],
+        'attr_expiration_time': 60,
+    },
+    'metadata-heavy': {
+        'mdcache': [
+            ('Entries_HWMark', 1000000),
+            ('Chunks_HWMark', 250000),
+            ('Dir_Chunk', 512),
+            ('LRU_Run_Interval', 30),
+        ],
+        'attr_expiration_time': 10,
+    },
+}
+
+# Ranges accepted by Ganesha for the MDCACHE parameters and the export
+# attribute expiry used by CACHE_PROFILES.
+MDCACHE_PARAM_RANGES = {
+    'Entries_HWMark': (1, 2 ** 32 - 1),
+    'Chunks_HWMark': (1, 2 ** 32 - 1),
+    'Dir_Chunk': (0, 2 ** 32 - 1),
+    'LRU_Run_Interval': (1, 24 * 60 * 60),
+}
+ATTR_EXPIRATION_TIME_RANGE = (-1, 2 ** 31 - 1)
+
+# libcephfs client options accepted in ceph-client-options, with their type
+# and range. Sizes are in bytes and delays in seconds.
+CephClientOption = collections.namedtuple(
+    'CephClientOption', ['type', 'minimum', 'maximum'])
+
+CEPH_CLIENT_OPTIONS = {
+    'client_cache_size': CephClientOption(int, 1, 2 ** 31 - 1),
+    'client_caps_release_delay': CephClientOption(int, 1, 3600),
+    'client_oc': CephClientOption(bool, None, None),
+    'client_oc_size': CephClientOption(int, 0, 2 ** 40),
+    'client_oc_max_dirty': CephClientOption(int, 0, 2 ** 40),
+    'client_oc_target_dirty': CephClientOption(int, 0, 2 ** 40),
+    'client_oc_max_dirty_age': CephClientOption(float, 0, 3600),
+    'client_oc_max_objects': CephClientOption(int, 1, 2 ** 31 - 1),
+    'client_readahead_min': CephClientOption(int, 0, 2 ** 40),
+    'client_readahead_max_bytes': CephClientOption(int, 0, 2 ** 40),
+    'client_readahead_max_periods': CephClientOption(int, 0, 2 ** 31 - 1),
+}
+
+# Defaults of each ceph-client-profile, which ceph-client-options override.
+# The default profile leaves every option to libcephfs.
+CEPH_CLIENT_PROFILES = {
+    'default': {},
+    'large-sequential': {
+        'client_oc_size': 512 * 1024 ** 2,
+        'client_oc_max_dirty': 256 * 1024 ** 2,
+        'client_oc_target_dirty': 64 * 1024 ** 2,
+        'client_oc_max_objects': 2000,
+        'client_readahead_max_bytes': 64 * 1024 ** 2,
+        'client_readahead_max_periods': 8,
+    },
+    'small-files': {
+        'client_cache_size': 262144,
+        'client_oc_max_objects': 10000,
+        'client_readahead_max_periods': 2,
+        'client_caps_release_delay': 10,
+    },
+}
+
+# Defaults of libcephfs for the object cacher limits, which must satisfy
+# client_oc_target_dirty <= client_oc_max_dirty <= client_oc_size.
+CEPH_CLIENT_OC_DEFAULTS = {
+    'client_oc_size': 200 * 1024 ** 2,
+    'client_oc_max_dirty': 100 * 1024 ** 2,
+    'client_oc_target_dirty': 8 * 1024 ** 2,
+}
+
+# Accepted values of the export-delegations option. Write delegations are not
+# offered as Ganesha lacks CB_GETATTR support.
+EXPORT_DELEGATIONS = ('none', 'R')
+
+# The rados_cluster recovery backend and ganesha-rados-grace were added in
+# nfs-ganesha 2.7.
+GANESHA_ACTIVE_ACTIVE_SINCE = '2.7'
+
+# Key under which each unit publishes its NFS access addresses, separated by
+# spaces, on the cluster peer relation.
+EXPORT_ADDRESS_KEY = 'ganesha-export-address'
+
+# Tunables rendered into the NFS_CORE_PARAM block of ganesha.conf. Each entry
+# maps a charm option to the Ganesha parameter it sets, the range accepted by
+# Ganesha's config parser and the first nfs-ganesha release that knows about
+# the parameter. An option set to 0 is left at the Ganesha default.
+GaneshaParam = collections.namedtuple(
+    'GaneshaParam', ['option', 'name', 'minimum', 'maximum', 'since'])
+
+GANESHA_CORE_PARAMS = [
+    GaneshaParam('ganesha-dispatch-max-reqs',
+                 'Dispatch_Max_Reqs', 1, 10000, '2.5'),
+    GaneshaParam('ganesha-dispatch-max-reqs-xprt',
+                 'Dispatch_Max_Reqs_Xprt', 1, 2048, '2.5'),
+    GaneshaParam('ganesha-rpc-max-connections',
+                 'RPC_Max_Connections', 1, 10000, '2.5'),
+    GaneshaParam('ganesha-rpc-send-buffer-size',
+                 'MaxRPCSendBufferSize', 1, 1048576 * 9, '2.5'),
+    GaneshaParam('ganesha-rpc-recv-buffer-size',
+                 'MaxRPCRecvBufferSize', 1, 1048576 * 9, '2.5'),
+]
+
+# NFSv4 lease and grace tunables rendered into the NFSv4 block, with the
+# Ganesha defaults used when they are not set.
+GANESHA_NFSV4_PARAMS = [
+    GaneshaParam('ganesha-lease-lifetime', 'Lease_Lifetime', 1, 180, '2.5'),
+    GaneshaParam('ganesha-grace-period', 'Grace_Period', 1, 180, '2.5'),
+]
+GANESHA_DEFAULT_LEASE_LIFETIME = 60
+GANESHA_DEFAULT_GRACE_PERIOD = 90
+
+# Ganesha 2.7 moved request processing onto the ntirpc work pool, whose size
+# is set by RPC_Ioq_ThrdMax; earlier releases size the pool with Nb_Worker.
+GANESHA_WORKER_PARAM = 'RPC_Ioq_ThrdMax'
+GANESHA_LEGACY_WORKER_PARAM = 'Nb_Worker'
+GANESHA_WORKER_PARAM_SINCE = '2.7'
+GANESHA_WORKER_THREADS_MAX = 1024 * 128
+# Floor of the pool the charm sizes from the CPU count; Ganesha itself
+# defaults RPC_Ioq_ThrdMax to 200.
+GANESHA_WORKER_THREADS_MIN = 256
+GANESHA_WORKER_THREADS_PER_CPU = 16
+
+
+# Top level ganesha.conf blocks that Ganesha applies on SIGHUP. Any other
+# change needs a restart of the daemon.
+GANESHA_RELOADABLE_BLOCKS = ('EXPORT', 'EXPORT_DEFAULTS', 'LOG')
+
+
+def write_file_atomic(path, content, owner='root', group='root',
+                      perms=0o444):
+    """Replace a file with content in one step.
+
+    The content is written to a temporary file in the same directory, which
+    is then renamed over path, so that readers see either the old or the new
+    file and never a partial one.
+
+    :param path: the file to write
+    :type path: str
+    :param content: the content to write
+    :type content: bytes
+    """
+    uid = pwd.getpwnam(owner).pw_uid
+    gid = grp.getgrnam(group).gr_gid
+    fd, tmp = tempfile.mkstemp(
+        dir=os.path.dirname(path),
+        prefix='.{}.'.format(os.path.basename(path)))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            os.fchown(f.fileno(), uid, gid)
+            os.fchmod(f.fileno(), perms)
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except Exception:
+        os.unlink(tmp)
+        raise
+
+
+def ganesha_conf_blocks(content):
+    """Split ganesha.conf content into its top level entries.
+
+    Comments and blank lines are dropped and the whitespace of each entry is
+    normalised, so that only meaningful changes tell two files apart.
+
+    :param content: the content of a ganesha.conf file
+    :type content: str
+    :returns: (name, text) of each block or %directive, in file order.
+    :rtype: List[Tuple[str, str]]
+    """
+    entries = []
+    current = []
+    depth = 0
+    for line in content.splitlines():
+        line = line.split('#', 1)[0].strip()
+        if not line:
+            continue
+        if not current and line.startswith('%'):
+            entries.append((line.split()[0], ' '.join(line.split())))
+            continue
+        current.append(line)
+        depth += line.count('{') - line.count('}')
+        if depth == 0 and '{' in ''.join(current):
+            text = ' '.join(' '.join(current).split())
+            entries.append((text.split('{', 1)[0].strip(), text))
+            current = []
+    return entries
+
+
+def ganesha_conf_fixed_blocks(content):
+    """Return the entries of ganesha.conf content that need a restart.
+
+    :param content: the content of a ganesha.conf file
+    :type content: str
+    :rtype: List[Tuple[str, str]]
+    """
+    return [entry for entry in ganesha_conf_blocks(content)
+            if entry[0] not in GANESHA_RELOADABLE_BLOCKS]
+
+
+def ganesha_conf_reloadable(old, new):
+    """Check whether Ganesha can apply a ganesha.conf change on reload.
+
+    :param old: the previous content of ganesha.conf
+    :type old: str
+    :param new: the new content of ganesha.conf
+    :type new: str
+    :rtype: bool
+    """
+    return ganesha_conf_fixed_blocks(old) == ganesha_conf_fixed_blocks(new)
+
 
 @charms_openstack.adapters.config_property
 def access_ip(config):
@@ -101,6 +461,110 @@ def recovery_backend(config):
     return config.charm_instance.recovery_backend
 
 
+@charms_openstack.adapters.config_property
+def mdcache_params(config):
+    """Return the (name, value) pairs of the MDCACHE block."""
+    return config.charm_instance.cache_profile['mdcache']
+
+
+@charms_openstack.adapters.config_property
+def attr_expiration_time(config):
+    return config.charm_instance.attr_expiration_time
+
+
+@charms_openstack.adapters.config_property
+def export_defaults(config):
+    """Return the (name, value) pairs of the EXPORT_DEFAULTS block."""
+    return config.charm_instance.export_defaults
+
+
+@charms_openstack.adapters.config_property
+def delegations(config):
+    """Whether NFSv4 delegations are enabled server wide."""
+    return config.charm_instance.export_delegations != 'none'
+
+
+@charms_openstack.adapters.config_property
+def export_index_urls(config):
+    return config.charm_instance.export_index_urls
+
+
+@charms_openstack.adapters.config_property
+def share_backends(config):
+    """Return the manila share backends to render, see share_backends."""
+    return config.charm_instance.share_backends
+
+
+@charms_openstack.adapters.config_property
+def share_backend_names(config):
+    """Return the backends of the main manila-share, those without a VIP."""
+    return ','.join(backend['name']
+                    for backend in config.charm_instance.share_backends
+                    if not backend['vip'])
+
+
+@charms_openstack.adapters.config_property
+def watch_url(config):
+    """Return the RADOS url watched by Ganesha or None."""
+    return config.charm_instance.watch_url
+
+
+@charms_openstack.adapters.config_property
+def ganesha_config_url(config):
+    """Return the RADOS url of the shared core config or None."""
+    return config.charm_instance.ganesha_config_url
+
+
+@charms_openstack.adapters.config_property
+def ganesha_client_name(config):
+    """Return the cephx identity, without the client. prefix, of Ganesha."""
+    return config.charm_instance.ganesha_client_name
+
+
+@charms_openstack.adapters.config_property
+def ganesha_nodeid(config):
+    """Return the nodeid of this unit in the rados_cluster grace db."""
+    if config.charm_instance.active_active:
+        return config.charm_instance.ganesha_nodeid
+    return None
+
+
+@charms_openstack.adapters.config_property
+def recovery_pool(config):
+    """Return the pool of the RADOS_KV recovery db."""
+    return config.charm_instance.recovery_pool
+
+
+@charms_openstack.adapters.config_property
+def recovery_namespace(config):
+    """Return the RADOS namespace of the recovery db or None."""
+    return config.charm_instance.recovery_namespace
+
+
+@charms_openstack.adapters.config_property
+def ganesha_export_ips(config):
+    """Return the comma separated export addresses of all Ganesha units."""
+    return ','.join(config.charm_instance.export_ips)
+
+
+@charms_openstack.adapters.config_property
+def ganesha_core_params(config):
+    """Return the validated (name, value) pairs for NFS_CORE_PARAM."""
+    return config.charm_instance.ganesha_core_params
+
+
+@charms_openstack.adapters.config_property
+def ganesha_nfsv4_params(config):
+    """Return the validated (name, value) pairs for the NFSv4 block."""
+    return config.charm_instance.ganesha_nfsv4_params
+
+
+@charms_openstack.adapters.config_property
+def ceph_client_options(config):
+    """Return the (name, value) pairs of the libcephfs client sections."""
+    return config.charm_instance.ceph_client_options
+
+
 @charms_openstack.adapters.config_property
 def local_ip(_config):
     return ch_net_ip.get_relation_ip('tenant-storage')
@@ -213,6 +677,8 @@ class ManilaGaneshaCharm(charms_openstack.charm.HAOpenStackCharm,
         'nfs-ganesha-ceph',
         'manila-share',
         'python3-manila',
+        # used by the statistics exporter and actions.
+        'python3-dbus',
     ]
     required_relations = [
         'amqp',
@@ -223,7 +689,10 @@ class ManilaGaneshaCharm(charms_openstack.charm.HAOpenStackCharm,
     user = group = 'manila'
 
     adapters_class = GaneshaCharmRelationAdapters
-    # ceph_key_per_unit_name = True
+    # NOTE: ceph_key_per_unit_name is not used as ceph-mon only hands out the
+    # application key on the ceph-client relation. The per-unit identities
+    # needed in active/active mode are created by the charm itself, see
+    # configure_ganesha_keyring().
 
     # Note(coreycb): The pause, resume, and restart-services actions for
     # manila-ganesha will do nothing until the services in the following list
@@ -267,14 +736,259 @@ class ManilaGaneshaCharm(charms_openstack.charm.HAOpenStackCharm,
 
     @property
     def restart_map(self):
+        """Map each rendered file to the services that must restart.
+
+        Ganesha only reads ganesha.conf and ceph.conf. api-paste.ini is only
+        used by manila-api and logging.conf is not referenced by manila.conf,
+        so changes to either do not need any restart.
+        """
+        endpoint_services = self.endpoint_services
+        return {
+            GANESHA_CONF: ['nfs-ganesha'],
+            MANILA_CONF: ['manila-share'] + endpoint_services,
+            MANILA_API_PASTE_CONF: [],
+            MANILA_LOGGING_CONF: [],
+            CEPH_CONF: ['manila-share', 'nfs-ganesha'] + endpoint_services,
+        }
+
+    @property
+    def reload_map(self):
+        """Map files to the services reloaded rather than restarted.
+
+        A reload is only used when reload_sufficient() says the change can be
+        applied by the running daemon.
+        """
         return {
             GANESHA_CONF: ['nfs-ganesha'],
-            MANILA_CONF: ['manila-share', 'nfs-ganesha'],
-            MANILA_API_PASTE_CONF: ['manila-share', 'nfs-ganesha'],
-            MANILA_LOGGING_CONF: ['manila-share', 'nfs-ganesha'],
-            CEPH_CONF: ['manila-share', 'nfs-ganesha'],
         }
 
+    @staticmethod
+    def reload_sufficient(path, old, new):
+        """Check whether a change to a file can be applied with a reload.
+
+        :param path: the file that changed
+        :type path: str
+        :param old: the previous content of the file, None if there was none
+        :type old: Optional[bytes]
+        :param new: the new content of the file
+        :type new: bytes
+        :rtype: bool
+        """
+        if path != GANESHA_CONF or old is None:
+            return False
+        return ganesha_conf_reloadable(old.decode(), new.decode())
+
+    @staticmethod
+    def _content_hash(content):
+        """Return the sha256 hex digest of bytes content."""
+        return hashlib.sha256(content).hexdigest()
+
+    @staticmethod
+    def _read_file(path):
+        """Return the content of a file or None if it does not exist."""
+        try:
+            with open(path, 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def render_with_interfaces(self, interfaces, configs=None):
+        """Render the configuration files, writing only those that changed.
+
+        Every file is rendered in memory and compared by content hash with
+        what is on disk; unchanged files are not touched. The services of a
+        file are queued with queue_restarts(), or queue_reloads() when the
+        change can be applied without a restart, whenever its content differs
+        from the one they last applied, so that each one is restarted at most
+        once per hook, however many renders the hook does. As the applied
+        hashes are only stored once the restart ran, a file written by a hook
+        that then failed is still restarted for by the next hook.
+
+        :param interfaces: the endpoints to build the adapters from
+        :type interfaces: List[charms.reactive.Endpoint]
+        :param configs: the files to render, defaults to all of restart_map
+        :type configs: Optional[List[str]]
+        :returns: the files that were written.
+        :rtype: List[str]
+        """
+        adapters_instance = self.adapters_class(interfaces,
+                                                charm_instance=self)
+        restart_map = self.restart_map
+        if configs is None:
+            configs = restart_map.keys()
+        loader = os_templating.get_loader('templates/', self.release)
+        applied = unitdata.kv().get(APPLIED_HASHES_KEY, {})
+        pending = unitdata.kv().get(PENDING_HASHES_KEY, {})
+        changed = []
+        restarts = []
+        reloads = []
+        for conf in configs:
+            content = ch_templating.render(
+                source=os.path.basename(conf),
+                target=None,
+                context=adapters_instance,
+                template_loader=loader).encode()
+            digest = self._content_hash(content)
+            old = self._read_file(conf)
+            old_digest = None if old is None else self._content_hash(old)
+            if digest != old_digest:
+                if not os.path.isdir(os.path.dirname(conf)):
+                    mkdir(os.path.dirname(conf), perms=0o755)
+                write_file(conf, content, owner='root', group=self.group,
+                           perms=0o640)
+                changed.append(conf)
+            if applied.get(conf) == digest:
+                pending.pop(conf, None)
+                continue
+            if not restart_map.get(conf):
+                applied[conf] = digest
+                continue
+            pending[conf] = digest
+            # The services only run with what is on disk if it was applied.
+            if old_digest != applied.get(conf):
+                old = None
+            if (conf in self.reload_map and
+                    self.reload_sufficient(conf, old, content)):
+                reloads.extend(self.reload_map[conf])
+            else:
+                restarts.extend(restart_map[conf])
+        unitdata.kv().set(APPLIED_HASHES_KEY, applied)
+        unitdata.kv().set(PENDING_HASHES_KEY, pending)
+        self.queue_restarts(restarts)
+        self.queue_reloads(reloads)
+        return changed
+
+    def record_applied_hashes(self):
+        """Record the rendered files on disk as applied by the services.
+
+        Run on upgrade from a charm that did not keep the applied hashes, so
+        that the files it rendered do not all restart their services.
+        """
+        if unitdata.kv().get(APPLIED_HASHES_KEY) is not None:
+            return
+        applied = {}
+        for conf in self.restart_map.keys():
+            content = self._read_file(conf)
+            if content is not None:
+                applied[conf] = self._content_hash(content)
+        unitdata.kv().set(APPLIED_HASHES_KEY, applied)
+
+    @property
+    def pending_restarts(self):
+        """Return the services queued for a restart."""
+        return unitdata.kv().get(PENDING_RESTARTS_KEY, [])
+
+    @property
+    def pending_reloads(self):
+        """Return the services queued for a reload."""
+        return unitdata.kv().get(PENDING_RELOADS_KEY, [])
+
+    # Whether run_pending_restarts() is registered to run at the end of the
+    # hook. Kept per process as the queues in unitdata may outlive a hook.
+    _restarts_scheduled = False
+
+    def _queue(self, key, services):
+        pending = unitdata.kv().get(key, [])
+        new = [service
+               for service in collections.OrderedDict.fromkeys(services)
+               if service not in pending]
+        if not new:
+            return
+        if not ManilaGaneshaCharm._restarts_scheduled:
+            atexit(self.run_pending_restarts)
+            ManilaGaneshaCharm._restarts_scheduled = True
+        unitdata.kv().set(key, pending + new)
+
+    def queue_restarts(self, services):
+        """Queue services for a restart at the end of the current hook.
+
+        :param services: the services to restart
+        :type services: List[str]
+        """
+        self._queue(PENDING_RESTARTS_KEY, services)
+
+    def queue_reloads(self, services):
+        """Queue services for a reload at the end of the current hook.
+
+        A service also queued for a restart is only restarted.
+
+        :param services: the services to reload
+        :type services: List[str]
+        """
+        self._queue(PENDING_RELOADS_KEY, services)
+
+    def run_pending_restarts(self):
+        """Restart, then reload, every queued service once.
+
+        When enable-auto-restarts is off the restarts are deferred instead,
+        until run_deferred_restarts() is called. Reloads do not interrupt
+        clients and are always run. The files rendered for the services are
+        only recorded as applied once this succeeded.
+        """
+        ManilaGaneshaCharm._restarts_scheduled = False
+        restarts = self.pending_restarts
+        reloads = [service for service in self.pending_reloads
+                   if service not in restarts]
+        unitdata.kv().unset(PENDING_RESTARTS_KEY)
+        unitdata.kv().unset(PENDING_RELOADS_KEY)
+        if ch_os_utils.is_unit_paused_set():
+            # Services start from scratch when the unit is resumed.
+            restarts = reloads = []
+        elif restarts and not self.auto_restarts:
+            deferred = self.deferred_restarts
+            deferred += [service for service in restarts
+                         if service not in deferred]
+            log('Deferring restart of {}'.format(', '.join(restarts)),
+                level=ch_core.hookenv.WARNING)
+            unitdata.kv().set(DEFERRED_RESTARTS_KEY, deferred)
+            restarts = []
+        for service in restarts:
+            self.service_restart(service)
+        for service in reloads:
+            self.service_reload(service)
+        applied = unitdata.kv().get(APPLIED_HASHES_KEY, {})
+        applied.update(unitdata.kv().get(PENDING_HASHES_KEY, {}))
+        unitdata.kv().set(APPLIED_HASHES_KEY, applied)
+        unitdata.kv().unset(PENDING_HASHES_KEY)
+
+    @property
+    def auto_restarts(self):
+        """Whether restarts are run as soon as configuration changes."""
+        return config().get('enable-auto-restarts', True) is not False
+
+    @property
+    def deferred_restarts(self):
+        """Return the services whose restart waits for an operator."""
+        return unitdata.kv().get(DEFERRED_RESTARTS_KEY, [])
+
+    def run_deferred_restarts(self):
+        """Restart every service with a deferred restart, once.
+
+        Run from an action, where unitdata is not flushed on exit as it is
+        at the end of a hook, so the cleared list is flushed here.
+
+        :returns: the services that were restarted.
+        :rtype: List[str]
+        """
+        deferred = self.deferred_restarts
+        for service in deferred:
+            self.service_restart(service)
+        unitdata.kv().unset(DEFERRED_RESTARTS_KEY)
+        unitdata.kv().flush()
+        return deferred
+
+    def configure_ceph_keyring(self, key, cluster_name=None):
+        """Write the Ceph keyring unless it already holds this key."""
+        key_hash = self._content_hash(key.encode())
+        keyring = CEPH_KEYRING.format(ch_core.hookenv.application_name())
+        if (unitdata.kv().get(CEPH_KEY_HASH_KEY) == key_hash and
+                os.path.exists(keyring)):
+            return keyring
+        result = super().configure_ceph_keyring(key,
+                                                cluster_name=cluster_name)
+        unitdata.kv().set(CEPH_KEY_HASH_KEY, key_hash)
+        return result
+
     @property
     def service_to_resource_map(self):
         # TODO: interface-hacluster should be extended to provide
@@ -282,10 +996,13 @@ class ManilaGaneshaCharm(charms_openstack.charm.HAOpenStackCharm,
         # capability to lookup SystemdService objects containing the
         # resource name as a property. This map is only valid due to
         # how the code of this charm calls add_systemd_service.
-        return {
+        resources = {
             'manila-share': 'res_manila_share_manila_share',
             'nfs-ganesha': 'res_nfs_ganesha_nfs_ganesha'
         }
+        for service in self.endpoint_services:
+            resources[service] = self._systemd_resource(service)
+        return resources
 
     @staticmethod
     def _crm_no_such_resource_code():
@@ -312,6 +1029,7 @@ class ManilaGaneshaCharm(charms_openstack.charm.HAOpenStackCharm,
     def upgrade_charm(self):
         """ Override the default so we can set a flag before it runs. """
         reactive.set_flag('is-upgrade-charm')
+        self.record_applied_hashes()
         try:
             super().upgrade_charm()
         finally:
@@ -350,6 +1068,22 @@ class ManilaGaneshaCharm(charms_openstack.charm.HAOpenStackCharm,
                 raise RuntimeError(CRM_ERR_MSG.format(e.returncode,
                                                       '')) from e
 
+    def service_reload(self, service_name):
+        """Reload a service so that it re-reads its configuration.
+
+        For nfs-ganesha this sends SIGHUP, on which Ganesha re-reads
+        ganesha.conf, updating its exports (including those listed in the
+        RADOS export index) and log settings without dropping client state.
+        Services managed by Pacemaker are only reloaded on the unit where
+        they run; elsewhere they pick up the configuration when Pacemaker
+        starts them.
+        """
+        res_name = self.service_to_resource_map.get(service_name, None)
+        if (res_name and peer_units() and
+                not ch_core.host.service_running(service_name)):
+            return
+        ch_core.host.service_reload(service_name)
+
     def service_start(self, service_name):
         res_name = self.service_to_resource_map.get(service_name, None)
         if not res_name or not peer_units():
@@ -419,10 +1153,1246 @@ class ManilaGaneshaCharm(charms_openstack.charm.HAOpenStackCharm,
                     return vip
         return net_addr
 
+    @property
+    def multiple_access_ips(self):
+        return bool(config().get('multiple-access-ips'))
+
+    @staticmethod
+    def binding_addresses(binding='tenant-storage'):
+        """Return the (address, cidr) pairs of every address of a binding.
+
+        Link-local IPv6 addresses are left out, NFS clients on other hosts
+        cannot use them without a scope.
+
+        :rtype: List[Tuple[str, Optional[str]]]
+        """
+        try:
+            info = network_get(binding)
+        except Exception as e:
+            log("Getting the addresses of {} failed: {}".format(binding, e),
+                level=ERROR)
+            return []
+        addresses = []
+        for nic in info.get('bind-addresses') or []:
+            for address in nic.get('addresses') or []:
+                value = address.get('address')
+                if not value or ipaddress.ip_address(value).is_link_local:
+                    continue
+                addresses.append((value, address.get('cidr')))
+        return addresses
+
+    @property
+    def unit_access_ips(self):
+        """Return the addresses NFS clients can use to reach this unit.
+
+        With multiple-access-ips every address of the tenant-storage binding
+        is used, IPv4 and IPv6, so that clients spread over its interfaces.
+        The address of the binding always comes first.
+        """
+        primary = ch_net_ip.get_relation_ip('tenant-storage')
+        addresses = [primary]
+        if self.multiple_access_ips:
+            for address, _ in self.binding_addresses():
+                if address not in addresses:
+                    addresses.append(address)
+        return addresses
+
+    @property
+    def access_ips(self):
+        """Return the addresses NFS clients can use to reach the service.
+
+        access_ip comes first. With multiple-access-ips the other addresses
+        follow: every VIP within the networks of the tenant-storage binding
+        when clustered, or every address of the binding otherwise.
+        """
+        primary = self.access_ip
+        if not self.multiple_access_ips:
+            return [primary]
+        vips = (config().get('vip') or '').split()
+        if is_clustered() and vips:
+            networks = [ipaddress.ip_network(cidr, strict=False)
+                        for _, cidr in self.binding_addresses() if cidr]
+            candidates = [vip for vip in vips
+                          if any(ipaddress.ip_address(vip) in network
+                                 for network in networks)]
+        else:
+            candidates = self.unit_access_ips
+        return [primary] + [address
+                            for address in collections.OrderedDict.fromkeys(
+                                candidates)
+                            if address != primary]
+
     @property
     def recovery_backend(self):
+        if self.active_active:
+            return 'rados_cluster'
         return 'fs'
 
+    @property
+    def recovery_location(self):
+        """Return the (pool, namespace) of the recovery db and grace db.
+
+        This is the location Ganesha is configured with, which only follows
+        the recovery-pool and recovery-namespace options once
+        update_recovery_location() moved it.
+
+        :rtype: Tuple[str, Optional[str]]
+        """
+        location = unitdata.kv().get(RECOVERY_LOCATION_KEY)
+        if location is None:
+            return ch_core.hookenv.application_name(), None
+        return tuple(location)
+
+    @property
+    def recovery_pool(self):
+        return self.recovery_location[0]
+
+    @property
+    def recovery_namespace(self):
+        return self.recovery_location[1]
+
+    @property
+    def configured_recovery_location(self):
+        """Return the (pool, namespace) the recovery options ask for.
+
+        The namespace is ignored by nfs-ganesha releases older than 3.0, see
+        _validate_ceph_pools.
+
+        :rtype: Tuple[str, Optional[str]]
+        """
+        pool = (config().get('recovery-pool') or
+                ch_core.hookenv.application_name())
+        namespace = config().get('recovery-namespace')
+        if not (namespace and self.ganesha_version_at_least(
+                GANESHA_RADOS_NAMESPACE_SINCE)):
+            namespace = None
+        return pool, namespace
+
+    def update_recovery_location(self):
+        """Move the recovery db to the configured pool and namespace.
+
+        A separate recovery-pool is only used once ceph-mon completed the
+        broker request creating it, so that Ganesha and ganesha-rados-grace
+        are never pointed at a pool that does not exist yet.
+
+        :returns: True if the location changed.
+        :rtype: bool
+        """
+        location = self.configured_recovery_location
+        if location == self.recovery_location:
+            return False
+        if (location[0] != ch_core.hookenv.application_name() and
+                not is_request_complete(self.ceph_broker_request(),
+                                        relation='ceph')):
+            log('Keeping the recovery db in {} until ceph-mon created {}'
+                .format(self.recovery_pool, location[0]),
+                level=ch_core.hookenv.INFO)
+            return False
+        unitdata.kv().set(RECOVERY_LOCATION_KEY, list(location))
+        return True
+
+    @property
+    def active_active(self):
+        """Whether Ganesha runs on every unit using rados_cluster."""
+        return bool(config().get('ganesha-active-active'))
+
+    @staticmethod
+    def unit_nodeid(unit):
+        """Return the grace db nodeid and cephx name used by a unit.
+
+        :param unit: the unit name, e.g. 'manila-ganesha/0'
+        :type unit: str
+        :rtype: str
+        """
+        return unit.replace('/', '-')
+
+    @property
+    def ganesha_nodeid(self):
+        return self.unit_nodeid(local_unit())
+
+    @property
+    def ganesha_client_name(self):
+        if self.active_active:
+            return self.ganesha_nodeid
+        return ch_core.hookenv.application_name()
+
+    def configure_ganesha_keyring(self):
+        """Create the per-unit cephx identity used by Ganesha.
+
+        Only needed in active/active mode, where every unit holds its own
+        CephFS session so that an MDS can tell the Ganesha heads apart. The
+        application key is used to create the identity; an existing keyring
+        is kept as is.
+
+        :returns: True if a new keyring was written.
+        :rtype: bool
+        """
+        if not self.active_active:
+            return False
+        name = self.ganesha_client_name
+        keyring = CEPH_KEYRING.format(name)
+        if os.path.exists(keyring):
+            return False
+        app = ch_core.hookenv.application_name()
+        cmd = ['ceph', '--id', app, 'auth', 'get-or-create',
+               'client.{}'.format(name)] + GANESHA_UNIT_CAPABILITIES
+        cmd += ['-o', keyring]
+        subprocess.check_call(cmd)
+        os.chmod(keyring, 0o600)
+        return True
+
+    def _grace_cmd(self, *args):
+        app = ch_core.hookenv.application_name()
+        cmd = ['ganesha-rados-grace', '--pool', self.recovery_pool,
+               '--userid', app]
+        if self.recovery_namespace:
+            cmd += ['--ns', self.recovery_namespace]
+        return cmd + list(args)
+
+    def grace_status(self):
+        """Read the rados_cluster grace db.
+
+        :returns: the current and recovery epochs and the members with their
+                  flags ('N' needs grace, 'E' enforcing grace).
+        :rtype: Dict[str, Union[int, Dict[str, str]]]
+        :raises: subprocess.CalledProcessError if the db cannot be read.
+        """
+        output = subprocess.check_output(self._grace_cmd('dump'),
+                                         universal_newlines=True)
+        lines = output.splitlines()
+        epochs = dict(field.split('=', 1) for field in lines[0].split())
+        members = {}
+        for line in lines[1:]:
+            fields = line.split()
+            if not fields or fields[0].startswith('='):
+                continue
+            members[fields[0]] = ''.join(fields[1:])
+        return {
+            'cur': int(epochs['cur']),
+            'rec': int(epochs['rec']),
+            'members': members,
+        }
+
+    def update_grace_membership(self):
+        """Keep the rados_cluster grace db in line with the application.
+
+        Every unit adds itself; the leader also removes the nodes of units
+        that are no longer part of the application so that they cannot hold
+        the cluster in grace forever.
+
+        :returns: True if this unit was added to the grace db.
+        :rtype: bool
+        """
+        try:
+            members = self.grace_status()['members']
+        except subprocess.CalledProcessError:
+            # The grace db is created by the first 'add'.
+            members = {}
+        added = self.ganesha_nodeid not in members
+        if added:
+            subprocess.check_call(self._grace_cmd('add', self.ganesha_nodeid))
+        if is_leader():
+            expected = set(self.unit_nodeid(unit)
+                           for unit in goal_state().get('units', {}))
+            expected.add(self.ganesha_nodeid)
+            stale = sorted(set(members) - expected)
+            if stale:
+                log('Removing {} from the grace db'.format(', '.join(stale)),
+                    level=ch_core.hookenv.INFO)
+                subprocess.check_call(self._grace_cmd('remove', *stale))
+        return added
+
+    def unreclaimed_clients(self, status=None):
+        """Return the clients of each rados_cluster node yet to reclaim.
+
+        These are the clients recorded in the recovery epoch of the
+        recovery db that have no record in the current epoch yet.
+
+        :param status: the grace_status() to compare the epochs of, read if
+                       not given.
+        :type status: Optional[Dict]
+        :returns: the client addresses by nodeid, empty when not in grace.
+        :rtype: Dict[str, List[str]]
+        """
+        if status is None:
+            status = self.grace_status()
+        return self._admin('reclaim',
+                           '--current-epoch', str(status['cur']),
+                           '--recovery-epoch',
+                           str(status['rec']))['unreclaimed']
+
+    def lift_grace(self, nodeids=None, force=False):
+        """Lift the grace period of rados_cluster nodes.
+
+        Clients of these nodes that have not reclaimed their state yet lose
+        it. Nodes clear their own flag once all their clients reclaimed, so
+        the nodes still flagged are the ones holding the cluster in grace.
+
+        :param nodeids: the nodes to lift grace for, defaults to every member
+                        that still needs grace, provided none of their
+                        clients is yet to reclaim.
+        :type nodeids: Optional[List[str]]
+        :param force: lift grace for the default nodes even though some of
+                      their clients are yet to reclaim.
+        :type force: bool
+        :returns: the nodes grace was lifted for.
+        :rtype: List[str]
+        :raises: ValueError if a node is not a member of the grace db.
+        :raises: RuntimeError if clients of the default nodes are yet to
+                 reclaim and force is not set.
+        """
+        status = self.grace_status()
+        members = status['members']
+        if not nodeids:
+            nodeids = sorted(nodeid for nodeid, flags in members.items()
+                             if 'N' in flags)
+            pending = {}
+            if nodeids and not force:
+                pending = {
+                    nodeid: clients for nodeid, clients
+                    in self.unreclaimed_clients(status).items()
+                    if nodeid in nodeids and clients}
+            if pending:
+                raise RuntimeError(
+                    'Clients have not reclaimed their state yet ({}); give '
+                    'the nodes or force to lift grace anyway'.format(
+                        '; '.join('{}: {}'.format(nodeid, ', '.join(clients))
+                                  for nodeid, clients
+                                  in sorted(pending.items()))))
+        unknown = sorted(set(nodeids) - set(members))
+        if unknown:
+            raise ValueError('Not in the grace db: {}'.format(
+                ', '.join(unknown)))
+        if nodeids:
+            subprocess.check_call(self._grace_cmd('lift', *nodeids))
+        return nodeids
+
+    def leave_grace_db(self):
+        """Remove this unit from the rados_cluster grace db."""
+        try:
+            members = self.grace_status()['members']
+        except subprocess.CalledProcessError:
+            return
+        if self.ganesha_nodeid in members:
+            subprocess.check_call(
+                self._grace_cmd('remove', self.ganesha_nodeid))
+
+    def _admin_cmd(self, *args):
+        app = ch_core.hookenv.application_name()
+        cmd = [SYSTEM_PYTHON,
+               os.path.join(ch_core.hookenv.charm_dir(), GANESHA_ADMIN),
+               '--pool', app, '--userid', app,
+               '--recovery-pool', self.recovery_pool]
+        if self.recovery_namespace:
+            cmd += ['--recovery-namespace', self.recovery_namespace]
+        for backend in self.share_backends:
+            cmd += ['--index', backend['export_index']]
+        return cmd + list(args)
+
+    def _admin(self, *args):
+        """Run ganesha_admin and return its decoded JSON output."""
+        return json.loads(subprocess.check_output(self._admin_cmd(*args),
+                                                  universal_newlines=True))
+
+    def _require_ganesha_running(self):
+        if not ch_core.host.service_running('nfs-ganesha'):
+            raise RuntimeError(
+                'nfs-ganesha is not running on this unit, it is a standby. '
+                'Run the action on the unit holding the VIP.')
+
+    def nfs_stats(self, window=10, top=5, sort_by='ops'):
+        """Sample the Ganesha I/O counters of this unit.
+
+        :param window: seconds between the two samples
+        :type window: int
+        :param top: number of exports and clients to return
+        :type top: int
+        :param sort_by: one of 'ops', 'bytes' or 'latency'
+        :type sort_by: str
+        :returns: the busiest exports, with their manila share id, and
+                  clients, each with ops_per_sec, bytes_per_sec and
+                  mean_latency_ms.
+        :rtype: Dict
+        :raises: RuntimeError on a standby unit.
+        """
+        self._require_ganesha_running()
+        return self._admin('stats', '--window', str(window),
+                           '--top', str(top), '--sort-by', sort_by)
+
+    def _admin_client_args(self):
+        args = ['--lease-lifetime', str(self.lease_lifetime)]
+        if self.recovery_backend not in RADOS_RECOVERY_BACKENDS:
+            args.append('--no-recovery-db')
+        elif self.active_active:
+            # rados_ng names its objects after the hostname of the unit that
+            # held the VIP, so only rados_cluster objects can be filtered.
+            args += ['--nodeid', self.ganesha_nodeid]
+        return args
+
+    @property
+    def lease_lifetime(self):
+        """Return the NFSv4 lease lifetime Ganesha runs with, in seconds."""
+        return dict(self.ganesha_nfsv4_params).get(
+            'Lease_Lifetime', GANESHA_DEFAULT_LEASE_LIFETIME)
+
+    def nfs_clients(self):
+        """List the NFS clients of this unit.
+
+        Clients are merged from the Ganesha client list and the NFSv4
+        recovery db records of this unit's node. A client is expired when it
+        holds recovery records but Ganesha has not heard from it for longer
+        than a lease; such clients hold the grace period open after a
+        restart or failover until it times out.
+
+        :returns: whether Ganesha could be reached and the clients, each with
+                  its protocols, idle time, recovery records and expiry.
+        :rtype: Dict
+        """
+        return self._admin('clients', *self._admin_client_args())
+
+    def evict_nfs_clients(self, clients, expired=False):
+        """Drop the recovery records and Ganesha entries of clients.
+
+        :param clients: addresses of the clients to evict
+        :type clients: List[str]
+        :param expired: also evict every expired client, see nfs_clients()
+        :type expired: bool
+        :returns: the evicted clients with the number of records removed.
+        :rtype: List[Dict]
+        :raises: RuntimeError when evicting expired clients on a standby,
+                 where live clients cannot be told apart.
+        """
+        if expired:
+            self._require_ganesha_running()
+        return self._admin('evict', *(self._admin_client_args() +
+                                      (['--expired'] if expired else []) +
+                                      list(clients)))['evicted']
+
+    def export_index_report(self, compact=False):
+        """Inspect, and optionally compact, the RADOS export index.
+
+        Ganesha reads the index and every export object it lists one by one
+        when it starts, so duplicate and dangling entries slow down startup
+        and failover.
+
+        :param compact: rewrite the index without duplicate and dangling
+                        entries
+        :type compact: bool
+        :returns: the number of entries and exports, the duplicate, dangling
+                  and other pool entries, and the size of the index and of
+                  the export objects; with compact, the number of entries
+                  removed and whether the index was rewritten.
+        :rtype: Dict
+        """
+        return self._admin('index', *(['--compact'] if compact else []))
+
+    def publish_export_address(self):
+        """Share the NFS access addresses of this unit with its peers."""
+        address = ' '.join(self.unit_access_ips)
+        for rid in relation_ids('cluster'):
+            ch_core.hookenv.relation_set(
+                relation_id=rid,
+                relation_settings={EXPORT_ADDRESS_KEY: address})
+
+    @property
+    def export_ips(self):
+        """Return the addresses manila hands out as export locations.
+
+        In active/active mode every unit serves NFS, so the export locations
+        list the addresses of each of them. Otherwise they list access_ips,
+        and this list is empty while there is only access_ip.
+        """
+        if not self.active_active:
+            if not self.multiple_access_ips:
+                return []
+            addresses = self.access_ips
+            return addresses if len(addresses) > 1 else []
+        addresses = set(self.unit_access_ips)
+        for rid in relation_ids('cluster'):
+            for unit in related_units(rid):
+                address = relation_get(EXPORT_ADDRESS_KEY, unit=unit, rid=rid)
+                if address:
+                    addresses.update(address.split())
+        return sorted(addresses)
+
+    @property
+    def cache_profile(self):
+        """Return the CACHE_PROFILES entry selected by cache-profile.
+
+        Unknown profiles fall back to 'coherent', the safe choice for data
+        shared between writers.
+        """
+        profile = config().get('cache-profile') or 'coherent'
+        return CACHE_PROFILES.get(profile, CACHE_PROFILES['coherent'])
+
+    @property
+    def attr_expiration_time(self):
+        """Return the attribute expiry of exports, in seconds.
+
+        export-attr-expiration-time takes precedence over the cache-profile.
+        """
+        expiry = config().get('export-attr-expiration-time')
+        minimum, maximum = ATTR_EXPIRATION_TIME_RANGE
+        if expiry is None or not minimum <= expiry <= maximum:
+            return self.cache_profile['attr_expiration_time']
+        return expiry
+
+    @property
+    def export_delegations(self):
+        """Return the delegations granted on exports, 'none' or 'R'.
+
+        Delegations are never granted in active/active mode as they are not
+        safe when several Ganesha heads serve the same files.
+        """
+        delegations = config().get('export-delegations') or 'none'
+        if delegations not in EXPORT_DELEGATIONS or self.active_active:
+            return 'none'
+        return delegations
+
+    @property
+    def export_defaults(self):
+        """Return the settings applied to every export.
+
+        Manila only sets the per share options (path, clients, access type
+        and squashing) in the EXPORT blocks it writes to RADOS; everything
+        else comes from EXPORT_DEFAULTS, so changing these needs neither a
+        per share edit nor a new export.
+        """
+        defaults = [
+            # Only NFSv4 over TCP is served, see NFS_CORE_PARAM.
+            ('Protocols', 4),
+            ('Transports', 'TCP'),
+            ('Attr_Expiration_Time', self.attr_expiration_time),
+        ]
+        if self.export_delegations != 'none':
+            defaults.append(('Delegations', self.export_delegations))
+        return defaults
+
+    def _validate_export_defaults(self):
+        errors = []
+        expiry = config().get('export-attr-expiration-time')
+        minimum, maximum = ATTR_EXPIRATION_TIME_RANGE
+        if expiry is not None and not minimum <= expiry <= maximum:
+            errors.append('export-attr-expiration-time must be between {} '
+                          'and {}'.format(minimum, maximum))
+        delegations = config().get('export-delegations') or 'none'
+        if delegations not in EXPORT_DELEGATIONS:
+            errors.append('export-delegations must be one of {}'.format(
+                ', '.join(EXPORT_DELEGATIONS)))
+        elif delegations != 'none' and self.active_active:
+            errors.append('export-delegations is not supported with '
+                          'ganesha-active-active')
+        return errors
+
+    def _validate_cache_profile(self):
+        profile = config().get('cache-profile') or 'coherent'
+        if profile not in CACHE_PROFILES:
+            return ['cache-profile must be one of {}'.format(
+                ', '.join(sorted(CACHE_PROFILES)))]
+        return []
+
+    @property
+    def export_index_url(self):
+        return 'rados://{}/{}'.format(ch_core.hookenv.application_name(),
+                                      GANESHA_EXPORT_INDEX)
+
+    @property
+    def export_index_urls(self):
+        """Return the urls of the export indexes of the share backends."""
+        app = ch_core.hookenv.application_name()
+        return ['rados://{}/{}'.format(app, backend['export_index'])
+                for backend in self.share_backends]
+
+    @property
+    def watch_url(self):
+        """Return the url of the object Ganesha watches for export changes.
+
+        None when ganesha-watch-exports is off or when nfs-ganesha is too old
+        to support watch_url, in which case exports are only picked up when
+        manila signals the local daemon or Ganesha restarts.
+        """
+        if not config().get('ganesha-watch-exports'):
+            return None
+        if not self.ganesha_version_at_least(GANESHA_WATCH_URL_SINCE):
+            return None
+        return self.export_index_url
+
+    @property
+    def watched_export_indexes(self):
+        """Return the export indexes followed by the export watcher.
+
+        Ganesha only watches the index of the first backend. In active/active
+        mode the other heads would miss the exports of the other backends
+        until they restart, so every unit runs the export watcher, which
+        reloads the local Ganesha when one of their indexes is notified.
+        """
+        if not (self.active_active and self.watch_url):
+            return []
+        return [backend['export_index'] for backend in self.share_backends
+                if backend['export_index'] != GANESHA_EXPORT_INDEX]
+
+    def configure_export_watcher(self):
+        """Run the export watcher while there are indexes to follow.
+
+        :returns: True if the watcher was installed or changed.
+        :rtype: bool
+        """
+        indexes = self.watched_export_indexes
+        if not indexes:
+            remove_export_watcher()
+            return False
+        return install_export_watcher(ch_core.hookenv.application_name(),
+                                      self.ganesha_client_name, indexes)
+
+    @property
+    def shared_config(self):
+        """Whether the core Ganesha config is shared through RADOS."""
+        return bool(config().get('ganesha-shared-config'))
+
+    @property
+    def ganesha_config_url(self):
+        """Return the url ganesha.conf includes the core config from.
+
+        None when the core config is rendered into ganesha.conf, which is
+        also the case until the leader has published the object.
+        """
+        if not (self.shared_config and leader_get(GANESHA_CONFIG_HASH_KEY)):
+            return None
+        return 'rados://{}/{}'.format(ch_core.hookenv.application_name(),
+                                      GANESHA_CONFIG_OBJECT)
+
+    def render_ganesha_core(self):
+        """Render the blocks of ganesha.conf that are the same on every unit.
+
+        :rtype: str
+        """
+        adapters_instance = self.adapters_class([], charm_instance=self)
+        loader = os_templating.get_loader('templates/', self.release)
+        return ch_templating.render(
+            source=GANESHA_CORE_TEMPLATE,
+            target=None,
+            context=adapters_instance,
+            template_loader=loader)
+
+    def publish_ganesha_config(self):
+        """Write the core config to the charm's pool, on the leader.
+
+        The object is only written when its content changed. When Ganesha
+        watches the export index, the index is notified so that every
+        running Ganesha re-reads its configuration; the blocks that need a
+        restart are applied by apply_ganesha_config() on each unit.
+
+        :returns: True if a new config was published.
+        :rtype: bool
+        """
+        if not (self.shared_config and is_leader()):
+            return False
+        content = self.render_ganesha_core()
+        digest = self._content_hash(content.encode())
+        if leader_get(GANESHA_CONFIG_HASH_KEY) == digest:
+            return False
+        app = ch_core.hookenv.application_name()
+        rados = ['rados', '-p', app, '--id', app]
+        try:
+            with tempfile.NamedTemporaryFile() as f:
+                f.write(content.encode())
+                f.flush()
+                subprocess.check_call(
+                    rados + ['put', GANESHA_CONFIG_OBJECT, f.name])
+            if self.watch_url:
+                subprocess.check_call(
+                    rados + ['notify', GANESHA_EXPORT_INDEX,
+                             GANESHA_CONFIG_OBJECT])
+        except subprocess.CalledProcessError as e:
+            log('Failed to publish the Ganesha config: {}'.format(e),
+                level=ERROR)
+            return False
+        leader_set({
+            GANESHA_CONFIG_HASH_KEY: digest,
+            GANESHA_CONFIG_FIXED_HASH_KEY: self._content_hash(json.dumps(
+                ganesha_conf_fixed_blocks(content)).encode()),
+        })
+        return True
+
+    def apply_ganesha_config(self):
+        """Restart or reload Ganesha when the leader published a new config.
+
+        :returns: the digests of the config now applied, None when the core
+                  config is not shared.
+        :rtype: Optional[List[str]]
+        """
+        if not self.ganesha_config_url:
+            return None
+        published = [leader_get(GANESHA_CONFIG_HASH_KEY),
+                     leader_get(GANESHA_CONFIG_FIXED_HASH_KEY)]
+        applied = unitdata.kv().get(GANESHA_CONFIG_APPLIED_KEY)
+        if applied == published:
+            return published
+        unitdata.kv().set(GANESHA_CONFIG_APPLIED_KEY, published)
+        if applied is None:
+            # Switching ganesha.conf to the %url already restarts Ganesha.
+            return published
+        if applied[1] != published[1]:
+            self.queue_restarts(['nfs-ganesha'])
+        elif not self.watch_url:
+            self.queue_reloads(['nfs-ganesha'])
+        return published
+
+    def _validate_share_backends(self):
+        """Parse the share-backends option.
+
+        :returns: the backend settings, keyed as in the option, and the
+                  errors found.
+        :rtype: Tuple[List[Dict], List[str]]
+        """
+        value = config().get('share-backends')
+        if not value:
+            return [{'name': DEFAULT_SHARE_BACKEND}], []
+        try:
+            backends = yaml.safe_load(value)
+        except yaml.YAMLError:
+            return [], ['share-backends must be a YAML list']
+        if not isinstance(backends, list) or not backends:
+            return [], ['share-backends must be a YAML list']
+        errors = []
+        names = []
+        for backend in backends:
+            if not isinstance(backend, dict):
+                errors.append('share-backends entries must be mappings')
+                continue
+            unknown = sorted(set(backend) - set(SHARE_BACKEND_KEYS))
+            if unknown:
+                errors.append('unknown share-backends keys: {}'.format(
+                    ', '.join(map(str, unknown))))
+            name = str(backend.get('name') or '')
+            if not SHARE_BACKEND_NAME_RE.match(name):
+                errors.append('share-backends names must be made of '
+                              'letters, digits, _ and -')
+            elif name in names:
+                errors.append('share backend {} is listed twice'.format(name))
+            names.append(name)
+            if backend.get('vip') is not None:
+                try:
+                    ipaddress.ip_address(str(backend['vip']))
+                except ValueError:
+                    errors.append('share backend {} vip is not an IP '
+                                  'address'.format(name))
+        if len(backends) > MAX_SHARE_BACKENDS:
+            errors.append('at most {} share-backends are supported'.format(
+                MAX_SHARE_BACKENDS))
+        vips = [str(backend['vip']) for backend in backends
+                if isinstance(backend, dict) and backend.get('vip')]
+        if vips:
+            if not self.active_active:
+                errors.append('share-backends with a vip require '
+                              'ganesha-active-active')
+            if len(vips) == len(backends):
+                errors.append('at least one share backend must be without '
+                              'a vip, to follow the vip option')
+            if (len(set(vips)) != len(vips) or
+                    set(vips) & set((config().get('vip') or '').split())):
+                errors.append('share-backends vips must be unique')
+        if errors:
+            return [], errors
+        return backends, []
+
+    @property
+    def share_backend_slots(self):
+        """Return the slot of each backend, see assign_share_backend_slots.
+
+        Until the leader assigned them, the first backend uses slot 0.
+        """
+        slots = json.loads(leader_get(SHARE_BACKEND_SLOTS_KEY) or '{}')
+        if not slots:
+            backends, _ = self._validate_share_backends()
+            slots = {str(backends[0]['name']) if backends
+                     else DEFAULT_SHARE_BACKEND: 0}
+        return slots
+
+    @property
+    def share_backends(self):
+        """Return the manila share backends to render in manila.conf.
+
+        Only backends with a slot, whose RADOS objects exist, are listed.
+        While share-backends is invalid the configured backends are kept.
+
+        :returns: the settings of each backend section.
+        :rtype: List[Dict]
+        """
+        backends, errors = self._validate_share_backends()
+        slots = self.share_backend_slots
+        if errors:
+            backends = [{'name': name}
+                        for name, _ in sorted(slots.items(),
+                                              key=lambda item: item[1])]
+        several = len(backends) > 1
+        result = []
+        for backend in backends:
+            name = str(backend['name'])
+            slot = slots.get(name)
+            if slot is None:
+                continue
+            index, counter = self.share_backend_objects(name, slot)
+            result.append({
+                'name': name,
+                'share_backend_name': backend.get('share-backend-name',
+                                                  name.upper()),
+                'export_index': index,
+                'export_counter': counter,
+                'filesystem': backend.get('filesystem'),
+                'reserved_share_percentage': backend.get(
+                    'reserved-share-percentage'),
+                'max_over_subscription_ratio': backend.get(
+                    'max-over-subscription-ratio'),
+                'filter_function': backend.get('filter-function'),
+                'goodness_function': backend.get(
+                    'goodness-function',
+                    DEFAULT_GOODNESS_FUNCTION if several else None),
+                'vip': backend.get('vip'),
+            })
+        return result
+
+    @property
+    def share_endpoints(self):
+        """Return the share backends with their own VIP.
+
+        Each of them is served by its own manila-share service, which
+        Pacemaker runs with the VIP of the backend. Ganesha runs on every
+        unit in active/active mode, so each VIP is served by the unit it is
+        placed on.
+        """
+        return [backend for backend in self.share_backends if backend['vip']]
+
+    @property
+    def endpoint_services(self):
+        return [endpoint_service(backend['name'])
+                for backend in self.share_endpoints]
+
+    def configure_share_endpoints(self):
+        """Install the manila-share services of the share endpoints.
+
+        Services of removed endpoints are stopped and removed. Without
+        peers no Pacemaker resources exist, and the services are started
+        here.
+
+        :returns: whether the endpoints differ from those last given to
+                  Pacemaker by configure_share_endpoint_resources.
+        :rtype: bool
+        """
+        wanted = {backend['name']: backend['vip']
+                  for backend in self.share_endpoints}
+        for name in installed_endpoints():
+            if name not in wanted:
+                remove_endpoint(name)
+        for name in wanted:
+            if install_endpoint(name, MANILA_CONF):
+                self.queue_restarts([endpoint_service(name)])
+            if not peer_units():
+                ch_core.host.service_resume(endpoint_service(name))
+        configured = unitdata.kv().get(SHARE_ENDPOINT_RESOURCES_KEY, {})
+        return wanted != {name: resources[0]
+                          for name, resources in configured.items()}
+
+    @staticmethod
+    def _systemd_resource(service):
+        """Return the Pacemaker resource add_systemd_service creates."""
+        return 'res_{0}_{0}'.format(service.replace('-', '_'))
+
+    @staticmethod
+    def _endpoint_vip_name(name):
+        return 'ganesha_{}'.format(name.replace('-', '_'))
+
+    def configure_share_endpoint_resources(self, hacluster):
+        """Add a VIP group and a manila-share resource for each endpoint.
+
+        Negative colocations between the VIP groups make Pacemaker place
+        them on different units while there are enough units, so that the
+        NFS traffic of the backends is spread over the cluster. Resources
+        of the endpoints removed since the last call are deleted.
+        """
+        groups = ['grp_ganesha_vips']
+        configured = {}
+        for backend in self.share_endpoints:
+            service = endpoint_service(backend['name'])
+            vip_name = self._endpoint_vip_name(backend['name'])
+            iface, netmask, _ = os_ha_utils.get_vip_settings(backend['vip'])
+            hacluster.add_vip(vip_name, backend['vip'], iface, netmask)
+            hacluster.add_systemd_service(service, service, clone=False)
+            group = 'grp_{}_vips'.format(vip_name)
+            hacluster.add_colocation(
+                '{}_with_vip'.format(service.replace('-', '_')), 'inf',
+                (self._systemd_resource(service), group))
+            for other in groups:
+                hacluster.add_colocation(
+                    '{}_apart_from_{}'.format(group, other),
+                    SHARE_ENDPOINT_SPREAD_SCORE, (group, other))
+            groups.append(group)
+            configured[backend['name']] = [backend['vip'], iface, groups[:-1]]
+        previous = unitdata.kv().get(SHARE_ENDPOINT_RESOURCES_KEY, {})
+        for name, (vip, iface, others) in previous.items():
+            if name in configured:
+                continue
+            service = endpoint_service(name)
+            vip_name = self._endpoint_vip_name(name)
+            group = 'grp_{}_vips'.format(vip_name)
+            hacluster.remove_colocation(
+                '{}_with_vip'.format(service.replace('-', '_')))
+            for other in others:
+                hacluster.remove_colocation(
+                    '{}_apart_from_{}'.format(group, other))
+            hacluster.remove_systemd_service(service, service)
+            hacluster.remove_vip(vip_name, vip, iface)
+        unitdata.kv().set(SHARE_ENDPOINT_RESOURCES_KEY, configured)
+
+    @staticmethod
+    def share_backend_objects(name, slot):
+        """Return the export index and counter of a backend in a slot."""
+        if slot == 0:
+            return GANESHA_EXPORT_INDEX, GANESHA_EXPORT_COUNTER
+        return ('{}-{}'.format(GANESHA_EXPORT_INDEX, name),
+                '{}-{}'.format(GANESHA_EXPORT_COUNTER, name))
+
+    @staticmethod
+    def _rados_read(rados, obj):
+        """Return the content of a RADOS object, None if it does not exist."""
+        if subprocess.call(rados + ['stat', obj],
+                           stdout=subprocess.DEVNULL,
+                           stderr=subprocess.DEVNULL) != 0:
+            return None
+        return subprocess.check_output(rados + ['get', obj, '-']).decode()
+
+    @staticmethod
+    def _rados_write(rados, obj, content):
+        with tempfile.NamedTemporaryFile() as f:
+            f.write(content.encode())
+            f.flush()
+            subprocess.check_call(rados + ['put', obj, f.name])
+
+    @staticmethod
+    def _counter_slot(value):
+        """Return the slot whose export ids a counter value is in."""
+        return int(value.strip() or 0) // GANESHA_EXPORT_ID_RANGE
+
+    def _new_share_backend_slot(self, rados, name, taken):
+        """Give a new backend a slot other than 0 and set up its objects.
+
+        A backend added back keeps the slot its counter is in, so that its
+        exports keep ids of their own. When that slot is taken, its counter
+        is only moved to another slot if its index lists no export.
+
+        :returns: the slot, or None, and the problem that prevented it.
+        :rtype: Tuple[Optional[int], Optional[str]]
+        """
+        index, counter = self.share_backend_objects(name, None)
+        free = sorted(set(range(1, MAX_SHARE_BACKENDS)) - set(taken))
+        value = self._rados_read(rados, counter)
+        exports = self._rados_read(rados, index)
+        if value is not None:
+            try:
+                previous = self._counter_slot(value)
+            except ValueError:
+                return None, ('the export counter of share backend {} is '
+                              'not a number'.format(name))
+            if previous in free:
+                free = [previous]
+            elif exports and exports.strip():
+                return None, ('share backend {} has exports with the ids of '
+                              'slot {}, which is taken'.format(name,
+                                                               previous))
+            else:
+                value = None
+        if not free:
+            return None, 'no slot is left for share backend {}'.format(name)
+        slot = free[0]
+        if exports is None:
+            self._rados_write(rados, index, '')
+        if value is None:
+            self._rados_write(rados, counter,
+                              str(slot * GANESHA_EXPORT_ID_RANGE))
+        return slot, None
+
+    def assign_share_backend_slots(self):
+        """Give each new backend a slot and create its RADOS objects.
+
+        Run on the leader. Slot 0, whose objects are those of the single
+        cephfsnfs1 backend, stays with the first backend that got it, even
+        once removed. The export index of a new backend is created empty and
+        its counter starts at the first export id of its slot. Slots of
+        removed backends are freed. A backend is refused a slot, and the
+        counters that left the range of their slot are reported, in
+        share_backend_problems, as manila would then hand out the export ids
+        of another backend.
+
+        :returns: the new slots.
+        :rtype: Dict[str, int]
+        """
+        backends, errors = self._validate_share_backends()
+        if errors or not is_leader():
+            return None
+        current = json.loads(leader_get(SHARE_BACKEND_SLOTS_KEY) or '{}')
+        zero = leader_get(SHARE_BACKEND_SLOT0_KEY) or next(
+            (name for name, slot in current.items() if slot == 0), None)
+        names = [str(backend['name']) for backend in backends]
+        slots = {name: slot for name, slot in current.items()
+                 if name in names}
+        app = ch_core.hookenv.application_name()
+        rados = ['rados', '-p', app, '--id', app]
+        problems = []
+        for name in names:
+            if name in slots:
+                continue
+            if zero in (None, name):
+                slot, zero = 0, name
+            else:
+                slot, problem = self._new_share_backend_slot(
+                    rados, name, slots.values())
+                if slot is None:
+                    problems.append(problem)
+                    continue
+            slots[name] = slot
+        for name, slot in sorted(slots.items(), key=lambda item: item[1]):
+            _, counter = self.share_backend_objects(name, slot)
+            value = self._rados_read(rados, counter)
+            try:
+                if value is None or self._counter_slot(value) == slot:
+                    continue
+            except ValueError:
+                pass
+            problems.append('the export counter of share backend {} is out '
+                            'of the ids of its slot'.format(name))
+        settings = {}
+        if slots != current:
+            settings[SHARE_BACKEND_SLOTS_KEY] = json.dumps(slots,
+                                                           sort_keys=True)
+        if zero and leader_get(SHARE_BACKEND_SLOT0_KEY) != zero:
+            settings[SHARE_BACKEND_SLOT0_KEY] = zero
+        if problems != self.share_backend_problems:
+            settings[SHARE_BACKEND_PROBLEMS_KEY] = json.dumps(problems)
+        if settings:
+            leader_set(settings)
+        return slots
+
+    @property
+    def share_backend_problems(self):
+        """Return the problems found by assign_share_backend_slots."""
+        return json.loads(leader_get(SHARE_BACKEND_PROBLEMS_KEY) or '[]')
+
+    def _validate_active_active(self):
+        if (self.active_active and
+                not self.ganesha_version_at_least(
+                    GANESHA_ACTIVE_ACTIVE_SINCE)):
+            return ['ganesha-active-active requires nfs-ganesha {} or later'
+                    .format(GANESHA_ACTIVE_ACTIVE_SINCE)]
+        return []
+
+    @staticmethod
+    def ganesha_version_at_least(version):
+        """Check whether the installed nfs-ganesha is at least version.
+
+        :param version: the upstream version to compare with, e.g. '2.7'
+        :type version: str
+        :returns: False if nfs-ganesha-ceph is older or not installed.
+        :rtype: bool
+        """
+        try:
+            return cmp_pkgrevno(GANESHA_PACKAGE, version) >= 0
+        except (AttributeError, KeyError):
+            # get_installed_version() returns None until the package is
+            # installed.
+            return False
+
+    @staticmethod
+    def default_worker_threads():
+        """Size the Ganesha worker pool from the number of CPU cores."""
+        cpus = os.cpu_count() or 1
+        return min(max(GANESHA_WORKER_THREADS_MIN,
+                       GANESHA_WORKER_THREADS_PER_CPU * cpus),
+                   GANESHA_WORKER_THREADS_MAX)
+
+    def _validate_ganesha_core_params(self):
+        """Validate the NFS_CORE_PARAM tunables against nfs-ganesha.
+
+        :returns: the (name, value) pairs to render and a list of errors for
+                  the options that were rejected.
+        :rtype: Tuple[List[Tuple[str, int]], List[str]]
+        """
+        params = []
+        errors = []
+        options = config()
+        if self.ganesha_version_at_least(GANESHA_WORKER_PARAM_SINCE):
+            worker_param = GANESHA_WORKER_PARAM
+        else:
+            worker_param = GANESHA_LEGACY_WORKER_PARAM
+        workers = options.get('ganesha-worker-threads') or 0
+        if workers < 0 or workers > GANESHA_WORKER_THREADS_MAX:
+            errors.append('ganesha-worker-threads must be between 0 and {}'
+                          .format(GANESHA_WORKER_THREADS_MAX))
+            workers = 0
+        params.append((worker_param,
+                       workers or self.default_worker_threads()))
+        table_params, table_errors = self._validate_ganesha_params(
+            GANESHA_CORE_PARAMS)
+        return params + table_params, errors + table_errors
+
+    def _validate_ceph_client_options(self):
+        """Merge ceph-client-options over the ceph-client-profile defaults.
+
+        :returns: the (name, value) pairs to render, the profile defaults
+                  alone when the options are invalid, and the errors found.
+        :rtype: Tuple[List[Tuple[str, str]], List[str]]
+        """
+        profile = config().get('ceph-client-profile') or 'default'
+        if profile not in CEPH_CLIENT_PROFILES:
+            return [], ['ceph-client-profile must be one of {}'.format(
+                ', '.join(sorted(CEPH_CLIENT_PROFILES)))]
+        defaults = CEPH_CLIENT_PROFILES[profile]
+        value = config().get('ceph-client-options')
+        try:
+            overrides = yaml.safe_load(value) if value else {}
+        except yaml.YAMLError:
+            overrides = None
+        if not isinstance(overrides, dict):
+            return (self._format_ceph_client_options(defaults),
+                    ['ceph-client-options must be a YAML mapping'])
+        errors = []
+        for name, value in sorted(overrides.items(),
+                                  key=lambda item: str(item[0])):
+            option = CEPH_CLIENT_OPTIONS.get(name)
+            if option is None:
+                errors.append('unknown ceph-client-options key {}'.format(
+                    name))
+            elif option.type is bool:
+                if not isinstance(value, bool):
+                    errors.append('ceph-client-options {} must be true or '
+                                  'false'.format(name))
+            elif (isinstance(value, bool) or
+                    not isinstance(value, (int, option.type)) or
+                    not option.minimum <= value <= option.maximum):
+                errors.append('ceph-client-options {} must be between {} '
+                              'and {}'.format(name, option.minimum,
+                                              option.maximum))
+        if errors:
+            return self._format_ceph_client_options(defaults), errors
+        options = dict(defaults, **overrides)
+        limits = dict(CEPH_CLIENT_OC_DEFAULTS, **options)
+        if not (limits['client_oc_target_dirty'] <=
+                limits['client_oc_max_dirty'] <= limits['client_oc_size']):
+            return self._format_ceph_client_options(defaults), [
+                'ceph-client-options must keep client_oc_target_dirty <= '
+                'client_oc_max_dirty <= client_oc_size']
+        return self._format_ceph_client_options(options), []
+
+    @staticmethod
+    def _format_ceph_client_options(options):
+        return [(name, str(value).lower() if isinstance(value, bool)
+                 else str(value))
+                for name, value in sorted(options.items())]
+
+    @property
+    def ceph_client_options(self):
+        """Return the libcephfs options rendered into ceph.conf.
+
+        They tune the CephFS client of Ganesha and manila-share; invalid
+        options are left out in favour of the profile defaults.
+        """
+        options, errors = self._validate_ceph_client_options()
+        for error in errors:
+            log('Ignoring invalid ceph client option: {}'.format(error),
+                level=ERROR)
+        return options
+
+    def _validate_ganesha_params(self, table):
+        """Validate the options of a table of GaneshaParam entries.
+
+        :param table: the parameters to validate
+        :type table: List[GaneshaParam]
+        :returns: the (name, value) pairs to render and a list of errors for
+                  the options that were rejected.
+        :rtype: Tuple[List[Tuple[str, int]], List[str]]
+        """
+        params = []
+        errors = []
+        options = config()
+        for param in table:
+            value = options.get(param.option) or 0
+            if not value:
+                continue
+            if not param.minimum <= value <= param.maximum:
+                errors.append('{} must be between {} and {}'.format(
+                    param.option, param.minimum, param.maximum))
+            elif not self.ganesha_version_at_least(param.since):
+                errors.append('{} requires nfs-ganesha {} or later'.format(
+                    param.option, param.since))
+            else:
+                params.append((param.name, value))
+        return params, errors
+
+    def _validate_ganesha_nfsv4_params(self):
+        """Validate the NFSv4 lease and grace tunables.
+
+        Clients only renew their lease every Lease_Lifetime seconds, so a
+        grace period shorter than the lease would end before every client had
+        a chance to reclaim its state.
+        """
+        params, errors = self._validate_ganesha_params(GANESHA_NFSV4_PARAMS)
+        values = dict(params)
+        lease = values.get('Lease_Lifetime', GANESHA_DEFAULT_LEASE_LIFETIME)
+        grace = values.get('Grace_Period', GANESHA_DEFAULT_GRACE_PERIOD)
+        if grace < lease:
+            errors.append('the grace period ({}s) must not be shorter than '
+                          'the lease lifetime ({}s)'.format(grace, lease))
+            params = []
+        return params, errors
+
+    @property
+    def ganesha_nfsv4_params(self):
+        """Return the NFSv4 lease and grace tunables safe to render."""
+        params, errors = self._validate_ganesha_nfsv4_params()
+        for error in errors:
+            log('Ignoring invalid Ganesha option: {}'.format(error),
+                level=ERROR)
+        return params
+
+    @property
+    def ganesha_core_params(self):
+        """Return the NFS_CORE_PARAM tunables that are safe to render.
+
+        Values rejected by validation are left out so that Ganesha falls back
+        to its own defaults rather than refusing to start.
+        """
+        params, errors = self._validate_ganesha_core_params()
+        for error in errors:
+            log('Ignoring invalid Ganesha option: {}'.format(error),
+                level=ERROR)
+        return params
+
+    def custom_assess_status_last_check(self):
+        """Report the services whose restart has been deferred."""
+        deferred = self.deferred_restarts
+        if deferred:
+            return ('active',
+                    'Unit is ready. Services queued for restart: {}'.format(
+                        ', '.join(deferred)))
+        return None, None
+
+    def custom_assess_status_check(self):
+        """Block the unit while the Ganesha configuration is invalid."""
+        _, errors = self._validate_ganesha_core_params()
+        errors += self._validate_ganesha_nfsv4_params()[1]
+        errors += self._validate_active_active()
+        errors += self._validate_cache_profile()
+        errors += self._validate_export_defaults()
+        errors += self._validate_nrpe_latency()
+        errors += self._validate_share_backends()[1]
+        errors += self._validate_ceph_client_options()[1]
+        errors += self._validate_ceph_pools()
+        if errors:
+            return 'blocked', 'Invalid config: {}'.format('; '.join(errors))
+        problems = self.share_backend_problems
+        if problems:
+            return 'blocked', 'Share backends: {}'.format('; '.join(problems))
+        return None, None
+
     def enable_memcache(self, *args, **kwargs):
         return False
 
@@ -452,14 +2422,76 @@ class ManilaGaneshaCharm(charms_openstack.charm.HAOpenStackCharm,
                 username=self.options.database_user, )
         ]
 
-    def request_ceph_permissions(self, ceph):
-        rq = ceph.get_current_request() or CephBrokerRq()
-        log("Requesting ceph permissions for client: {}".format(
-            ch_core.hookenv.application_name()), level=ch_core.hookenv.INFO)
+    @property
+    def ceph_pools(self):
+        """Return the pools to request from ceph-mon.
+
+        The application pool holds the export indexes and exports, and the
+        recovery db unless recovery-pool names a separate pool.
+
+        :returns: keyword arguments of add_op_create_replicated_pool
+        :rtype: list of dict
+        """
+        app = ch_core.hookenv.application_name()
+        replicas = (config().get('ceph-pool-replicas') or
+                    DEFAULT_CEPH_POOL_REPLICAS)
+        crush_rule = config().get('ceph-pool-crush-rule') or None
+        app_name = config().get('ceph-pool-app-name') or None
+        pools = [{
+            'name': app,
+            'replica_count': replicas,
+            'weight': config().get('ceph-pool-weight') or None,
+            'crush_profile': crush_rule,
+            'app_name': app_name,
+        }]
+        recovery_pool = self.configured_recovery_location[0]
+        if recovery_pool != app:
+            pools.append({
+                'name': recovery_pool,
+                'replica_count': replicas,
+                'weight': RECOVERY_POOL_WEIGHT,
+                'crush_profile': (config().get('recovery-pool-crush-rule') or
+                                  crush_rule),
+                'app_name': app_name,
+            })
+        return pools
+
+    def _validate_ceph_pools(self):
+        errors = []
+        replicas = config().get('ceph-pool-replicas')
+        if replicas is not None and replicas < 0:
+            errors.append('ceph-pool-replicas must not be negative')
+        weight = config().get('ceph-pool-weight')
+        if weight is not None and not 0 <= weight <= 100:
+            errors.append('ceph-pool-weight must be between 0 and 100')
+        if (config().get('recovery-namespace') and
+                not self.ganesha_version_at_least(
+                    GANESHA_RADOS_NAMESPACE_SINCE)):
+            errors.append('recovery-namespace requires nfs-ganesha {} or '
+                          'later'.format(GANESHA_RADOS_NAMESPACE_SINCE))
+        return errors
+
+    def ceph_broker_request(self):
+        """Return the request for the pools of ceph_pools and the cephx
+        permissions.
+
+        The request is built anew instead of adding to the current one, so
+        that changed settings replace the previous ones. ceph-mon applies
+        most of them only when it creates a pool.
+        """
+        rq = CephBrokerRq()
+        for pool in self.ceph_pools:
+            rq.add_op_create_replicated_pool(**pool)
+        app = ch_core.hookenv.application_name()
+        log("Requesting ceph permissions for client: {}".format(app),
+            level=ch_core.hookenv.INFO)
         rq.add_op({'op': 'set-key-permissions',
                    'permissions': CEPH_CAPABILITIES,
-                   'client': ch_core.hookenv.application_name()})
-        ceph.send_request_if_needed(rq)
+                   'client': app})
+        return rq
+
+    def request_ceph_pools(self, ceph):
+        ceph.send_request_if_needed(self.ceph_broker_request())
 
     def get_client_cert_cn_sans(self):
         """Get the tuple (cn, [sans]) for a client certificiate.
@@ -479,22 +2511,28 @@ class ManilaGaneshaCharm(charms_openstack.charm.HAOpenStackCharm,
     def handle_changed_client_cert_files(self, ca, cert, key):
         """Handle changes to client cert, key or ca.
 
-        If the client certs have changed on disk, rerender and restart manila.
+        If the client certs have changed, rerender manila.conf and restart
+        manila-share and the manila-share services of the share endpoints.
+        nfs-ganesha does not use them and is left running.
 
         The cert and key need to be written to:
 
         - /etc/manila/ssl/cert.crt - MANILA_CLIENT_CERT_FILE
         - /etc/manila/ssl/cert.key - MANILA_CLIENT_KEY_FILE
         - /etc/manila/ssl/ca.cert  - MANILA_CLIENT_CA_FILE
+
+        Each file is compared in memory with what is on disk and only written,
+        atomically, when its content differs.
         """
-        # lives ensrure that the cert dir exists
-        mkdir(MANILA_SSL_DIR)
+        # ensure that the cert dir exists
+        if not os.path.isdir(MANILA_SSL_DIR):
+            mkdir(MANILA_SSL_DIR)
         paths = {
             MANILA_CLIENT_CA_FILE: ca,
             MANILA_CLIENT_CERT_FILE: cert,
             MANILA_CLIENT_KEY_FILE: key,
         }
-        checksums = {path: path_hash(path) for path in paths.keys()}
+        changed = False
         # write or remove the files.
         for path, contents in paths.items():
             if contents is None:
@@ -504,17 +2542,18 @@ class ManilaGaneshaCharm(charms_openstack.charm.HAOpenStackCharm,
                 if path_exists:
                     try:
                         os.remove(path)
+                        changed = True
                     except OSError as e:
                         log("Path {} couldn't be deleted: {}"
                             .format(path, str(e)), level=ERROR)
-            else:
-                write_file(path,
-                           contents.encode(),
-                           owner=self.user,
-                           group=self.group,
-                           perms=0o640)
-        new_checksums = {path: path_hash(path) for path in paths.keys()}
-        if new_checksums != checksums:
+            elif self._read_file(path) != contents.encode():
+                write_file_atomic(path,
+                                  contents.encode(),
+                                  owner=self.user,
+                                  group=self.group,
+                                  perms=0o640)
+                changed = True
+        if changed:
             interfaces = (
                 'ceph.available',
                 'amqp.available',
@@ -531,10 +2570,64 @@ class ManilaGaneshaCharm(charms_openstack.charm.HAOpenStackCharm,
                     # if not available don't attempt to render
                     return
                 endpoints.append(endpoint)
-            self.render_with_interfaces(endpoints)
+            # Only manila.conf refers to the client certs.
+            self.render_with_interfaces(endpoints, configs=[MANILA_CONF])
+            self.queue_restarts(self.restart_map[MANILA_CONF])
 
     def install_nrpe_checks(self, enable_cron=True):
-        return install_nrpe_checks(enable_cron=enable_cron)
+        return install_nrpe_checks(enable_cron=enable_cron,
+                                   collector_args=self.nrpe_collector_args)
+
+    @property
+    def nrpe_collector_args(self):
+        """Return the options of the NRPE collector run from cron."""
+        app = ch_core.hookenv.application_name()
+        args = ['--access-ip', self.access_ip,
+                '--pool', app, '--userid', app,
+                '--recovery-pool', self.recovery_pool]
+        if self.recovery_namespace:
+            args += ['--recovery-namespace', self.recovery_namespace]
+        filesystems = []
+        for backend in self.share_backends:
+            args += ['--export-index', backend['export_index']]
+            # An empty --filesystem stands for the default filesystem.
+            filesystem = backend['filesystem'] or ''
+            if filesystem not in filesystems:
+                filesystems.append(filesystem)
+        for filesystem in filesystems:
+            args += ['--filesystem', filesystem]
+        if not self._validate_nrpe_latency():
+            # Unset options leave the defaults of the collector.
+            for option, arg in (
+                    ('nrpe-nfs-latency-samples', '--latency-samples'),
+                    ('nrpe-nfs-latency-p50', '--latency-p50'),
+                    ('nrpe-nfs-latency-p99', '--latency-p99'),
+                    ('nrpe-ceph-latency', '--ceph-latency')):
+                if config(option) is not None:
+                    args += [arg, str(config(option))]
+        return args
+
+    def _validate_nrpe_latency(self):
+        errors = []
+        samples = config().get('nrpe-nfs-latency-samples')
+        if samples is not None and samples < 1:
+            errors.append('nrpe-nfs-latency-samples must be at least 1')
+        for option in ('nrpe-nfs-latency-p50', 'nrpe-nfs-latency-p99',
+                       'nrpe-ceph-latency'):
+            if config().get(option) is None:
+                continue
+            try:
+                warning, critical = (
+                    float(value)
+                    for value in config().get(option).split(','))
+            except ValueError:
+                errors.append('{} must be "warning,critical" in ms'.format(
+                    option))
+                continue
+            if not 0 < warning <= critical:
+                errors.append('{} warning must be positive and not above '
+                              'critical'.format(option))
+        return errors
 
     def remove_nrpe_checks(self):
         remove_nrpe_checks()
@@ -545,6 +2638,22 @@ class ManilaGaneshaCharm(charms_openstack.charm.HAOpenStackCharm,
     def remove_nrpe_plugins(self):
         remove_nrpe_plugins()
 
+    @property
+    def exporter_port(self):
+        """Return the port the Prometheus exporter listens on."""
+        return config('ganesha-exporter-port')
+
+    @property
+    def exporter_address(self):
+        """Return the address of the prometheus-target binding."""
+        return ch_net_ip.get_relation_ip('prometheus-target')
+
+    def install_exporter(self):
+        return install_exporter(self.exporter_address, self.exporter_port)
+
+    def remove_exporter(self):
+        remove_exporter()
+
 
 class ManilaGaneshaUssuriCharm(ManilaGaneshaCharm,
                                ):
@@ -552,4 +2661,6 @@ class ManilaGaneshaUssuriCharm(ManilaGaneshaCharm,
 
     @property
     def recovery_backend(self):
+        if self.active_active:
+            return 'rados_cluster'
         return 'rados_ng'
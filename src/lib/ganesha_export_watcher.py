@@ -0,0 +1,74 @@
+# Copyright (C) 2026 Canonical
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import subprocess
+from pathlib import Path
+
+import charmhelpers.core.hookenv as hookenv
+import charmhelpers.core.host as host
+
+from lib.host_files import install_file
+
+# Relative path from the root directory
+WATCHER_SCRIPT = "files/ganesha_export_watcher"
+
+WATCHER_SERVICE = "ganesha-export-watcher"
+WATCHER_BIN = Path("/usr/local/bin/ganesha-export-watcher")
+WATCHER_UNIT = Path("/etc/systemd/system/ganesha-export-watcher.service")
+
+UNIT_TEMPLATE = """[Unit]
+Description=Reload NFS-Ganesha when a share backend export index changes
+After=nfs-ganesha.service
+
+[Service]
+ExecStart={bin} --pool {pool} --id {client} {indexes}
+Restart=always
+RestartSec=5
+
+[Install]
+WantedBy=multi-user.target
+"""
+
+
+def install_export_watcher(pool, client, indexes):
+    """Install the export watcher and (re)start it if anything changed.
+
+    :param pool: the pool holding the export indexes
+    :param client: the cephx identity to watch with, without client.
+    :param indexes: the names of the export index objects to watch
+    """
+    script = Path(hookenv.charm_dir(), WATCHER_SCRIPT).read_bytes()
+    unit = UNIT_TEMPLATE.format(
+        bin=WATCHER_BIN, pool=pool, client=client,
+        indexes=" ".join(f"--index {index}" for index in indexes)).encode()
+    changed = install_file(script, WATCHER_BIN, 0o755)
+    changed = install_file(unit, WATCHER_UNIT, 0o644) or changed
+    if changed:
+        subprocess.check_call(["systemctl", "daemon-reload"])
+        host.service_restart(WATCHER_SERVICE)
+    host.service_resume(WATCHER_SERVICE)
+    return changed
+
+
+def remove_export_watcher():
+    """Stop the export watcher and remove its files."""
+    if not WATCHER_UNIT.exists():
+        return
+    host.service_pause(WATCHER_SERVICE)
+    for dst in (WATCHER_UNIT, WATCHER_BIN):
+        if dst.exists():
+            dst.unlink()
+            hookenv.log(f"Export watcher: Successfully removed {dst}.",
+                        hookenv.DEBUG)
+    subprocess.check_call(["systemctl", "daemon-reload"])
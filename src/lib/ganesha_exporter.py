@@ -0,0 +1,71 @@
+# Copyright (C) 2026 Canonical
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import subprocess
+from pathlib import Path
+
+import charmhelpers.core.hookenv as hookenv
+import charmhelpers.core.host as host
+
+from lib.host_files import install_file
+
+# Relative path from the root directory
+EXPORTER_SCRIPT = "files/ganesha_exporter"
+
+EXPORTER_SERVICE = "ganesha-exporter"
+EXPORTER_BIN = Path("/usr/local/bin/ganesha-exporter")
+EXPORTER_UNIT = Path("/etc/systemd/system/ganesha-exporter.service")
+
+UNIT_TEMPLATE = """[Unit]
+Description=Prometheus exporter for NFS-Ganesha statistics
+After=nfs-ganesha.service
+
+[Service]
+ExecStart={bin} --address {address} --port {port}
+Restart=on-failure
+RestartSec=5
+
+[Install]
+WantedBy=multi-user.target
+"""
+
+
+def install_exporter(address, port):
+    """Install the exporter and (re)start it if anything changed.
+
+    The exporter only listens on address, the one prometheus scrapes.
+    """
+    script = Path(hookenv.charm_dir(), EXPORTER_SCRIPT).read_bytes()
+    unit = UNIT_TEMPLATE.format(bin=EXPORTER_BIN, address=address,
+                                port=port).encode()
+    changed = install_file(script, EXPORTER_BIN, 0o755)
+    changed = install_file(unit, EXPORTER_UNIT, 0o644) or changed
+    if changed:
+        subprocess.check_call(["systemctl", "daemon-reload"])
+        host.service_restart(EXPORTER_SERVICE)
+    host.service_resume(EXPORTER_SERVICE)
+    return changed
+
+
+def remove_exporter():
+    """Stop the exporter and remove its files."""
+    if not EXPORTER_UNIT.exists():
+        return
+    host.service_pause(EXPORTER_SERVICE)
+    for dst in (EXPORTER_UNIT, EXPORTER_BIN):
+        if dst.exists():
+            dst.unlink()
+            hookenv.log(f"Exporter: Successfully removed {dst}.",
+                        hookenv.DEBUG)
+    subprocess.check_call(["systemctl", "daemon-reload"])
@@ -0,0 +1,35 @@
+# Copyright (C) 2026 Canonical
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Install the files the charm renders for its extra services."""
+
+import charmhelpers.core.hookenv as hookenv
+import charmhelpers.core.host as host
+
+
+def install_file(content, dst, perms, group="root"):
+    """Write content to dst unless it already holds it.
+
+    :param content: the bytes to write
+    :param dst: the path to write, a pathlib.Path
+    :param perms: the mode of the file
+    :param group: the group owning the file, root owning it
+    :returns: True if the file was written.
+    """
+    if dst.exists() and dst.read_bytes() == content:
+        return False
+    host.write_file(str(dst), content, owner="root", group=group,
+                    perms=perms)
+    hookenv.log(f"Installed {dst}.", hookenv.DEBUG)
+    return True
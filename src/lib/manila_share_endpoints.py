@@ -0,0 +1,103 @@
+# Copyright (C) 2026 Canonical
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""A manila-share instance for each share backend with its own VIP.
+
+Each instance reads manila.conf plus a file that only enables its backend,
+so that Pacemaker can place it, with the VIP of the backend, independently
+of the main manila-share.
+"""
+
+import subprocess
+from pathlib import Path
+
+import charmhelpers.core.hookenv as hookenv
+import charmhelpers.core.host as host
+
+from lib.host_files import install_file
+
+SERVICE = "manila-share-{}"
+UNIT_DIR = Path("/etc/systemd/system")
+CONF_DIR = Path("/etc/manila")
+
+UNIT_TEMPLATE = """[Unit]
+Description=OpenStack Manila Share, {name} share backend
+After=network-online.target
+
+[Service]
+User=manila
+Group=manila
+ExecStart=/usr/bin/manila-share --config-file={manila_conf} \\
+    --config-file={conf} --log-file=/var/log/manila/{service}.log
+Restart=on-failure
+
+[Install]
+WantedBy=multi-user.target
+"""
+
+CONF_TEMPLATE = """[DEFAULT]
+enabled_share_backends = {name}
+"""
+
+
+def endpoint_service(name):
+    """Return the systemd service running the share backend name."""
+    return SERVICE.format(name)
+
+
+def _unit(name):
+    return UNIT_DIR / "{}.service".format(endpoint_service(name))
+
+
+def _conf(name):
+    return CONF_DIR / "{}.conf".format(endpoint_service(name))
+
+
+def installed_endpoints():
+    """Return the names of the share backends with an installed service."""
+    prefix = SERVICE.format("")
+    return sorted(unit.name[len(prefix):-len(".service")]
+                  for unit in UNIT_DIR.glob(SERVICE.format("*.service")))
+
+
+def install_endpoint(name, manila_conf):
+    """Install the service of the share backend name.
+
+    The service is not started, Pacemaker or the charm start it.
+
+    :returns: True if anything changed and a running service must restart.
+    """
+    service = endpoint_service(name)
+    conf = _conf(name)
+    changed = install_file(
+        CONF_TEMPLATE.format(name=name).encode(), conf, 0o640,
+        group="manila")
+    unit = UNIT_TEMPLATE.format(name=name, manila_conf=manila_conf,
+                                conf=conf, service=service).encode()
+    if install_file(unit, _unit(name), 0o644):
+        subprocess.check_call(["systemctl", "daemon-reload"])
+        changed = True
+    return changed
+
+
+def remove_endpoint(name):
+    """Stop the service of the share backend name and remove its files."""
+    unit = _unit(name)
+    if unit.exists():
+        host.service_pause(endpoint_service(name))
+    for dst in (unit, _conf(name)):
+        if dst.exists():
+            dst.unlink()
+            hookenv.log(f"Share endpoints: removed {dst}.", hookenv.DEBUG)
+    subprocess.check_call(["systemctl", "daemon-reload"])
@@ -12,106 +12,173 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import hashlib
+import json
 import os
+import shlex
 import shutil
 from pathlib import Path
 from glob import glob
 
 import charmhelpers.core.hookenv as hookenv
+import charmhelpers.core.unitdata as unitdata
 from charmhelpers.contrib.charmsupport import nrpe
 
 # Relative path from the root directory
 PLUGINS_DIR = "files/plugins"
 
+# The collector runs every check in one process from cron and caches the
+# results, which the NRPE checks only read.
+COLLECTOR_CMD = "/usr/local/lib/nagios/plugins/collect_nfs_checks"
+COLLECTOR_NAME = "nfs_checks"
+COLLECTOR_SCHEDULE = "* * * * *"
+CHECK_CACHED_CMD = "/usr/local/lib/nagios/plugins/check_nfs_cached"
+
 CHECK_SCRIPTS = [
     {
         "shortname": "nfs_conn",
         "description": "NFS server listening check.",
-        "check_cmd": "/usr/local/lib/nagios/plugins/check_nfs_conn",
+        "check_cmd": f"{CHECK_CACHED_CMD} --check nfs_conn",
     },
     {
         "shortname": "nfs_exports",
         "description": "NFS exports check.",
-        "check_cmd": "/usr/local/lib/nagios/plugins/check_nfs_exports",
+        "check_cmd": f"{CHECK_CACHED_CMD} --check nfs_exports",
     },
     {
         "shortname": "nfs_services",
         "description": "NFS services check.",
-        "check_cmd": "/usr/local/lib/nagios/plugins/check_nfs_services",
+        "check_cmd": f"{CHECK_CACHED_CMD} --check nfs_services",
+    },
+    {
+        "shortname": "nfs_null_latency",
+        "description": "NFSv4 NULL RPC latency check.",
+        "check_cmd": f"{CHECK_CACHED_CMD} --check nfs_null_latency",
+    },
+    {
+        "shortname": "ceph_backend",
+        "description": "RADOS latency and CephFS MDS health check.",
+        "check_cmd": f"{CHECK_CACHED_CMD} --check ceph_backend",
     },
 ]
 
+# Plugins and cron jobs of the checks that ran one script per check.
+LEGACY_PLUGINS = ["check_nfs_conn", "check_nfs_exports", "check_nfs_services"]
+LEGACY_CRONJOBS = ["nfs_conn", "nfs_exports", "nfs_services"]
+
+# Unit state key of the content digests of the installed plugins, cron jobs
+# and checks. Hooks run in new processes, so this is what tells what to
+# rewrite and what to remove.
+MANIFEST_KEY = "nfs-ganesha-nrpe.manifest"
+
+
+def _digest(content):
+    if isinstance(content, str):
+        content = content.encode()
+    return hashlib.sha256(content).hexdigest()
+
+
+def load_manifest():
+    manifest = unitdata.kv().get(MANIFEST_KEY) or {}
+    return {
+        "plugins": manifest.get("plugins", {}),
+        "cronjobs": manifest.get("cronjobs", {}),
+        "checks": manifest.get("checks"),
+    }
+
+
+def save_manifest(manifest):
+    unitdata.kv().set(MANIFEST_KEY, manifest)
+
 
 class CustomNRPE(nrpe.NRPE):
     # Target installation paths
     NRPE_PLUGINS_DIR = Path("/usr/local/lib/nagios/plugins")
     CROND_DIR = Path("/etc/cron.d")
 
-    # Values are pathlib.Path objects.
-    installed_plugins = set()
-    installed_cronjobs = {}
-
     def __init__(self, hostname=None, primary=True):
         super().__init__(hostname=hostname, primary=primary)
+        self.manifest = load_manifest()
 
-    def install_all_custom_plugins(self):
+    @property
+    def installed_plugins(self):
+        return {Path(dst) for dst in self.manifest["plugins"]}
+
+    @property
+    def installed_cronjobs(self):
+        return {name: [Path(job["path"])]
+                for name, job in self.manifest["cronjobs"].items()}
+
+    @staticmethod
+    def charm_plugins():
         search_dir = Path(hookenv.charm_dir(), PLUGINS_DIR)
-        plugins = glob(str(search_dir / "*"))
-        for src in plugins:
-            self.install_custom_plugin(src)
+        return glob(str(search_dir / "*"))
+
+    def install_all_custom_plugins(self):
+        """Install the plugins that changed and remove the ones dropped."""
+        plugins = {self.install_custom_plugin(src)
+                   for src in self.charm_plugins()}
+        for dst in self.installed_plugins - plugins:
+            self.remove_custom_plugin(dst)
 
     def remove_all_custom_plugins(self):
-        plugins = map(Path, list(CustomNRPE.installed_plugins))
-        for dst in plugins:
+        # Plugins installed before the manifest existed are not listed in it.
+        plugins = {CustomNRPE.NRPE_PLUGINS_DIR / Path(src).name
+                   for src in self.charm_plugins()}
+        for dst in self.installed_plugins | {
+                dst for dst in plugins if dst.exists()}:
             self.remove_custom_plugin(dst)
 
     def install_custom_plugin(self, src):
+        dst = CustomNRPE.NRPE_PLUGINS_DIR / Path(src).name
+        with open(src, "rb") as f:
+            digest = _digest(f.read())
+        if self.manifest["plugins"].get(str(dst)) == digest and dst.exists():
+            return dst
         try:
-            dst = shutil.copy(src, CustomNRPE.NRPE_PLUGINS_DIR)
+            shutil.copy(src, dst)
             os.chmod(dst, 0o100755)
             os.chown(dst, 0, 0)
             hookenv.log(
                 f"NRPE: Successfully installed {dst}.",
                 hookenv.DEBUG
             )
-            CustomNRPE.installed_plugins.add(Path(dst))
         except Exception as e:
             hookenv.log(
                 f"NRPE: Failed to installed {src}.",
                 hookenv.ERROR
             )
             raise e
-        return Path(dst)
+        self.manifest["plugins"][str(dst)] = digest
+        save_manifest(self.manifest)
+        return dst
 
     def remove_custom_plugin(self, dst):
         try:
-            dst.unlink()
+            dst.unlink(missing_ok=True)
             hookenv.log(
                 f"NRPE: Successfully removed {dst}.",
                 hookenv.DEBUG
             )
-            CustomNRPE.installed_plugins.remove(Path(dst))
         except Exception as e:
             hookenv.log(
-                f"NRPE: Failed to installed {dst}.",
+                f"NRPE: Failed to remove {dst}.",
                 hookenv.ERROR
             )
             raise e
+        self.manifest["plugins"].pop(str(dst), None)
+        save_manifest(self.manifest)
         return Path(dst)
 
-    def install_custom_cronjob(self, command, name):
-        if name in CustomNRPE.installed_cronjobs:
-            hookenv.log(
-                f"NRPE: Failed to installed {name}.",
-                hookenv.ERROR
-            )
-            raise ValueError("cron job name must be unique.")
-
-        cronpath = f"/etc/cron.d/nagios-check_{name}"
-        output_path = f"{super().homedir}/check_{name}.txt"
+    def install_custom_cronjob(self, command, name,
+                               schedule=COLLECTOR_SCHEDULE):
+        cronpath = CustomNRPE.CROND_DIR / f"nagios-check_{name}"
 
-        cron_file = f"*/5 * * * * root {command} > {output_path}\n"
+        cron_file = f"{schedule} root {command} > /dev/null 2>&1\n"
 
+        job = {"path": str(cronpath), "digest": _digest(cron_file)}
+        if self.manifest["cronjobs"].get(name) == job and cronpath.exists():
+            return cronpath
         try:
             with open(cronpath, "w") as f:
                 f.write(cron_file)
@@ -119,66 +186,129 @@ class CustomNRPE(nrpe.NRPE):
                     f"cron.d: Successfully installed {cronpath}.",
                     hookenv.DEBUG
                 )
-                CustomNRPE.installed_cronjobs[name] = [
-                    Path(cronpath),
-                    Path(output_path),
-                ]
         except Exception as e:
             hookenv.log(
                 f"cron.d: Failed to installed {cronpath}.",
                 hookenv.ERROR
             )
             raise e
+        self.manifest["cronjobs"][name] = job
+        save_manifest(self.manifest)
+        return cronpath
 
     def remove_custom_cronjob(self, name):
+        job = self.manifest["cronjobs"].get(name)
+        if job is None:
+            return
         try:
-            for f in CustomNRPE.installed_cronjobs[name]:
-                if f.exists():
-                    f.unlink()
-                hookenv.log(
-                    f"cron.d: Successfully removed {f}.",
-                    hookenv.DEBUG
-                )
-            CustomNRPE.installed_cronjobs.pop(name)
+            Path(job["path"]).unlink(missing_ok=True)
+            hookenv.log(
+                f"cron.d: Successfully removed {job['path']}.",
+                hookenv.DEBUG
+            )
         except Exception as e:
             hookenv.log(
                 f"cron.d: Failed to remove {name}.",
                 hookenv.ERROR
             )
             raise e
+        self.manifest["cronjobs"].pop(name)
+        save_manifest(self.manifest)
 
     def remove_all_custom_cronjobs(self):
-        for name in CustomNRPE.installed_cronjobs.copy():
+        for name in list(self.manifest["cronjobs"]):
             self.remove_custom_cronjob(name)
+        # The collector may have been installed before the manifest existed.
+        collector = CustomNRPE.CROND_DIR / f"nagios-check_{COLLECTOR_NAME}"
+        if collector.exists():
+            collector.unlink()
+
+    def checks_digest(self):
+        """Digest of what write() renders and sends to the relations."""
+        return _digest(json.dumps([
+            [[check.shortname, check.description, check.check_cmd,
+              check.max_check_attempts] for check in self.checks],
+            self.hostname, self.nagios_context, self.nagios_servicegroups,
+            hookenv.relation_ids("local-monitors") +
+            hookenv.relation_ids("nrpe-external-master"),
+        ]))
+
+    def write_checks(self):
+        """Write the checks, which restarts NRPE, only if they changed.
 
+        :returns: True if the checks were written.
+        """
+        digest = self.checks_digest()
+        if self.manifest["checks"] == digest:
+            return False
+        self.write()
+        # write() does nothing until NRPE is installed.
+        if self.does_nrpe_conf_dir_exist():
+            self.manifest["checks"] = digest
+            save_manifest(self.manifest)
+        return True
 
-def install_nrpe_checks(enable_cron=False):
+    def remove_legacy_files(self):
+        """Remove the plugins, cron jobs and outputs of the old checks."""
+        legacy = [CustomNRPE.NRPE_PLUGINS_DIR / plugin
+                  for plugin in LEGACY_PLUGINS]
+        for name in LEGACY_CRONJOBS:
+            legacy.append(CustomNRPE.CROND_DIR / f"nagios-check_{name}")
+            legacy.append(Path(self.homedir) / f"check_{name}.txt")
+        for path in legacy:
+            if path.exists():
+                path.unlink()
+                hookenv.log(
+                    f"NRPE: Successfully removed {path}.",
+                    hookenv.DEBUG
+                )
+
+
+def install_nrpe_checks(enable_cron=False, collector_args=()):
     """Configure NRPE checks, i.e. adding custom check script or using standard
-    nrpe check script."""
+    nrpe check script.
+
+    collector_args are passed to the collector run from cron. Only the files
+    whose content changed are written, and NRPE is only restarted when the
+    checks changed."""
     custom_nrpe = CustomNRPE()
+    custom_nrpe.remove_legacy_files()
     for check in CHECK_SCRIPTS:
         custom_nrpe.add_check(
             shortname=check["shortname"],
             description=check["description"],
             check_cmd=check["check_cmd"]
         )
-        if enable_cron:
-            custom_nrpe.install_custom_cronjob(
-                check["check_cmd"], check["shortname"]
-            )
-    custom_nrpe.write()
-    return CustomNRPE.installed_cronjobs.copy()
+    cronjobs = set()
+    if enable_cron:
+        command = " ".join(
+            [COLLECTOR_CMD] + [shlex.quote(str(arg))
+                               for arg in collector_args])
+        custom_nrpe.install_custom_cronjob(command, COLLECTOR_NAME)
+        cronjobs.add(COLLECTOR_NAME)
+    for name in set(custom_nrpe.installed_cronjobs) - cronjobs:
+        custom_nrpe.remove_custom_cronjob(name)
+    custom_nrpe.write_checks()
+    return custom_nrpe.installed_cronjobs
 
 
 def remove_nrpe_checks():
     """Remove existing NRPE checks."""
     custom_nrpe = CustomNRPE()
+    installed = custom_nrpe.manifest["checks"] is not None or any(
+        os.path.exists(os.path.join(
+            custom_nrpe.nrpe_confdir, f"check_{check['shortname']}.cfg"))
+        for check in CHECK_SCRIPTS)
+    custom_nrpe.remove_all_custom_cronjobs()
+    if not installed:
+        return
     for check in CHECK_SCRIPTS:
         custom_nrpe.remove_check(
             shortname=check["shortname"],
         )
-    custom_nrpe.remove_all_custom_cronjobs()
     custom_nrpe.write()
+    custom_nrpe.manifest["checks"] = None
+    save_manifest(custom_nrpe.manifest)
 
 
 def install_nrpe_plugins():
@@ -186,7 +316,7 @@ def install_nrpe_plugins():
     """
     custom_nrpe = CustomNRPE()
     custom_nrpe.install_all_custom_plugins()
-    return CustomNRPE.installed_plugins.copy()
+    return custom_nrpe.installed_plugins
 
 
 def remove_nrpe_plugins():
@@ -12,6 +12,8 @@ from charmhelpers.core.hookenv import (
     config,
 )
 
+import charm.openstack.manila_ganesha as manila_ganesha
+
 charms_openstack.bus.discover()
 
 # Use the charms.openstack defaults for common states and hooks
@@ -32,15 +34,30 @@ charm.use_defaults(
 @reactive.when('ceph.connected')
 @reactive.when_not('ganesha-pool-configured')
 def ceph_connected(ceph):
-    ceph.create_pool(ch_core.hookenv.application_name())
     with charm.provide_charm_instance() as charm_instance:
-        charm_instance.request_ceph_permissions(ceph)
+        charm_instance.request_ceph_pools(ceph)
+
+
+@reactive.when('ceph.connected', 'ganesha-pool-configured')
+@reactive.when_any('config.changed.ceph-pool-replicas',
+                   'config.changed.ceph-pool-weight',
+                   'config.changed.ceph-pool-crush-rule',
+                   'config.changed.ceph-pool-app-name',
+                   'config.changed.recovery-pool',
+                   'config.changed.recovery-pool-crush-rule')
+def ceph_pools_changed(ceph):
+    """Send the changed pool settings, or the new recovery pool, to ceph."""
+    with charm.provide_charm_instance() as charm_instance:
+        charm_instance.request_ceph_pools(ceph)
 
 
 @reactive.when('manila-plugin.available')
 def setup_manila():
     manila_relation = relations.endpoint_from_flag('manila-plugin.available')
-    manila_relation.name = 'cephfsnfs1'
+    with charm.provide_charm_instance() as charm_instance:
+        # manila joins the names of its plugins into enabled_share_backends.
+        manila_relation.name = ','.join(
+            backend['name'] for backend in charm_instance.share_backends)
     manila_relation.configuration_data = {
         'complete': True,
     }
@@ -79,6 +96,9 @@ def render_things(*args):
                             'keyring'.format(ceph_relation.relation_name),
                             level=ch_core.hookenv.INFO)
         charm_instance.configure_ceph_keyring(ceph_relation.key)
+        if charm_instance.update_recovery_location():
+            # Register the units in the grace db at its new location.
+            reactive.clear_flag('ganesha-grace-db-updated')
 
         # add in optional certificates.available relation for https to keystone
         certificates = relations.endpoint_from_flag('certificates.available')
@@ -88,6 +108,11 @@ def render_things(*args):
             interfaces = list(args)
 
         charm_instance.render_with_interfaces(interfaces)
+        if charm_instance.configure_share_endpoints():
+            reactive.clear_flag('ha-resources-exposed')
+        if charm_instance.configure_ganesha_keyring():
+            # Ganesha could not connect to Ceph before its identity existed.
+            charm_instance.queue_restarts(['nfs-ganesha'])
 
         reactive.set_flag('config.rendered')
         charm_instance.assess_status()
@@ -113,7 +138,7 @@ def configure_ganesha(*args):
     cmd = [
         'rados', '-p', ch_core.hookenv.application_name(),
         '--id', ch_core.hookenv.application_name(),
-        'put', 'ganesha-export-index', '/dev/null'
+        'put', manila_ganesha.GANESHA_EXPORT_INDEX, '/dev/null'
     ]
     try:
         subprocess.check_call(cmd)
@@ -122,24 +147,98 @@ def configure_ganesha(*args):
         log("Failed to setup ganesha index object")
 
 
+@reactive.when('ganesha-pool-configured')
+def assign_share_backends():
+    """Let the leader give the configured share backends their objects."""
+    with charm.provide_charm_instance() as charm_instance:
+        charm_instance.assign_share_backend_slots()
+
+
+@reactive.when('config.rendered', 'ganesha-pool-configured')
+def share_ganesha_config():
+    """Publish, on the leader, and apply the shared core Ganesha config."""
+    with charm.provide_charm_instance() as charm_instance:
+        charm_instance.publish_ganesha_config()
+        charm_instance.apply_ganesha_config()
+
+
+@reactive.when('config.rendered', 'ganesha-pool-configured')
+def configure_export_watcher():
+    """Follow the export indexes of the backends Ganesha does not watch."""
+    with charm.provide_charm_instance() as charm_instance:
+        charm_instance.configure_export_watcher()
+
+
+@reactive.when('config.rendered', 'ganesha-pool-configured')
+@reactive.when_not('ganesha-grace-db-updated')
+def update_grace_db():
+    """Keep the rados_cluster grace db in line with the application.
+
+    Only used in active/active mode, where Ganesha refuses to start on a
+    unit that is not a member of the grace db.
+    """
+    with charm.provide_charm_instance() as charm_instance:
+        if (charm_instance.active_active and
+                charm_instance.update_grace_membership()):
+            charm_instance.queue_restarts(['nfs-ganesha'])
+        reactive.set_flag('ganesha-grace-db-updated')
+
+
+@reactive.hook('cluster-relation-departed')
+def cluster_departed():
+    """Let the leader drop departed units from the grace db."""
+    reactive.clear_flag('ganesha-grace-db-updated')
+
+
+@reactive.hook('stop')
+def leave_grace_db():
+    with charm.provide_charm_instance() as charm_instance:
+        if charm_instance.active_active:
+            charm_instance.leave_grace_db()
+
+
+@reactive.when('config.changed.ganesha-active-active')
+def active_active_changed():
+    """Re-register the grace db membership and the HA resources."""
+    reactive.clear_flag('ganesha-grace-db-updated')
+    reactive.clear_flag('ha-resources-exposed')
+
+
+@reactive.when('cluster.connected')
+def publish_export_address():
+    with charm.provide_charm_instance() as charm_instance:
+        charm_instance.publish_export_address()
+
+
 @reactive.when('ha.connected', 'ganesha-pool-configured',
                'config.rendered')
 @reactive.when_not('ha-resources-exposed')
 def cluster_connected(hacluster):
-    """Configure HA resources in corosync"""
+    """Configure HA resources in corosync
+
+    In active/active mode nfs-ganesha runs on every unit as a cloned resource
+    and only manila-share follows the VIP. Share backends with their own VIP
+    get their own manila-share, following that VIP.
+    """
     with charm.provide_charm_instance() as this_charm:
         hacluster.add_systemd_service('nfs-ganesha',
                                       'nfs-ganesha',
-                                      clone=False)
+                                      clone=this_charm.active_active)
         hacluster.add_systemd_service('manila-share',
                                       'manila-share',
                                       clone=False)
-        hacluster.add_colocation('ganesha_with_vip', 'inf',
-                                 ('res_nfs_ganesha_nfs_ganesha',
-                                  'grp_ganesha_vips'))
+        if this_charm.active_active:
+            # Left over when switching from active/passive, it would keep
+            # the cloned nfs-ganesha to the unit holding the VIP.
+            hacluster.remove_colocation('ganesha_with_vip')
+        else:
+            hacluster.add_colocation('ganesha_with_vip', 'inf',
+                                     ('res_nfs_ganesha_nfs_ganesha',
+                                      'grp_ganesha_vips'))
         hacluster.add_colocation('manila_with_vip', 'inf',
                                  ('res_manila_share_manila_share',
                                   'grp_ganesha_vips'))
+        this_charm.configure_share_endpoint_resources(hacluster)
         this_charm.configure_ha_resources(hacluster)
         reactive.set_flag('ha-resources-exposed')
         this_charm.assess_status()
@@ -156,7 +255,10 @@ def disable_services():
        evicted and session state currupted. Once HA setup is complete,
        pacemaker will ensure only one unit has running services.
     """
-    for service in ['nfs-ganesha', 'manila-share']:
+    with charm.provide_charm_instance() as charm_instance:
+        services = (['nfs-ganesha', 'manila-share'] +
+                    charm_instance.endpoint_services)
+    for service in services:
         ch_core.host.service('disable', service)
         ch_core.host.service('stop', service)
     # We have to unmask this service here in case it was masked early
@@ -241,3 +343,22 @@ def remove_nrpe():
     with charm.provide_charm_instance() as this_charm:
         this_charm.remove_nrpe_plugins()
         this_charm.remove_nrpe_checks()
+
+
+@reactive.when('prometheus-target.available')
+def configure_prometheus_target():
+    """Run the exporter and tell prometheus where to scrape it."""
+    target = relations.endpoint_from_flag('prometheus-target.available')
+    with charm.provide_charm_instance() as this_charm:
+        this_charm.install_exporter()
+        target.configure(port=this_charm.exporter_port)
+    reactive.set_flag('ganesha-exporter.installed')
+
+
+@reactive.when('ganesha-exporter.installed')
+@reactive.when_not('prometheus-target.available')
+def remove_prometheus_exporter():
+    """Remove the exporter once nothing scrapes it."""
+    with charm.provide_charm_instance() as this_charm:
+        this_charm.remove_exporter()
+    reactive.clear_flag('ganesha-exporter.installed')
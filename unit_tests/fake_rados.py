@@ -0,0 +1,117 @@
+# Copyright 2026 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""A RADOS pool backed by a directory, for the ganesha_admin tests."""
+
+import json
+import os
+import urllib.parse
+
+EXPORT_OBJECT = """EXPORT {{
+    Export_Id = {export_id};
+    Path = "/volumes/_nogroup/share-{export_id}/{export_id:08x}";
+    Pseudo = "/volumes/_nogroup/share-{export_id}/{export_id:08x}";
+    Access_Type = "RW";
+    FSAL {{
+        Name = "Ceph";
+        User_Id = "manila-ganesha";
+    }}
+}}
+"""
+
+
+class DirectoryRados(object):
+    """Keep each object in a file and its omap in a JSON file beside it.
+
+    Has the methods of ganesha_admin.Rados.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.join(path, '.omap'), exist_ok=True)
+
+    def _object(self, name):
+        return os.path.join(self.path, urllib.parse.quote(name, safe=''))
+
+    def _omap(self, name):
+        return os.path.join(self.path, '.omap',
+                            urllib.parse.quote(name, safe=''))
+
+    def read(self, name):
+        with open(self._object(name)) as f:
+            return f.read()
+
+    def write_full(self, name, content):
+        with open(self._object(name), 'w') as f:
+            f.write(content)
+
+    def replace(self, name, old, new):
+        if self.read(name) != old:
+            return False
+        self.write_full(name, new)
+        return True
+
+    def remove(self, name):
+        os.unlink(self._object(name))
+
+    def stat_many(self, names):
+        sizes = {}
+        for name in names:
+            try:
+                sizes[name] = os.stat(self._object(name)).st_size
+            except FileNotFoundError:
+                sizes[name] = None
+        return sizes
+
+    def list(self):
+        names = set(os.listdir(self.path)) | set(
+            os.listdir(os.path.join(self.path, '.omap')))
+        names.discard('.omap')
+        return [urllib.parse.unquote(name) for name in names]
+
+    def get_omap(self, name):
+        try:
+            with open(self._omap(name)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def set_omap(self, name, values):
+        omap = self.get_omap(name)
+        omap.update(values)
+        with open(self._omap(name), 'w') as f:
+            json.dump(omap, f)
+
+    def remove_omap_keys(self, name, keys):
+        omap = self.get_omap(name)
+        for key in keys:
+            omap.pop(key, None)
+        with open(self._omap(name), 'w') as f:
+            json.dump(omap, f)
+
+
+def populate_exports(store, pool, index, count):
+    """Write count export objects and the index manila would list them in.
+
+    :returns: the names of the export objects
+    """
+    names = []
+    for export_id in range(1, count + 1):
+        name = 'ganesha-export-{}'.format(export_id)
+        store.write_full(name, EXPORT_OBJECT.format(export_id=export_id))
+        names.append(name)
+    store.write_full(index, '\n'.join(
+        '%url rados://{}/{}'.format(pool, name) for name in names))
+    return names
+
@@ -0,0 +1,204 @@
+# Copyright 2026 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import sys
+from unittest import mock
+
+import charms_openstack.test_utils as test_utils
+
+sys.path.append('src/actions')
+sys.modules['charms.layer'] = mock.MagicMock()
+
+import actions  # noqa: E402
+
+
+class TestGraceActions(test_utils.PatchHelper):
+
+    def setUp(self):
+        super().setUp()
+        self.charm_instance = mock.MagicMock()
+        self.patch_object(actions.charm, 'provide_charm_instance')
+        self.provide_charm_instance().__enter__.return_value = (
+            self.charm_instance)
+        self.patch_object(actions.hookenv, 'action_get')
+        self.patch_object(actions.hookenv, 'action_set')
+        self.patch_object(actions.hookenv, 'action_fail')
+        self.charm_instance.grace_status.return_value = {
+            'cur': 3,
+            'rec': 2,
+            'members': {'manila-ganesha-0': 'NE', 'manila-ganesha-1': 'E'},
+        }
+
+    def test_show_grace(self):
+        self.charm_instance.unreclaimed_clients.return_value = {
+            'manila-ganesha-0': ['10.0.0.5', '10.0.0.7'],
+            'manila-ganesha-1': []}
+        actions.show_grace()
+        self.charm_instance.unreclaimed_clients.assert_called_once_with(
+            self.charm_instance.grace_status.return_value)
+        self.action_set.assert_called_once_with({
+            'current-epoch': 3,
+            'recovery-epoch': 2,
+            'in-grace': True,
+            'members': 'manila-ganesha-0: NE\nmanila-ganesha-1: E',
+            'unreclaimed': 'manila-ganesha-0: 10.0.0.5, 10.0.0.7\n'
+                           'manila-ganesha-1: -',
+        })
+
+    def test_show_grace_not_active_active(self):
+        self.charm_instance.active_active = False
+        actions.main(['show-grace'])
+        self.action_fail.assert_called_once()
+        self.action_set.assert_not_called()
+
+    def test_lift_grace(self):
+        self.action_get.side_effect = {
+            'nodes': 'manila-ganesha-0', 'force': False}.get
+        self.charm_instance.lift_grace.return_value = ['manila-ganesha-0']
+        actions.lift_grace()
+        self.charm_instance.lift_grace.assert_called_once_with(
+            ['manila-ganesha-0'], force=False)
+        self.action_set.assert_called_once_with({
+            'lifted': 'manila-ganesha-0',
+            'in-grace': True,
+            'members': 'manila-ganesha-0: NE\nmanila-ganesha-1: E',
+        })
+
+    def test_lift_grace_unreclaimed(self):
+        self.action_get.side_effect = {'nodes': '', 'force': False}.get
+        self.charm_instance.lift_grace.side_effect = RuntimeError(
+            'Clients have not reclaimed their state yet')
+        actions.main(['lift-grace'])
+        self.charm_instance.lift_grace.assert_called_once_with([],
+                                                               force=False)
+        self.action_fail.assert_called_once_with(
+            'Clients have not reclaimed their state yet')
+        self.action_set.assert_not_called()
+
+    def test_run_deferred_restarts(self):
+        self.charm_instance.run_deferred_restarts.return_value = [
+            'nfs-ganesha', 'manila-share']
+        actions.main(['run-deferred-restarts'])
+        self.action_set.assert_called_once_with({
+            'restarted': 'nfs-ganesha, manila-share',
+        })
+        self.charm_instance.assess_status.assert_called_once_with()
+
+    def test_show_nfs_stats(self):
+        self.action_get.side_effect = {
+            'window': 5, 'top': 2, 'sort-by': 'bytes'}.get
+        self.charm_instance.nfs_stats.return_value = {
+            'window': 5,
+            'exports': [{
+                'export_id': 1,
+                'path': '/volumes/_nogroup/share-1',
+                'share_id': 'share-1',
+                'ops_per_sec': 10.0,
+                'bytes_per_sec': 2000.0,
+                'mean_latency_ms': 2.0,
+            }],
+            'clients': [],
+        }
+        actions.main(['show-nfs-stats'])
+        self.charm_instance.nfs_stats.assert_called_once_with(
+            window=5, top=2, sort_by='bytes')
+        self.action_set.assert_called_once_with({
+            'window': 5,
+            'exports': 'share-1 (/volumes/_nogroup/share-1, export 1): '
+                       '10.0 ops/s, 2000.0 bytes/s, 2.0 ms',
+            'clients': 'none',
+        })
+
+    def test_list_nfs_clients(self):
+        self.charm_instance.nfs_clients.return_value = {
+            'ganesha': True,
+            'clients': [{
+                'client': '10.0.0.5',
+                'connected': True,
+                'protocols': ['nfsv41'],
+                'idle_seconds': 10,
+                'records': [{'clientid': '1', 'owner': 'host5'}],
+                'expired': False,
+            }, {
+                'client': '10.0.0.7',
+                'connected': False,
+                'protocols': [],
+                'idle_seconds': None,
+                'records': [{'clientid': '3', 'owner': None}],
+                'expired': True,
+            }],
+        }
+        actions.main(['list-nfs-clients'])
+        self.action_set.assert_called_once_with({
+            'clients': '10.0.0.5: connected (nfsv41, idle 10s), '
+                       'recovery records: 1 host5\n'
+                       '10.0.0.7: not connected, recovery records: 3, '
+                       'EXPIRED',
+            'expired': '10.0.0.7',
+        })
+
+    def test_evict_nfs_clients(self):
+        self.action_get.side_effect = {
+            'clients': '10.0.0.5 10.0.0.6', 'expired': False}.get
+        self.charm_instance.evict_nfs_clients.return_value = [
+            {'client': '10.0.0.5', 'records': 2}]
+        actions.main(['evict-nfs-clients'])
+        self.charm_instance.evict_nfs_clients.assert_called_once_with(
+            ['10.0.0.5', '10.0.0.6'], expired=False)
+        self.action_set.assert_called_once_with({
+            'evicted': '10.0.0.5: 2 records removed'})
+
+    def test_evict_nfs_clients_nothing(self):
+        self.action_get.side_effect = {'clients': '', 'expired': False}.get
+        actions.main(['evict-nfs-clients'])
+        self.action_fail.assert_called_once()
+        self.charm_instance.evict_nfs_clients.assert_not_called()
+
+    def test_export_index_actions(self):
+        report = {
+            'entries': 60,
+            'exports': 57,
+            'duplicates': ['ganesha-export-1'],
+            'dangling': ['ganesha-export-{}'.format(i) for i in range(52)],
+            'foreign': [],
+            'index_bytes': 2900,
+            'export_bytes': 12000,
+        }
+        self.charm_instance.export_index_report.return_value = report
+        actions.main(['show-export-index'])
+        self.charm_instance.export_index_report.assert_called_once_with()
+        expected = {
+            'entries': 60,
+            'exports': 57,
+            'duplicates': 'ganesha-export-1',
+            'dangling': ' '.join('ganesha-export-{}'.format(i)
+                                 for i in range(50)) + ' and 2 more',
+            'foreign': 'none',
+            'index-bytes': 2900,
+            'export-bytes': 12000,
+        }
+        self.action_set.assert_called_once_with(expected)
+
+        self.action_set.reset_mock()
+        self.charm_instance.export_index_report.return_value = dict(
+            report, removed=53, rewritten=True)
+        actions.main(['compact-export-index'])
+        self.charm_instance.export_index_report.assert_called_with(
+            compact=True)
+        self.action_set.assert_called_once_with(
+            dict(expected, removed=53, rewritten=True))
+
+    def test_main_unknown_action(self):
+        self.assertEqual(actions.main(['do-something']),
+                         'Action do-something undefined')
@@ -0,0 +1,316 @@
+# Copyright 2026 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import tempfile
+import unittest
+
+from unit_tests.fake_rados import DirectoryRados, populate_exports
+from unit_tests.utils import FakeBus, FakeStore, TIMESTAMP, load_script
+
+ganesha_admin = load_script('ganesha_admin', 'src/files/ganesha_admin')
+
+SHARE_ID = '8a7e5c43-1d9a-4c4b-9a4e-2f1f0b5b8d11'
+EXPORT_PATH = '/volumes/_nogroup/{}/5e1f'.format(SHARE_ID)
+
+
+def io_reply(ops, nbytes, latency_ns):
+    return (True, 'OK', TIMESTAMP,
+            (nbytes, nbytes, ops, 0, latency_ns), (0, 0, 0, 0, 0))
+
+
+def stats_replies(export_io, client_io):
+    replies = {
+        (ganesha_admin.ganesha_exporter.EXPORT_MGR, 'GetGlobalOPS'): (
+            True, 'OK', TIMESTAMP, ()),
+        (ganesha_admin.ganesha_exporter.EXPORT_MGR, 'ShowExports'): (
+            TIMESTAMP, [(1, EXPORT_PATH), (2, '/volumes/_nogroup/other')]),
+        (ganesha_admin.ganesha_exporter.CLIENT_MGR, 'ShowClients'): (
+            TIMESTAMP, [('10.0.0.5',)]),
+        (ganesha_admin.ganesha_exporter.EXPORT_MGR, 'ShowMDCache'): (
+            False, 'Not enabled', TIMESTAMP),
+    }
+    for protocol, method in ganesha_admin.ganesha_exporter.IO_METHODS:
+        for export_id in (1, 2):
+            replies[(ganesha_admin.ganesha_exporter.EXPORT_MGR, method,
+                     export_id)] = (
+                export_io[export_id] if protocol == 'nfsv41'
+                else (False, 'No activity', TIMESTAMP))
+        replies[(ganesha_admin.ganesha_exporter.CLIENT_MGR, method,
+                 '10.0.0.5')] = (
+            client_io if protocol == 'nfsv41'
+            else (False, 'No activity', TIMESTAMP))
+    return replies
+
+
+class TestGaneshaAdmin(unittest.TestCase):
+
+    def test_share_exports(self):
+        store = FakeStore({
+            'ganesha-export-index': (
+                '%url "rados://manila-ganesha/ganesha-export-1"\n'
+                '%url rados://manila-ganesha/ganesha-export-7\n'
+                '%url "rados://manila-ganesha/ganesha-export-gone"\n'),
+            'ganesha-export-1': (
+                'EXPORT {\n    Export_Id = 1;\n'
+                '    Path = "' + EXPORT_PATH + '";\n'
+                '    Pseudo = "' + EXPORT_PATH + '";\n}\n'),
+            'ganesha-export-7': 'EXPORT {\n    Path = "/x";\n}\n',
+        })
+        self.assertEqual(
+            ganesha_admin.share_exports(store, 'ganesha-export-index'),
+            {1: {'share_id': SHARE_ID, 'path': EXPORT_PATH,
+                 'object': 'ganesha-export-1'}})
+
+    def test_stats(self):
+        bus = FakeBus(stats_replies(
+            {1: io_reply(10, 100, 0), 2: io_reply(0, 0, 0)},
+            io_reply(10, 100, 0)))
+
+        def sleep(window):
+            self.assertEqual(window, 2)
+            bus.replies = stats_replies(
+                {1: io_reply(30, 4100, 40000000),
+                 2: io_reply(100, 100, 1000000000)},
+                io_reply(50, 300, 80000000))
+
+        store = FakeStore({
+            'ganesha-export-index': (
+                '%url "rados://manila-ganesha/ganesha-export-1"\n'),
+            'ganesha-export-1': (
+                'EXPORT {\n    Export_Id = 1;\n'
+                '    Path = "' + EXPORT_PATH + '";\n}\n'),
+        })
+        result = ganesha_admin.stats(bus, store, ['ganesha-export-index'],
+                                     window=2, top=1, sort_by='bytes',
+                                     sleep=sleep)
+        self.assertEqual(result, {
+            'window': 2,
+            'exports': [{
+                'export_id': 1,
+                'path': EXPORT_PATH,
+                'share_id': SHARE_ID,
+                'ops_per_sec': 10.0,
+                'bytes_per_sec': 2000.0,
+                'mean_latency_ms': 2.0,
+            }],
+            'clients': [{
+                'client': '10.0.0.5',
+                'ops_per_sec': 20.0,
+                'bytes_per_sec': 100.0,
+                'mean_latency_ms': 2.0,
+            }],
+        })
+        result = ganesha_admin.stats(bus, None, ['ganesha-export-index'],
+                                     window=2, top=5, sort_by='latency',
+                                     sleep=lambda window: None)
+        self.assertEqual([e['export_id'] for e in result['exports']],
+                         [1, 2])
+        self.assertEqual(result['exports'][0]['share_id'], None)
+
+    def _clients_fixture(self):
+        bus = FakeBus({
+            (ganesha_admin.ganesha_exporter.CLIENT_MGR, 'ShowClients'): (
+                TIMESTAMP, [
+                    ('::ffff:10.0.0.5', False, False, False, False, False,
+                     True, False, False, (1000, 0)),
+                    ('10.0.0.6', False, False, False, False, False,
+                     True, False, False, (800, 0)),
+                ]),
+            (ganesha_admin.ganesha_exporter.CLIENT_MGR, 'RemoveClient',
+             '10.0.0.6'): (True, 'OK'),
+        })
+        store = FakeStore({'ganesha-export-index': ''}, {
+            'rec-0000000000000003:manila-ganesha-0': {
+                '1': '::ffff:10.0.0.5-(20:Linux NFSv4.1 host5)',
+                '2': '::ffff:10.0.0.6-(20:Linux NFSv4.1 host6)',
+                '3': '::ffff:10.0.0.7-(20:Linux NFSv4.1 host7)',
+            },
+            'rec-0000000000000003:manila-ganesha-1': {
+                '4': '::ffff:10.0.0.8-(20:Linux NFSv4.1 host8)',
+            },
+            'grace': {},
+        })
+        return bus, store
+
+    def test_clients(self):
+        bus, store = self._clients_fixture()
+        result = ganesha_admin.clients(bus, store, 'manila-ganesha-0',
+                                       lease_lifetime=60, now=1010)
+        self.assertTrue(result['ganesha'])
+        self.assertEqual(
+            [(c['client'], c['connected'], c['idle_seconds'], c['expired'])
+             for c in result['clients']],
+            [('10.0.0.5', True, 10, False),
+             ('10.0.0.6', True, 210, True),
+             ('10.0.0.7', False, None, True)])
+        self.assertEqual(result['clients'][0]['protocols'], ['nfsv41'])
+        self.assertEqual(result['clients'][0]['records'], [{
+            'object': 'rec-0000000000000003:manila-ganesha-0',
+            'clientid': '1',
+            'address': '10.0.0.5',
+            'owner': 'Linux NFSv4.1 host5',
+        }])
+        # Without Ganesha nothing is reported expired.
+        result = ganesha_admin.clients(None, store, now=1010)
+        self.assertFalse(result['ganesha'])
+        self.assertEqual(len(result['clients']), 4)
+        self.assertFalse(any(c['expired'] for c in result['clients']))
+        # The fs recovery backend keeps no records in RADOS.
+        result = ganesha_admin.clients(bus, None, lease_lifetime=60,
+                                       now=1010)
+        self.assertEqual([(c['client'], c['records'], c['expired'])
+                          for c in result['clients']],
+                         [('10.0.0.5', [], False), ('10.0.0.6', [], False)])
+
+    def test_evict(self):
+        bus, store = self._clients_fixture()
+        result = ganesha_admin.evict(bus, store, ['10.0.0.5'], expired=True,
+                                     nodeid='manila-ganesha-0',
+                                     lease_lifetime=60, now=1010)
+        self.assertEqual(result, {'evicted': [
+            {'client': '10.0.0.5', 'records': 1},
+            {'client': '10.0.0.6', 'records': 1},
+            {'client': '10.0.0.7', 'records': 1},
+        ]})
+        self.assertEqual(
+            store.omaps['rec-0000000000000003:manila-ganesha-0'], {})
+        self.assertEqual(
+            len(store.omaps['rec-0000000000000003:manila-ganesha-1']), 1)
+        with self.assertRaises(RuntimeError):
+            ganesha_admin.evict(None, store, [], expired=True)
+
+    def test_unreclaimed(self):
+        _, store = self._clients_fixture()
+        store.omaps.update({
+            'rec-0000000000000004:manila-ganesha-0': {
+                '9': '::ffff:10.0.0.5-(20:Linux NFSv4.1 host5)',
+                '10': '::ffff:10.0.0.9-(20:Linux NFSv4.1 host9)',
+            },
+            'rec-0000000000000002:manila-ganesha-2': {
+                '11': '::ffff:10.0.0.10-(21:Linux NFSv4.1 host10)',
+            },
+        })
+        self.assertEqual(ganesha_admin.unreclaimed(store, 4, 3), {
+            'unreclaimed': {
+                'manila-ganesha-0': ['10.0.0.6', '10.0.0.7'],
+                'manila-ganesha-1': ['10.0.0.8'],
+            }})
+        self.assertEqual(ganesha_admin.unreclaimed(store, 4, 0),
+                         {'unreclaimed': {}})
+
+    def test_inspect_and_compact_index(self):
+        pool, index = 'manila-ganesha', 'ganesha-export-index'
+        with tempfile.TemporaryDirectory() as path:
+            store = DirectoryRados(path)
+            names = populate_exports(store, pool, index, 10000)
+            for name in names[:3]:
+                store.remove(name)
+            store.write_full(index, '\n'.join([
+                store.read(index),
+                '%url "rados://{}/{}"'.format(pool, names[10]),
+                '%url rados://{}/{}'.format(pool, names[10]),
+                '%url rados://other-pool/ganesha-export-1',
+            ]))
+            report = ganesha_admin.inspect_index(store, pool, index)
+            self.assertEqual(report['entries'], 10003)
+            self.assertEqual(report['exports'], 9997)
+            self.assertEqual(report['duplicates'], [names[10]])
+            self.assertEqual(report['dangling'], sorted(names[:3]))
+            self.assertEqual(report['foreign'],
+                             ['other-pool/ganesha-export-1'])
+            self.assertGreater(report['export_bytes'], 9997 * 200)
+
+            report = ganesha_admin.compact_index(store, pool, index)
+            self.assertEqual(report['removed'], 5)
+            self.assertTrue(report['rewritten'])
+            lines = store.read(index).split('\n')
+            self.assertEqual(len(lines), 9998)
+            self.assertEqual(lines[0],
+                             '%url rados://manila-ganesha/ganesha-export-4')
+            self.assertEqual(lines[-1],
+                             '%url rados://other-pool/ganesha-export-1')
+            self.assertEqual(
+                len(ganesha_admin.share_exports(store, index)), 9997)
+
+            report = ganesha_admin.compact_index(store, pool, index)
+            self.assertEqual(report['removed'], 0)
+            self.assertFalse(report['rewritten'])
+
+    def test_compact_index_concurrent_change(self):
+        pool, index = 'manila-ganesha', 'ganesha-export-index'
+        added = '%url rados://{}/ganesha-export-12'.format(pool)
+
+        class RacingRados(DirectoryRados):
+            def replace(self, name, old, new):
+                if added not in self.read(name):
+                    # manila adds an export between the read and the write.
+                    self.write_full(name, self.read(name) + '\n' + added)
+                return super().replace(name, old, new)
+
+        with tempfile.TemporaryDirectory() as path:
+            store = RacingRados(path)
+            names = populate_exports(store, pool, index, 11)
+            store.write_full('ganesha-export-12', 'EXPORT {}')
+            store.remove(names[0])
+            report = ganesha_admin.compact_index(store, pool, index)
+            self.assertEqual(report['removed'], 1)
+            lines = store.read(index).split('\n')
+            self.assertEqual(len(lines), 11)
+            self.assertEqual(lines[-1], added)
+
+            class BusyRados(DirectoryRados):
+                def replace(self, name, old, new):
+                    return False
+
+            store = BusyRados(path)
+            store.remove(names[1])
+            with self.assertRaises(RuntimeError):
+                ganesha_admin.compact_index(store, pool, index)
+
+    def test_stat_many_errors(self):
+        class Completion(object):
+            def __init__(self, ret, callback):
+                self.ret, self.callback = ret, callback
+
+            def wait_for_complete_and_cb(self):
+                if self.ret < 0:
+                    self.callback(self, None, None)
+                else:
+                    self.callback(self, self.ret, TIMESTAMP)
+
+            def get_return_value(self):
+                return min(self.ret, 0)
+
+        class Ioctx(object):
+            def __init__(self, results):
+                self.results = results
+
+            def aio_stat(self, name, oncomplete):
+                return Completion(self.results[name], oncomplete)
+
+        store = object.__new__(ganesha_admin.Rados)
+        store.ioctx = Ioctx({'a': 10, 'b': -2})
+        self.assertEqual(store.stat_many(['a', 'b']), {'a': 10, 'b': None})
+        # Only ENOENT means missing, other errors must not look dangling.
+        store.ioctx = Ioctx({'a': 10, 'b': -1})
+        with self.assertRaises(OSError):
+            store.stat_many(['a', 'b'])
+
+    def test_merge_reports(self):
+        self.assertEqual(
+            ganesha_admin.merge_reports([
+                {'entries': 3, 'dangling': ['a'], 'rewritten': False},
+                {'entries': 2, 'dangling': ['b'], 'rewritten': True},
+            ]),
+            {'entries': 5, 'dangling': ['a', 'b'], 'rewritten': True})
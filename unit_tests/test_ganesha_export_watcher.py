@@ -0,0 +1,69 @@
+# Copyright 2026 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import sys
+import threading
+import unittest
+from unittest import mock
+
+from unit_tests.utils import load_script
+
+ganesha_export_watcher = load_script('ganesha_export_watcher',
+                                     'src/files/ganesha_export_watcher')
+
+
+def fake_watch(*lines):
+    """Return a command printing lines the way rados watch does."""
+    script = 'print("press enter to exit...")\n' + ''.join(
+        'print({!r})\n'.format(line) for line in lines)
+    return [sys.executable, '-c', script]
+
+
+class TestGaneshaExportWatcher(unittest.TestCase):
+
+    def test_watch_cmd(self):
+        self.assertEqual(
+            ganesha_export_watcher.watch_cmd('manila-ganesha',
+                                             'manila-ganesha-0',
+                                             'ganesha-export-index-fast'),
+            ['rados', '-p', 'manila-ganesha', '--id', 'manila-ganesha-0',
+             'watch', 'ganesha-export-index-fast'])
+
+    def test_watch(self):
+        changed = threading.Event()
+        self.assertEqual(ganesha_export_watcher.watch(fake_watch(), changed),
+                         0)
+        self.assertFalse(changed.is_set())
+        self.assertEqual(ganesha_export_watcher.watch(
+            fake_watch('NOTIFY cookie 1 notify_id 2 from 3'), changed), 0)
+        self.assertTrue(changed.is_set())
+
+    def test_run(self):
+        reload = mock.Mock()
+        self.assertEqual(ganesha_export_watcher.run(
+            [fake_watch('NOTIFY cookie 1 notify_id 2 from 3',
+                        'NOTIFY cookie 1 notify_id 3 from 3')],
+            reload=reload, settle_time=0.1), 1)
+        reload.assert_called_once_with()
+
+    def test_main(self):
+        with mock.patch.object(ganesha_export_watcher, 'run') as run:
+            run.return_value = 1
+            self.assertEqual(ganesha_export_watcher.main(
+                ['--pool', 'manila-ganesha', '--id', 'manila-ganesha-0',
+                 '--index', 'a', '--index', 'b']), 1)
+        run.assert_called_once_with([
+            ganesha_export_watcher.watch_cmd('manila-ganesha',
+                                             'manila-ganesha-0', index)
+            for index in ('a', 'b')])
@@ -0,0 +1,67 @@
+# Copyright 2026 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+from unit_tests.utils import FakeBus, TIMESTAMP, load_script
+
+ganesha_exporter = load_script('ganesha_exporter',
+                               'src/files/ganesha_exporter')
+
+
+class TestGaneshaExporter(unittest.TestCase):
+
+    def test_scrape(self):
+        io = (True, 'OK', TIMESTAMP,
+              (10, 8, 2, 0, 3000000000), (4096, 4096, 1, 1, 500000000))
+        bus = FakeBus({
+            (ganesha_exporter.EXPORT_MGR, 'GetGlobalOPS'): (
+                True, 'OK', TIMESTAMP, ('NFSv3', 0, 'NFSv4.0', 0,
+                                        'NFSv4.1', 12, 'NFSv4.2', 0)),
+            (ganesha_exporter.EXPORT_MGR, 'ShowExports'): (
+                TIMESTAMP, [(1, '/volumes/share "a"', False, False, False,
+                             False, True, True, False, False, TIMESTAMP)]),
+            (ganesha_exporter.EXPORT_MGR, 'GetNFSv3IO', 1): (
+                False, 'Export does not have any NFSv3 activity', TIMESTAMP),
+            (ganesha_exporter.EXPORT_MGR, 'GetNFSv40IO', 1): io,
+            (ganesha_exporter.EXPORT_MGR, 'GetNFSv41IO', 1): io,
+            (ganesha_exporter.EXPORT_MGR, 'GetNFSv42IO', 1): Exception(
+                'UnknownMethod'),
+            (ganesha_exporter.CLIENT_MGR, 'ShowClients'): (
+                TIMESTAMP, []),
+            (ganesha_exporter.EXPORT_MGR, 'ShowMDCache'): (
+                True, 'OK', TIMESTAMP, ('cache_req', 10, 'cache_hit', 7)),
+        })
+        page = ganesha_exporter.scrape(lambda: bus)
+        self.assertIn('ganesha_nfs_ops_total{protocol="nfsv41"} 12', page)
+        self.assertIn(
+            'ganesha_export_info{export_id="1",path="/volumes/share \\"a\\""}'
+            ' 1', page)
+        self.assertIn(
+            'ganesha_export_read_latency_seconds_total{export_id="1",'
+            'path="/volumes/share \\"a\\"",protocol="nfsv40"} 3.0', page)
+        self.assertIn(
+            'ganesha_export_write_errors_total{export_id="1",'
+            'path="/volumes/share \\"a\\"",protocol="nfsv41"} 1', page)
+        self.assertNotIn('\\"",protocol="nfsv3"', page)
+        self.assertIn('ganesha_mdcache_cache_hit_total 7', page)
+        self.assertIn('# TYPE ganesha_up gauge\nganesha_up 1\n', page)
+
+    def test_scrape_ganesha_down(self):
+        def no_bus():
+            raise Exception('org.freedesktop.DBus.Error.ServiceUnknown')
+        self.assertEqual(
+            ganesha_exporter.scrape(no_bus),
+            '# HELP ganesha_up Whether the Ganesha D-Bus stats could be '
+            'read.\n# TYPE ganesha_up gauge\nganesha_up 0\n')
@@ -12,6 +12,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import os
+import tempfile
 from unittest import mock
 
 import charms_openstack.test_utils as test_utils
@@ -73,12 +75,61 @@ class TestTlsCertificatesAdapter(Helper):
 
 class TestManilaGaneshaCharm(Helper):
 
-    def test_request_ceph_permissions(self):
-        c = manila_ganesha.ManilaGaneshaCharm()
+    def test_request_ceph_pools(self):
+        self.patch_object(manila_ganesha, 'config')
+        self.patch_object(manila_ganesha, 'CephBrokerRq')
+        self.patch_object(manila_ganesha.ch_core.hookenv, 'application_name')
+        self.application_name.return_value = 'manila-ganesha'
+        self.config.return_value = {}
+        rq = self.CephBrokerRq.return_value
         ceph = mock.MagicMock()
-        ceph.get_current_request.return_value = None
-        c.request_ceph_permissions(ceph)
-        ceph.send_request_if_needed.assert_called_once()
+        c = manila_ganesha.ManilaGaneshaCharm()
+        c.request_ceph_pools(ceph)
+        rq.add_op_create_replicated_pool.assert_called_once_with(
+            name='manila-ganesha', replica_count=3, weight=None,
+            crush_profile=None, app_name=None)
+        rq.add_op.assert_called_once_with({
+            'op': 'set-key-permissions',
+            'permissions': manila_ganesha.CEPH_CAPABILITIES,
+            'client': 'manila-ganesha'})
+        ceph.get_current_request.assert_not_called()
+        ceph.send_request_if_needed.assert_called_once_with(rq)
+        rq.reset_mock()
+        self.config.return_value = {
+            'ceph-pool-replicas': 2,
+            'ceph-pool-weight': 40,
+            'ceph-pool-crush-rule': 'replicated-ssd',
+            'ceph-pool-app-name': 'nfs',
+            'recovery-pool': 'ganesha-recovery',
+            'recovery-pool-crush-rule': 'replicated-nvme',
+        }
+        c.request_ceph_pools(ceph)
+        rq.add_op_create_replicated_pool.assert_has_calls([
+            mock.call(name='manila-ganesha', replica_count=2, weight=40,
+                      crush_profile='replicated-ssd', app_name='nfs'),
+            mock.call(name='ganesha-recovery', replica_count=2, weight=1,
+                      crush_profile='replicated-nvme', app_name='nfs')])
+        self.assertEqual(rq.add_op_create_replicated_pool.call_count, 2)
+
+    def test_validate_ceph_pools(self):
+        self.patch_object(manila_ganesha, 'config')
+        self.patch_object(manila_ganesha.ManilaGaneshaCharm,
+                          'ganesha_version_at_least')
+        self.ganesha_version_at_least.return_value = False
+        self.config.return_value = {'ceph-pool-replicas': 0,
+                                    'ceph-pool-weight': 0}
+        c = manila_ganesha.ManilaGaneshaCharm()
+        self.assertEqual(c._validate_ceph_pools(), [])
+        self.config.return_value = {'ceph-pool-replicas': -1,
+                                    'ceph-pool-weight': 101,
+                                    'recovery-namespace': 'recovery'}
+        self.assertEqual(c._validate_ceph_pools(), [
+            'ceph-pool-replicas must not be negative',
+            'ceph-pool-weight must be between 0 and 100',
+            'recovery-namespace requires nfs-ganesha 3.0 or later'])
+        self.ganesha_version_at_least.return_value = True
+        self.config.return_value = {'recovery-namespace': 'recovery'}
+        self.assertEqual(c._validate_ceph_pools(), [])
 
     def test_access_ip_without_vip(self):
         self.patch_object(manila_ganesha, 'is_clustered')
@@ -131,21 +182,25 @@ class TestManilaGaneshaCharm(Helper):
     def test_handle_changed_client_cert_files__none(self):
         # test that calling with None on all values ensures not files
         self.patch_object(manila_ganesha, 'mkdir', name='mock_mkdir')
-        self.patch_object(manila_ganesha, 'path_hash', name='mock_path_hash')
+        self.patch('os.path.isdir', name='mock_os_path_isdir')
         self.patch('os.path.exists', name='mock_os_path_exists')
         self.patch_object(manila_ganesha, 'log', name='mock_log')
         self.patch('os.remove', name='mock_os_remove')
-        self.patch_object(manila_ganesha, 'write_file', name='mock_write_file')
+        self.patch_object(manila_ganesha, 'write_file_atomic',
+                          name='mock_write_file')
         self.patch_object(manila_ganesha.relations, 'endpoint_from_flag',
                           name='mock_endpoint_from_flag')
         c = manila_ganesha.ManilaGaneshaCharm()
         self.patch_object(c,
                           'render_with_interfaces',
                           name='mock_render_with_interfaces')
+        self.patch_object(c, 'queue_restarts', name='mock_queue_restarts')
+        self.patch_object(c, '_read_file', name='mock_read_file')
+        self.mock_read_file.return_value = None
 
         # Set up test conditions.
-        self.mock_path_hash.return_value = None  # no file changes at all
         self.mock_os_path_exists.side_effect = [False, True, False]
+        self.mock_endpoint_from_flag.return_value = None
 
         # call with all None.
         c.handle_changed_client_cert_files(None, None, None)
@@ -154,31 +209,36 @@ class TestManilaGaneshaCharm(Helper):
         self.mock_os_remove.assert_called_once_with(
             manila_ganesha.MANILA_CLIENT_CERT_FILE)
         self.mock_write_file.assert_not_called()
-        self.mock_endpoint_from_flag.assert_not_called()
+        self.mock_endpoint_from_flag.assert_called_once_with('ceph.available')
         self.mock_render_with_interfaces.assert_not_called()
+        self.mock_queue_restarts.assert_not_called()
 
     def test_handle_changed_client_cert_files__none_os_remove_error(self):
         # test that calling with None on all values ensures not files
         self.patch_object(manila_ganesha, 'mkdir', name='mock_mkdir')
-        self.patch_object(manila_ganesha, 'path_hash', name='mock_path_hash')
+        self.patch('os.path.isdir', name='mock_os_path_isdir')
         self.patch('os.path.exists', name='mock_os_path_exists')
         self.patch_object(manila_ganesha, 'log', name='mock_log')
         self.patch('os.remove', name='mock_os_remove')
-        self.patch_object(manila_ganesha, 'write_file', name='mock_write_file')
+        self.patch_object(manila_ganesha, 'write_file_atomic',
+                          name='mock_write_file')
         self.patch_object(manila_ganesha.relations, 'endpoint_from_flag',
                           name='mock_endpoint_from_flag')
         c = manila_ganesha.ManilaGaneshaCharm()
         self.patch_object(c,
                           'render_with_interfaces',
                           name='mock_render_with_interfaces')
+        self.patch_object(c, 'queue_restarts', name='mock_queue_restarts')
+        self.patch_object(c, '_read_file', name='mock_read_file')
+        self.mock_read_file.return_value = None
 
         # Set up test conditions.
         def raises(_path):
             if _path == manila_ganesha.MANILA_CLIENT_CERT_FILE:
                 raise OSError('bang!')
 
-        self.mock_path_hash.return_value = None  # no file changes at all
         self.mock_os_path_exists.side_effect = [True, True, False]
+        self.mock_endpoint_from_flag.return_value = None
         self.mock_os_remove.side_effect = raises
 
         # call with all None.
@@ -193,26 +253,34 @@ class TestManilaGaneshaCharm(Helper):
                          r"^Path " + manila_ganesha.MANILA_CLIENT_CERT_FILE +
                          r".*deleted")
         self.mock_write_file.assert_not_called()
-        self.mock_endpoint_from_flag.assert_not_called()
+        self.mock_endpoint_from_flag.assert_called_once_with('ceph.available')
         self.mock_render_with_interfaces.assert_not_called()
+        self.mock_queue_restarts.assert_not_called()
 
     def test_handle_changed_client_cert_files__all(self):
         # test that calling with None on all values ensures not files
         self.patch_object(manila_ganesha, 'mkdir', name='mock_mkdir')
-        self.patch_object(manila_ganesha, 'path_hash', name='mock_path_hash')
+        self.patch('os.path.isdir', name='mock_os_path_isdir')
         self.patch('os.path.exists', name='mock_os_path_exists')
         self.patch_object(manila_ganesha, 'log', name='mock_log')
         self.patch('os.remove', name='mock_os_remove')
-        self.patch_object(manila_ganesha, 'write_file', name='mock_write_file')
+        self.patch_object(manila_ganesha, 'write_file_atomic',
+                          name='mock_write_file')
         self.patch_object(manila_ganesha.relations, 'endpoint_from_flag',
                           name='mock_endpoint_from_flag')
+        self.patch_object(manila_ganesha.ManilaGaneshaCharm,
+                          'endpoint_services',
+                          new_callable=mock.PropertyMock)
+        self.endpoint_services.return_value = ['manila-share-fast']
         c = manila_ganesha.ManilaGaneshaCharm()
         self.patch_object(c,
                           'render_with_interfaces',
                           name='mock_render_with_interfaces')
+        self.patch_object(c, 'queue_restarts', name='mock_queue_restarts')
+        self.patch_object(c, '_read_file', name='mock_read_file')
+        self.mock_read_file.return_value = None
 
         # Set up test conditions.
-        self.mock_path_hash.side_effect = [None, None, None, 'h1', 'h2', 'h3']
         self.mock_endpoint_from_flag.side_effect = [
             'e1', 'e2', 'e3', 'e4', 'e5', 'e6']
 
@@ -238,25 +306,67 @@ class TestManilaGaneshaCharm(Helper):
             mock.call('certificates.available'),
         ])
         self.mock_render_with_interfaces.assert_called_once_with(
-            ['e1', 'e2', 'e3', 'e4', 'e5', 'e6'])
+            ['e1', 'e2', 'e3', 'e4', 'e5', 'e6'],
+            configs=[manila_ganesha.MANILA_CONF])
+        # The share endpoints load the same manila.conf.
+        self.mock_queue_restarts.assert_called_once_with(
+            ['manila-share', 'manila-share-fast'])
+
+    def test_handle_changed_client_cert_files__unchanged(self):
+        self.patch_object(manila_ganesha, 'mkdir', name='mock_mkdir')
+        self.patch('os.path.isdir', name='mock_os_path_isdir')
+        self.patch_object(manila_ganesha, 'write_file_atomic',
+                          name='mock_write_file')
+        self.patch_object(manila_ganesha.relations, 'endpoint_from_flag',
+                          name='mock_endpoint_from_flag')
+        c = manila_ganesha.ManilaGaneshaCharm()
+        self.patch_object(c,
+                          'render_with_interfaces',
+                          name='mock_render_with_interfaces')
+        self.patch_object(c, 'queue_restarts', name='mock_queue_restarts')
+        self.patch_object(c, '_read_file', name='mock_read_file')
+        files = {
+            manila_ganesha.MANILA_CLIENT_CA_FILE: b'ca',
+            manila_ganesha.MANILA_CLIENT_CERT_FILE: b'cert',
+            manila_ganesha.MANILA_CLIENT_KEY_FILE: b'key',
+        }
+        self.mock_read_file.side_effect = files.get
+        self.mock_os_path_isdir.return_value = True
+
+        c.handle_changed_client_cert_files('ca', 'cert', 'key')
+
+        self.mock_mkdir.assert_not_called()
+        self.mock_write_file.assert_not_called()
+        self.mock_endpoint_from_flag.assert_not_called()
+        self.mock_render_with_interfaces.assert_not_called()
+        self.mock_queue_restarts.assert_not_called()
+
+        # Only the renewed cert is written.
+        c.handle_changed_client_cert_files('ca', 'new-cert', 'key')
+        self.mock_write_file.assert_called_once_with(
+            manila_ganesha.MANILA_CLIENT_CERT_FILE, b'new-cert',
+            owner=c.user, group=c.group, perms=0o640)
 
     def test_handle_changed_client_cert_files__all_not_all_endpoints(self):
         # test that calling with None on all values ensures not files
         self.patch_object(manila_ganesha, 'mkdir', name='mock_mkdir')
-        self.patch_object(manila_ganesha, 'path_hash', name='mock_path_hash')
+        self.patch('os.path.isdir', name='mock_os_path_isdir')
         self.patch('os.path.exists', name='mock_os_path_exists')
         self.patch_object(manila_ganesha, 'log', name='mock_log')
         self.patch('os.remove', name='mock_os_remove')
-        self.patch_object(manila_ganesha, 'write_file', name='mock_write_file')
+        self.patch_object(manila_ganesha, 'write_file_atomic',
+                          name='mock_write_file')
         self.patch_object(manila_ganesha.relations, 'endpoint_from_flag',
                           name='mock_endpoint_from_flag')
         c = manila_ganesha.ManilaGaneshaCharm()
         self.patch_object(c,
                           'render_with_interfaces',
                           name='mock_render_with_interfaces')
+        self.patch_object(c, 'queue_restarts', name='mock_queue_restarts')
+        self.patch_object(c, '_read_file', name='mock_read_file')
+        self.mock_read_file.return_value = None
 
         # Set up test conditions.
-        self.mock_path_hash.side_effect = [None, None, None, 'h1', 'h2', 'h3']
         self.mock_endpoint_from_flag.side_effect = [
             'e1', 'e2', 'e3', 'e4', None, 'e6']
 
@@ -281,3 +391,1461 @@ class TestManilaGaneshaCharm(Helper):
             mock.call('identity-service.available'),
         ])
         self.mock_render_with_interfaces.assert_not_called()
+
+    def test_ganesha_version_at_least(self):
+        self.patch_object(manila_ganesha, 'cmp_pkgrevno')
+        self.cmp_pkgrevno.return_value = 0
+        self.assertTrue(
+            manila_ganesha.ManilaGaneshaCharm.ganesha_version_at_least('2.7'))
+        self.cmp_pkgrevno.assert_called_once_with('nfs-ganesha-ceph', '2.7')
+        self.cmp_pkgrevno.return_value = -1
+        self.assertFalse(
+            manila_ganesha.ManilaGaneshaCharm.ganesha_version_at_least('2.7'))
+        self.cmp_pkgrevno.side_effect = AttributeError
+        self.assertFalse(
+            manila_ganesha.ManilaGaneshaCharm.ganesha_version_at_least('2.7'))
+
+    def test_default_worker_threads(self):
+        self.patch('os.cpu_count', name='cpu_count')
+        self.cpu_count.return_value = 4
+        self.assertEqual(
+            manila_ganesha.ManilaGaneshaCharm.default_worker_threads(), 256)
+        self.cpu_count.return_value = 64
+        self.assertEqual(
+            manila_ganesha.ManilaGaneshaCharm.default_worker_threads(), 1024)
+        self.cpu_count.return_value = None
+        self.assertEqual(
+            manila_ganesha.ManilaGaneshaCharm.default_worker_threads(), 256)
+
+    def test_ganesha_core_params_defaults(self):
+        self.patch_object(manila_ganesha, 'config')
+        self.patch_object(manila_ganesha, 'leader_get')
+        self.leader_get.return_value = None
+        self.patch_object(manila_ganesha, 'cmp_pkgrevno')
+        self.patch('os.cpu_count', name='cpu_count')
+        self.config.return_value = {}
+        self.cmp_pkgrevno.return_value = 1
+        self.cpu_count.return_value = 32
+        c = manila_ganesha.ManilaGaneshaCharm()
+        self.assertEqual(c.ganesha_core_params, [('RPC_Ioq_ThrdMax', 512)])
+        self.assertEqual(c.custom_assess_status_check(), (None, None))
+        self.cmp_pkgrevno.return_value = -1
+        self.assertEqual(c.ganesha_core_params, [('Nb_Worker', 512)])
+
+    def test_ganesha_core_params(self):
+        self.patch_object(manila_ganesha, 'config')
+        self.patch_object(manila_ganesha, 'cmp_pkgrevno')
+        self.config.return_value = {
+            'ganesha-worker-threads': 300,
+            'ganesha-dispatch-max-reqs': 8000,
+            'ganesha-rpc-max-connections': 4096,
+            'ganesha-rpc-recv-buffer-size': 4194304,
+        }
+        self.cmp_pkgrevno.return_value = 1
+        c = manila_ganesha.ManilaGaneshaCharm()
+        self.assertEqual(c.ganesha_core_params, [
+            ('RPC_Ioq_ThrdMax', 300),
+            ('Dispatch_Max_Reqs', 8000),
+            ('RPC_Max_Connections', 4096),
+            ('MaxRPCRecvBufferSize', 4194304),
+        ])
+
+    def test_ganesha_core_params_invalid(self):
+        self.patch_object(manila_ganesha, 'config')
+        self.patch_object(manila_ganesha, 'leader_get')
+        self.leader_get.return_value = None
+        self.patch_object(manila_ganesha, 'cmp_pkgrevno')
+        self.patch_object(manila_ganesha, 'log')
+        self.patch('os.cpu_count', name='cpu_count')
+        self.config.return_value = {
+            'ganesha-worker-threads': -1,
+            'ganesha-dispatch-max-reqs-xprt': 4096,
+            'ganesha-rpc-max-connections': 4096,
+        }
+        self.cmp_pkgrevno.return_value = 1
+        self.cpu_count.return_value = 1
+        c = manila_ganesha.ManilaGaneshaCharm()
+        self.assertEqual(c.ganesha_core_params, [
+            ('RPC_Ioq_ThrdMax', 256),
+            ('RPC_Max_Connections', 4096),
+        ])
+        self.assertEqual(self.log.call_count, 2)
+        state, message = c.custom_assess_status_check()
+        self.assertEqual(state, 'blocked')
+        self.assertIn('ganesha-worker-threads', message)
+        self.assertIn('ganesha-dispatch-max-reqs-xprt', message)
+
+    def test_recovery_backend(self):
+        self.patch_object(manila_ganesha, 'config')
+        self.config.return_value = {}
+        c = manila_ganesha.ManilaGaneshaUssuriCharm()
+        self.assertEqual(c.recovery_backend, 'rados_ng')
+        self.config.return_value = {'ganesha-active-active': True}
+        self.assertEqual(c.recovery_backend, 'rados_cluster')
+
+    def test_ganesha_client_name(self):
+        self.patch_object(manila_ganesha, 'config')
+        self.patch_object(manila_ganesha, 'local_unit')
+        self.patch_object(manila_ganesha.ch_core.hookenv, 'application_name')
+        self.local_unit.return_value = 'manila-ganesha/2'
+        self.application_name.return_value = 'manila-ganesha'
+        self.config.return_value = {}
+        c = manila_ganesha.ManilaGaneshaCharm()
+        self.assertEqual(c.ganesha_client_name, 'manila-ganesha')
+        self.config.return_value = {'ganesha-active-active': True}
+        self.assertEqual(c.ganesha_client_name, 'manila-ganesha-2')
+
+    def test_configure_ganesha_keyring(self):
+        self.patch_object(manila_ganesha, 'config')
+        self.patch_object(manila_ganesha, 'local_unit')
+        self.patch_object(manila_ganesha.ch_core.hookenv, 'application_name')
+        self.patch_object(manila_ganesha.subprocess, 'check_call')
+        self.patch('os.path.exists', name='os_path_exists')
+        self.patch('os.chmod', name='os_chmod')
+        self.local_unit.return_value = 'manila-ganesha/2'
+        self.application_name.return_value = 'manila-ganesha'
+        self.config.return_value = {}
+        c = manila_ganesha.ManilaGaneshaCharm()
+        self.assertFalse(c.configure_ganesha_keyring())
+        self.check_call.assert_not_called()
+        self.config.return_value = {'ganesha-active-active': True}
+        self.os_path_exists.return_value = True
+        self.assertFalse(c.configure_ganesha_keyring())
+        self.check_call.assert_not_called()
+        self.os_path_exists.return_value = False
+        self.assertTrue(c.configure_ganesha_keyring())
+        keyring = '/etc/ceph/ceph.client.manila-ganesha-2.keyring'
+        self.check_call.assert_called_once_with([
+            'ceph', '--id', 'manila-ganesha', 'auth', 'get-or-create',
+            'client.manila-ganesha-2', 'mds', 'allow rw', 'mon', 'allow r',
+            'osd', 'allow rw', '-o', keyring])
+        self.os_chmod.assert_called_once_with(keyring, 0o600)
+
+    def test_grace_status(self):
+        self.patch_object(manila_ganesha, 'config')
+        self.patch_object(manila_ganesha.unitdata, 'kv')
+        self.kv.return_value = FakeKV()
+        self.patch_object(manila_ganesha.ch_core.hookenv, 'application_name')
+        self.patch_object(manila_ganesha.subprocess, 'check_output')
+        self.config.return_value = {}
+        self.application_name.return_value = 'manila-ganesha'
+        self.check_output.return_value = (
+            'cur=5 rec=4\n'
+            '======================================================\n'
+            'manila-ganesha-0     NE\n'
+            'manila-ganesha-1\n')
+        c = manila_ganesha.ManilaGaneshaCharm()
+        self.assertEqual(c.grace_status(), {
+            'cur': 5,
+            'rec': 4,
+            'members': {'manila-ganesha-0': 'NE', 'manila-ganesha-1': ''},
+        })
+        self.check_output.assert_called_once_with(
+            ['ganesha-rados-grace', '--pool', 'manila-ganesha',
+             '--userid', 'manila-ganesha', 'dump'],
+            universal_newlines=True)
+
+    def test_update_recovery_location(self):
+        self.patch_object(manila_ganesha, 'config')
+        self.patch_object(manila_ganesha, 'is_request_complete')
+        self.patch_object(manila_ganesha, 'CephBrokerRq')
+        self.patch_object(manila_ganesha.unitdata, 'kv')
+        self.patch_object(manila_ganesha.ch_core.hookenv, 'application_name')
+        self.patch_object(manila_ganesha.ManilaGaneshaCharm,
+                          'ganesha_version_at_least')
+        self.kv.return_value = FakeKV()
+        self.application_name.return_value = 'manila-ganesha'
+        self.ganesha_version_at_least.return_value = True
+        self.config.return_value = {}
+        c = manila_ganesha.ManilaGaneshaCharm()
+        self.assertFalse(c.update_recovery_location())
+        self.assertEqual(c.recovery_location, ('manila-ganesha', None))
+        # A namespace of the application pool is used right away.
+        self.config.return_value = {'recovery-namespace': 'recovery'}
+        self.assertTrue(c.update_recovery_location())
+        self.is_request_complete.assert_not_called()
+        self.assertEqual(
+            c._grace_cmd('dump'),
+            ['ganesha-rados-grace', '--pool', 'manila-ganesha',
+             '--userid', 'manila-ganesha', '--ns', 'recovery', 'dump'])
+        # A separate pool only once ceph-mon created it.
+        self.config.return_value = {'recovery-pool': 'ganesha-recovery',
+                                    'recovery-namespace': 'recovery'}
+        self.is_request_complete.return_value = False
+        self.assertFalse(c.update_recovery_location())
+        self.is_request_complete.assert_called_once_with(
+            self.CephBrokerRq.return_value, relation='ceph')
+        self.assertEqual(c.recovery_location, ('manila-ganesha', 'recovery'))
+        self.is_request_complete.return_value = True
+        self.assertTrue(c.update_recovery_location())
+        self.assertEqual(
+            c._grace_cmd('dump'),
+            ['ganesha-rados-grace', '--pool', 'ganesha-recovery',
+             '--userid', 'manila-ganesha', '--ns', 'recovery', 'dump'])
+        # Older releases have no namespace support, see _validate_ceph_pools.
+        self.ganesha_version_at_least.return_value = False
+        self.assertEqual(c.configured_recovery_location,
+                         ('ganesha-recovery', None))
+
+    def test_nfs_stats(self):
+        self.patch_object(manila_ganesha, 'config')
+        self.patch_object(manila_ganesha.unitdata, 'kv')
+        self.kv.return_value = FakeKV()
+        self.patch_object(manila_ganesha.ch_core.hookenv, 'application_name')
+        self.patch_object(manila_ganesha.ch_core.hookenv, 'charm_dir')
+        self.patch_object(manila_ganesha.ch_core.host, 'service_running')
+        self.patch_object(manila_ganesha.subprocess, 'check_output')
+        self.patch_object(manila_ganesha.ManilaGaneshaCharm, 'share_backends',
+                          new_callable=mock.PropertyMock)
+        self.config.return_value = {}
+        self.application_name.return_value = 'manila-ganesha'
+        self.charm_dir.return_value = '/var/lib/juju/charm'
+        self.service_running.return_value = True
+        self.share_backends.return_value = [
+            {'export_index': 'ganesha-export-index'},
+            {'export_index': 'ganesha-export-index-fast'}]
+        self.check_output.return_value = (
+            '{"window": 5, "exports": [], "clients": []}')
+        c = manila_ganesha.ManilaGaneshaCharm()
+        self.assertEqual(c.nfs_stats(window=5, top=3, sort_by='latency'),
+                         {'window': 5, 'exports': [], 'clients': []})
+        self.check_output.assert_called_once_with(
+            ['/usr/bin/python3', '/var/lib/juju/charm/files/ganesha_admin',
+             '--pool', 'manila-ganesha', '--userid', 'manila-ganesha',
+             '--recovery-pool', 'manila-ganesha',
+             '--index', 'ganesha-export-index',
+             '--index', 'ganesha-export-index-fast',
+             'stats', '--window', '5', '--top', '3', '--sort-by', 'latency'],
+            universal_newlines=True)
+        self.service_running.assert_called_once_with('nfs-ganesha')
+        self.service_running.return_value = False
+        with self.assertRaises(RuntimeError):
+            c.nfs_stats()
+
+    def test_export_index_report(self):
+        self.patch_object(manila_ganesha, 'config')
+        self.patch_object(manila_ganesha.unitdata, 'kv')
+        self.kv.return_value = FakeKV()
+        self.patch_object(manila_ganesha.ch_core.hookenv, 'application_name')
+        self.patch_object(manila_ganesha.ch_core.hookenv, 'charm_dir')
+        self.patch_object(manila_ganesha.subprocess, 'check_output')
+        self.patch_object(manila_ganesha.ManilaGaneshaCharm, 'share_backends',
+                          new_callable=mock.PropertyMock)
+        self.config.return_value = {}
+        self.application_name.return_value = 'manila-ganesha'
+        self.charm_dir.return_value = '/var/lib/juju/charm'
+        self.check_output.return_value = '{"entries": 0, "removed": 0}'
+        self.share_backends.return_value = [
+            {'export_index': 'ganesha-export-index'}]
+        c = manila_ganesha.ManilaGaneshaCharm()
+        self.assertEqual(c.export_index_report(compact=True),
+                         {'entries': 0, 'removed': 0})
+        self.check_output.assert_called_once_with(
+            ['/usr/bin/python3', '/var/lib/juju/charm/files/ganesha_admin',
+             '--pool', 'manila-ganesha', '--userid', 'manila-ganesha',
+             '--recovery-pool', 'manila-ganesha',
+             '--index', 'ganesha-export-index', 'index', '--compact'],
+            universal_newlines=True)
+
+    def test_evict_nfs_clients(self):
+        self.patch_object(manila_ganesha, 'config')
+        self.patch_object(manila_ganesha, 'local_unit')
+        self.patch_object(manila_ganesha.ch_core.host, 'service_running')
+        self.config.return_value = {'ganesha-active-active': True}
+        self.local_unit.return_value = 'manila-ganesha/0'
+        c = manila_ganesha.ManilaGaneshaCharm()
+        self.patch_object(c, '_admin')
+        self.patch_object(manila_ganesha.ManilaGaneshaCharm,
+                          'ganesha_nfsv4_params',
+                          new_callable=mock.PropertyMock)
+        self.ganesha_nfsv4_params.return_value = [('Lease_Lifetime', 30)]
+        self._admin.return_value = {'evicted': [
+            {'client': '10.0.0.5', 'records': 1}]}
+        self.assertEqual(c.evict_nfs_clients(['10.0.0.5']),
+                         [{'client': '10.0.0.5', 'records': 1}])
+        self._admin.assert_called_once_with(
+            'evict', '--lease-lifetime', '30', '--nodeid', 'manila-ganesha-0',
+            '10.0.0.5')
+        self.service_running.assert_not_called()
+        self._admin.reset_mock()
+        self.ganesha_nfsv4_params.return_value = []
+        self.service_running.return_value = True
+        c.evict_nfs_clients([], expired=True)
+        self._admin.assert_called_once_with(
+            'evict', '--lease-lifetime', '60', '--nodeid', 'manila-ganesha-0',
+            '--expired')
+        self.service_running.return_value = False
+        with self.assertRaises(RuntimeError):
+            c.evict_nfs_clients([], expired=True)
+
+    def test_admin_client_args_active_passive(self):
+        self.patch_object(manila_ganesha, 'config')
+        self.patch_object(manila_ganesha, 'local_unit')
+        self.patch_object(manila_ganesha.ManilaGaneshaCharm,
+                          'ganesha_nfsv4_params',
+                          new_callable=mock.PropertyMock)
+        self.config.return_value = {}
+        self.local_unit.return_value = 'manila-ganesha/0'
+        self.ganesha_nfsv4_params.return_value = []
+        # rados_ng names its records after the host that held the VIP, and
+        # the fs backend has no records in RADOS.
+        c = manila_ganesha.ManilaGaneshaUssuriCharm()
+        self.assertEqual(c._admin_client_args(), ['--lease-lifetime', '60'])
+        c = manila_ganesha.ManilaGaneshaCharm()
+        self.assertEqual(c._admin_client_args(),
+                         ['--lease-lifetime', '60', '--no-recovery-db'])
+
+    def test_nrpe_collector_args(self):
+        self.patch_object(manila_ganesha, 'config')
+        self.patch_object(manila_ganesha.ManilaGaneshaCharm, 'access_ip',
+                          new_callable=mock.PropertyMock)
+        self.patch_object(manila_ganesha.ch_core.hookenv, 'application_name')
+        self.patch_object(manila_ganesha, 'leader_get')
+        self.patch_object(manila_ganesha.unitdata, 'kv')
+        kv = FakeKV()
+        self.kv.return_value = kv
+        self.application_name.return_value = 'manila-ganesha'
+        self.access_ip.return_value = '10.0.0.10'
+        self.leader_get.return_value = None
+        options = {
+            'nrpe-nfs-latency-samples': 5,
+            'nrpe-nfs-latency-p50': '50,200',
+            'nrpe-nfs-latency-p99': '200,1000',
+            'nrpe-ceph-latency': '100,1000',
+        }
+        self.config.side_effect = lambda key=None: (
+            options if key is None else options.get(key))
+        c = manila_ganesha.ManilaGaneshaCharm()
+        self.assertEqual(c.nrpe_collector_args, [
+            '--access-ip', '10.0.0.10', '--pool', 'manila-ganesha',
+            '--userid', 'manila-ganesha', '--recovery-pool', 'manila-ganesha',
+            '--export-index', 'ganesha-export-index', '--filesystem', '',
+            '--latency-samples', '5',
+            '--latency-p50', '50,200', '--latency-p99', '200,1000',
+            '--ceph-latency', '100,1000'])
+        options['nrpe-nfs-latency-p99'] = '1000'
+        options['nrpe-nfs-latency-p50'] = '300,200'
+        self.assertEqual(c._validate_nrpe_latency(), [
+            'nrpe-nfs-latency-p50 warning must be positive and not above '
+            'critical',
+            'nrpe-nfs-latency-p99 must be "warning,critical" in ms'])
+        kv[manila_ganesha.RECOVERY_LOCATION_KEY] = ['nfs-recovery', 'grace']
+        self.assertEqual(c.nrpe_collector_args, [
+            '--access-ip', '10.0.0.10', '--pool', 'manila-ganesha',
+            '--userid', 'manila-ganesha', '--recovery-pool', 'nfs-recovery',
+            '--recovery-namespace', 'grace',
+            '--export-index', 'ganesha-export-index', '--filesystem', ''])
+        options['share-backends'] = (
+            '[{name: cephfsnfs1}, {name: fast, filesystem: fastfs}, '
+            '{name: faster, filesystem: fastfs}]')
+        self.leader_get.return_value = (
+            '{"cephfsnfs1": 0, "fast": 1, "faster": 2}')
+        self.assertEqual(c.nrpe_collector_args[10:], [
+            '--export-index', 'ganesha-export-index',
+            '--export-index', 'ganesha-export-index-fast',
+            '--export-index', 'ganesha-export-index-faster',
+            '--filesystem', '', '--filesystem', 'fastfs'])
+
+    def test_install_exporter(self):
+        self.patch_object(manila_ganesha, 'config')
+        self.patch_object(manila_ganesha.ch_net_ip, 'get_relation_ip')
+        self.patch_object(manila_ganesha, 'install_exporter')
+        self.config.return_value = 9587
+        self.get_relation_ip.return_value = '10.0.1.10'
+        c = manila_ganesha.ManilaGaneshaCharm()
+        c.install_exporter()
+        self.get_relation_ip.assert_called_once_with('prometheus-target')
+        self.install_exporter.assert_called_once_with('10.0.1.10', 9587)
+
+    def test_share_backends(self):
+        self.patch_object(manila_ganesha, 'config')
+        self.patch_object(manila_ganesha, 'leader_get')
+        options = {'share-backends': ''}
+        self.config.return_value = options
+        self.leader_get.return_value = None
+        c = manila_ganesha.ManilaGaneshaCharm()
+        self.assertEqual(c.share_backends, [{
+            'name': 'cephfsnfs1',
+            'share_backend_name': 'CEPHFSNFS1',
+            'export_index': 'ganesha-export-index',
+            'export_counter': 'ganesha-export-counter',
+            'filesystem': None,
+            'reserved_share_percentage': None,
+            'max_over_subscription_ratio': None,
+            'filter_function': None,
+            'goodness_function': None,
+            'vip': None,
+        }])
+        options['share-backends'] = (
+            '[{name: cephfsnfs1}, '
+            '{name: fast, filesystem: fastfs, reserved-share-percentage: 5},'
+            ' {name: new}]')
+        # Backends are only rendered once the leader gave them a slot.
+        self.leader_get.return_value = '{"cephfsnfs1": 0, "fast": 2}'
+        backends = c.share_backends
+        self.assertEqual([b['name'] for b in backends], ['cephfsnfs1', 'fast'])
+        self.assertEqual(backends[1]['export_index'],
+                         'ganesha-export-index-fast')
+        self.assertEqual(backends[1]['export_counter'],
+                         'ganesha-export-counter-fast')
+        self.assertEqual(backends[1]['share_backend_name'], 'FAST')
+        self.assertEqual(backends[1]['filesystem'], 'fastfs')
+        self.assertEqual(backends[1]['reserved_share_percentage'], 5)
+        self.assertEqual(backends[0]['goodness_function'],
+                         manila_ganesha.DEFAULT_GOODNESS_FUNCTION)
+        self.assertEqual(c._validate_share_backends()[1], [])
+        options['share-backends'] = '[{name: a b}, {name: x, pool: y}]'
+        self.assertEqual(c._validate_share_backends(), ([], [
+            'share-backends names must be made of letters, digits, _ and -',
+            'unknown share-backends keys: pool']))
+        # The backends the leader knows are kept while the option is invalid.
+        self.assertEqual([b['name'] for b in c.share_backends],
+                         ['cephfsnfs1', 'fast'])
+        options['share-backends'] = 'name: x'
+        self.assertEqual(c._validate_share_backends()[1],
+                         ['share-backends must be a YAML list'])
+
+    def test_validate_share_backend_vips(self):
+        self.patch_object(manila_ganesha, 'config')
+        self.patch_object(manila_ganesha.ManilaGaneshaCharm, 'active_active',
+                          new_callable=mock.PropertyMock)
+        options = {
+            'vip': '10.0.0.100',
+            'share-backends': '[{name: a}, {name: b, vip: 10.0.0.101}]',
+        }
+        self.config.return_value = options
+        self.active_active.return_value = True
+        c = manila_ganesha.ManilaGaneshaCharm()
+        self.assertEqual(c._validate_share_backends()[1], [])
+        self.active_active.return_value = False
+        options['share-backends'] = (
+            '[{name: a, vip: 10.0.0.100}, {name: b, vip: nowhere}]')
+        self.assertEqual(c._validate_share_backends()[1], [
+            'share backend b vip is not an IP address',
+            'share-backends with a vip require ganesha-active-active',
+            'at least one share backend must be without a vip, to follow the '
+            'vip option',
+            'share-backends vips must be unique'])
+
+    def test_configure_share_endpoints(self):
+        self.patch_object(manila_ganesha, 'installed_endpoints')
+        self.patch_object(manila_ganesha, 'install_endpoint')
+        self.patch_object(manila_ganesha, 'remove_endpoint')
+        self.patch_object(manila_ganesha, 'peer_units')
+        self.patch_object(manila_ganesha, 'unitdata')
+        self.patch_object(manila_ganesha.ch_core.host, 'service_resume')
+        self.patch_object(manila_ganesha.ManilaGaneshaCharm, 'share_backends',
+                          new_callable=mock.PropertyMock)
+        self.share_backends.return_value = [
+            {'name': 'cephfsnfs1', 'vip': None},
+            {'name': 'second', 'vip': '10.0.0.101'}]
+        self.installed_endpoints.return_value = ['old', 'second']
+        self.install_endpoint.return_value = True
+        self.peer_units.return_value = ['manila-ganesha/1']
+        self.unitdata.kv.return_value.get.return_value = {
+            'second': ['10.0.0.101', 'eth0', ['grp_ganesha_vips']]}
+        c = manila_ganesha.ManilaGaneshaCharm()
+        self.patch_object(c, 'queue_restarts')
+        self.assertFalse(c.configure_share_endpoints())
+        self.remove_endpoint.assert_called_once_with('old')
+        self.install_endpoint.assert_called_once_with(
+            'second', manila_ganesha.MANILA_CONF)
+        self.queue_restarts.assert_called_once_with(['manila-share-second'])
+        self.service_resume.assert_not_called()
+        self.unitdata.kv.return_value.get.return_value = {}
+        self.peer_units.return_value = []
+        self.assertTrue(c.configure_share_endpoints())
+        self.service_resume.assert_called_once_with('manila-share-second')
+
+    def test_configure_share_endpoint_resources(self):
+        self.patch_object(manila_ganesha.os_ha_utils, 'get_vip_settings')
+        self.patch_object(manila_ganesha.ManilaGaneshaCharm, 'share_backends',
+                          new_callable=mock.PropertyMock)
+        self.share_backends.return_value = [
+            {'name': 'cephfsnfs1', 'vip': None},
+            {'name': 'second', 'vip': '10.0.0.101'},
+            {'name': 'third-be', 'vip': '10.0.0.102'}]
+        self.get_vip_settings.return_value = ('eth0', '24', False)
+        kv = FakeKV()
+        kv['manila-ganesha.share-endpoint-resources'] = {
+            'gone': ['10.0.0.103', 'eth0', ['grp_ganesha_vips']]}
+        self.patch_object(manila_ganesha.unitdata, 'kv')
+        self.kv.return_value = kv
+        hacluster = mock.MagicMock()
+        c = manila_ganesha.ManilaGaneshaCharm()
+        c.configure_share_endpoint_resources(hacluster)
+        hacluster.add_vip.assert_has_calls([
+            mock.call('ganesha_second', '10.0.0.101', 'eth0', '24'),
+            mock.call('ganesha_third_be', '10.0.0.102', 'eth0', '24')])
+        hacluster.add_systemd_service.assert_has_calls([
+            mock.call('manila-share-second', 'manila-share-second',
+                      clone=False),
+            mock.call('manila-share-third-be', 'manila-share-third-be',
+                      clone=False)])
+        hacluster.add_colocation.assert_has_calls([
+            mock.call('manila_share_second_with_vip', 'inf',
+                      ('res_manila_share_second_manila_share_second',
+                       'grp_ganesha_second_vips')),
+            mock.call('grp_ganesha_second_vips_apart_from_grp_ganesha_vips',
+                      '-100', ('grp_ganesha_second_vips',
+                               'grp_ganesha_vips')),
+            mock.call('manila_share_third_be_with_vip', 'inf',
+                      ('res_manila_share_third_be_manila_share_third_be',
+                       'grp_ganesha_third_be_vips')),
+            mock.call('grp_ganesha_third_be_vips_apart_from_grp_ganesha_vips',
+                      '-100', ('grp_ganesha_third_be_vips',
+                               'grp_ganesha_vips')),
+            mock.call(
+                'grp_ganesha_third_be_vips_apart_from_grp_ganesha_second_vips',
+                '-100', ('grp_ganesha_third_be_vips',
+                         'grp_ganesha_second_vips')),
+        ])
+        hacluster.remove_colocation.assert_has_calls([
+            mock.call('manila_share_gone_with_vip'),
+            mock.call('grp_ganesha_gone_vips_apart_from_grp_ganesha_vips')])
+        hacluster.remove_systemd_service.assert_called_once_with(
+            'manila-share-gone', 'manila-share-gone')
+        hacluster.remove_vip.assert_called_once_with(
+            'ganesha_gone', '10.0.0.103', 'eth0')
+        self.assertEqual(
+            sorted(kv['manila-ganesha.share-endpoint-resources']),
+            ['second', 'third-be'])
+
+    def _setup_assign_slots(self, options, settings, objects):
+        """Run the rados commands of the slot assignment against objects."""
+        self.patch_object(manila_ganesha, 'config')
+        self.patch_object(manila_ganesha, 'is_leader')
+        self.patch_object(manila_ganesha, 'leader_get')
+        self.patch_object(manila_ganesha, 'leader_set')
+        self.patch_object(manila_ganesha.ch_core.hookenv, 'application_name')
+        self.patch_object(manila_ganesha.subprocess, 'call')
+        self.patch_object(manila_ganesha.subprocess, 'check_call')
+        self.patch_object(manila_ganesha.subprocess, 'check_output')
+        self.patch_object(manila_ganesha, 'cmp_pkgrevno')
+        self.cmp_pkgrevno.return_value = 1
+        self.config.return_value = options
+        self.is_leader.return_value = True
+        self.leader_get.side_effect = settings.get
+        self.leader_set.side_effect = settings.update
+        self.application_name.return_value = 'manila-ganesha'
+
+        def put(cmd):
+            with open(cmd[-1]) as f:
+                objects[cmd[-2]] = f.read()
+
+        self.call.side_effect = lambda cmd, **kwargs: (
+            0 if cmd[-1] in objects else 2)
+        self.check_output.side_effect = lambda cmd: objects[cmd[-2]].encode()
+        self.check_call.side_effect = put
+        return manila_ganesha.ManilaGaneshaCharm()
+
+    def test_assign_share_backend_slots(self):
+        settings = {'share-backend-slots': '{"cephfsnfs1": 0, "old": 1}'}
+        objects = {
+            'ganesha-export-counter': '12',
+            # The index of fast already exists, its counter does not.
+            'ganesha-export-index-fast': '',
+        }
+        c = self._setup_assign_slots(
+            {'share-backends': '[{name: cephfsnfs1}, {name: fast}]'},
+            settings, objects)
+        self.assertEqual(c.assign_share_backend_slots(),
+                         {'cephfsnfs1': 0, 'fast': 1})
+        rados = ['rados', '-p', 'manila-ganesha', '--id', 'manila-ganesha']
+        self.check_call.assert_called_once_with(
+            rados + ['put', 'ganesha-export-counter-fast', mock.ANY])
+        self.assertEqual(objects['ganesha-export-counter-fast'], '10000')
+        self.leader_set.assert_called_once_with({
+            'share-backend-slots': '{"cephfsnfs1": 0, "fast": 1}',
+            'share-backend-slot0': 'cephfsnfs1'})
+        self.assertEqual(c.custom_assess_status_check(), (None, None))
+        self.leader_set.reset_mock()
+        self.is_leader.return_value = False
+        self.assertIsNone(c.assign_share_backend_slots())
+        self.leader_set.assert_not_called()
+
+    def test_assign_share_backend_slots_slot0_reuse(self):
+        settings = {'share-backend-slots': '{"cephfsnfs1": 0, "fast": 1}'}
+        objects = {
+            'ganesha-export-index': '%url rados://manila-ganesha/export-1\n',
+            'ganesha-export-counter': '1',
+            'ganesha-export-index-fast': '',
+            'ganesha-export-counter-fast': '10000',
+        }
+        c = self._setup_assign_slots(
+            {'share-backends': '[{name: new}, {name: fast}]'},
+            settings, objects)
+        # The shares of the removed cephfsnfs1 are not handed to new.
+        self.assertEqual(c.assign_share_backend_slots(),
+                         {'new': 2, 'fast': 1})
+        self.assertEqual(settings['share-backend-slot0'], 'cephfsnfs1')
+        self.assertEqual(objects['ganesha-export-index-new'], '')
+        self.assertEqual(objects['ganesha-export-counter-new'], '20000')
+        self.config.return_value = {
+            'share-backends': '[{name: new}, {name: fast}, '
+                              '{name: cephfsnfs1}]'}
+        self.assertEqual(c.assign_share_backend_slots(),
+                         {'new': 2, 'fast': 1, 'cephfsnfs1': 0})
+
+    def test_assign_share_backend_slots_readd(self):
+        settings = {'share-backend-slots': '{"cephfsnfs1": 0, "fast": 1}',
+                    'share-backend-slot0': 'cephfsnfs1'}
+        objects = {
+            'ganesha-export-counter': '3',
+            'ganesha-export-index-fast': '%url rados://p/export-10001\n',
+            'ganesha-export-counter-fast': '10001',
+        }
+        options = {'share-backends': '[{name: cephfsnfs1}]'}
+        c = self._setup_assign_slots(options, settings, objects)
+        self.assertEqual(c.assign_share_backend_slots(), {'cephfsnfs1': 0})
+        # Added back while its slot is free, fast keeps it and its counter.
+        options['share-backends'] = '[{name: cephfsnfs1}, {name: fast}]'
+        self.assertEqual(c.assign_share_backend_slots(),
+                         {'cephfsnfs1': 0, 'fast': 1})
+        self.assertEqual(objects['ganesha-export-counter-fast'], '10001')
+        self.check_call.assert_not_called()
+        # With its slot taken by other, fast can not keep the ids of its
+        # exports apart.
+        options['share-backends'] = '[{name: cephfsnfs1}, {name: other}]'
+        self.assertEqual(c.assign_share_backend_slots(),
+                         {'cephfsnfs1': 0, 'other': 1})
+        options['share-backends'] = (
+            '[{name: cephfsnfs1}, {name: other}, {name: fast}]')
+        self.assertEqual(c.assign_share_backend_slots(),
+                         {'cephfsnfs1': 0, 'other': 1})
+        self.assertEqual(c.share_backend_problems, [
+            'share backend fast has exports with the ids of slot 1, which '
+            'is taken'])
+        self.assertEqual(
+            c.custom_assess_status_check(),
+            ('blocked', 'Share backends: share backend fast has exports with '
+                        'the ids of slot 1, which is taken'))
+        # Without exports its counter is moved to a free slot.
+        objects['ganesha-export-index-fast'] = ''
+        self.assertEqual(c.assign_share_backend_slots(),
+                         {'cephfsnfs1': 0, 'other': 1, 'fast': 2})
+        self.assertEqual(objects['ganesha-export-counter-fast'], '20000')
+        self.assertEqual(c.share_backend_problems, [])
+
+    def test_assign_share_backend_slots_counter_out_of_range(self):
+        settings = {'share-backend-slots': '{"cephfsnfs1": 0, "fast": 1}',
+                    'share-backend-slot0': 'cephfsnfs1'}
+        objects = {
+            'ganesha-export-counter': '10000',
+            'ganesha-export-counter-fast': '10001',
+        }
+        c = self._setup_assign_slots(
+            {'share-backends': '[{name: cephfsnfs1}, {name: fast}]'},
+            settings, objects)
+        self.assertEqual(c.assign_share_backend_slots(),
+                         {'cephfsnfs1': 0, 'fast': 1})
+        self.assertEqual(c.share_backend_problems, [
+            'the export counter of share backend cephfsnfs1 is out of the '
+            'ids of its slot'])
+
+    def test_update_grace_membership(self):
+        self.patch_object(manila_ganesha, 'config')
+        self.patch_object(manila_ganesha.unitdata, 'kv')
+        self.kv.return_value = FakeKV()
+        self.patch_object(manila_ganesha, 'local_unit')
+        self.patch_object(manila_ganesha, 'is_leader')
+        self.patch_object(manila_ganesha, 'goal_state')
+        self.patch_object(manila_ganesha.ch_core.hookenv, 'application_name')
+        self.patch_object(manila_ganesha.subprocess, 'check_call')
+        self.config.return_value = {}
+        self.local_unit.return_value = 'manila-ganesha/0'
+        self.application_name.return_value = 'manila-ganesha'
+        self.goal_state.return_value = {
+            'units': {'manila-ganesha/0': {}, 'manila-ganesha/1': {}}}
+        c = manila_ganesha.ManilaGaneshaCharm()
+        self.patch_object(c, 'grace_status')
+        self.grace_status.return_value = {
+            'cur': 1, 'rec': 0,
+            'members': {'manila-ganesha-1': '', 'manila-ganesha-7': ''}}
+        self.is_leader.return_value = False
+        self.assertTrue(c.update_grace_membership())
+        self.check_call.assert_called_once_with(
+            ['ganesha-rados-grace', '--pool', 'manila-ganesha',
+             '--userid', 'manila-ganesha', 'add', 'manila-ganesha-0'])
+        self.check_call.reset_mock()
+        self.is_leader.return_value = True
+        self.grace_status.return_value['members']['manila-ganesha-0'] = ''
+        self.patch_object(manila_ganesha, 'log')
+        self.assertFalse(c.update_grace_membership())
+        self.check_call.assert_called_once_with(
+            ['ganesha-rados-grace', '--pool', 'manila-ganesha',
+             '--userid', 'manila-ganesha', 'remove', 'manila-ganesha-7'])
+
+    def test_export_ips(self):
+        self.patch_object(manila_ganesha, 'config')
+        self.patch_object(manila_ganesha.ch_net_ip, 'get_relation_ip')
+        self.patch_object(manila_ganesha, 'relation_ids')
+        self.patch_object(manila_ganesha, 'related_units')
+        self.patch_object(manila_ganesha, 'relation_get')
+        self.get_relation_ip.return_value = '10.0.0.2'
+        self.relation_ids.return_value = ['cluster:1']
+        self.related_units.return_value = ['manila-ganesha/1',
+                                           'manila-ganesha/2']
+        self.relation_get.side_effect = ['10.0.0.1', None]
+        self.config.return_value = {}
+        c = manila_ganesha.ManilaGaneshaCharm()
+        self.assertEqual(c.export_ips, [])
+        self.config.return_value = {'ganesha-active-active': True}
+        self.assertEqual(c.export_ips, ['10.0.0.1', '10.0.0.2'])
+        self.relation_get.assert_has_calls([
+            mock.call('ganesha-export-address', unit='manila-ganesha/1',
+                      rid='cluster:1'),
+            mock.call('ganesha-export-address', unit='manila-ganesha/2',
+                      rid='cluster:1'),
+        ])
+        self.relation_get.side_effect = ['10.0.0.1 fd00::1', None]
+        self.assertEqual(c.export_ips, ['10.0.0.1', '10.0.0.2', 'fd00::1'])
+
+    def test_access_ips(self):
+        self.patch_object(manila_ganesha, 'config')
+        self.patch_object(manila_ganesha, 'is_clustered')
+        self.patch_object(manila_ganesha, 'network_get')
+        self.patch_object(manila_ganesha.ch_net_ip, 'get_relation_ip')
+        self.patch_object(manila_ganesha.ManilaGaneshaCharm, 'access_ip',
+                          new_callable=mock.PropertyMock)
+        options = {}
+        self.config.return_value = options
+        self.is_clustered.return_value = False
+        self.network_get.return_value = {'bind-addresses': [
+            {'interface-name': 'bond0', 'addresses': [
+                {'address': '10.0.0.2', 'cidr': '10.0.0.0/24'},
+                {'address': 'fe80::2', 'cidr': 'fe80::/64'},
+                {'address': 'fd00::2', 'cidr': 'fd00::/64'}]},
+            {'interface-name': 'eth2', 'addresses': [
+                {'address': '10.1.0.2', 'cidr': '10.1.0.0/24'}]},
+        ]}
+        self.get_relation_ip.return_value = '10.0.0.2'
+        self.access_ip.return_value = '10.0.0.2'
+        c = manila_ganesha.ManilaGaneshaCharm()
+        self.assertEqual(c.access_ips, ['10.0.0.2'])
+        self.assertEqual(c.export_ips, [])
+        self.network_get.assert_not_called()
+        options['multiple-access-ips'] = True
+        self.assertEqual(c.access_ips, ['10.0.0.2', 'fd00::2', '10.1.0.2'])
+        self.assertEqual(c.export_ips, ['10.0.0.2', 'fd00::2', '10.1.0.2'])
+        self.network_get.assert_called_with('tenant-storage')
+        # Only the VIPs on the tenant-storage networks are used.
+        options['vip'] = '10.0.0.100 fd00::100 192.168.0.100'
+        self.is_clustered.return_value = True
+        self.access_ip.return_value = '10.0.0.100'
+        self.assertEqual(c.access_ips, ['10.0.0.100', 'fd00::100'])
+
+    def test_ceph_client_options(self):
+        self.patch_object(manila_ganesha, 'config')
+        self.patch_object(manila_ganesha, 'log')
+        options = {}
+        self.config.return_value = options
+        c = manila_ganesha.ManilaGaneshaCharm()
+        self.assertEqual(c.ceph_client_options, [])
+        options['ceph-client-profile'] = 'small-files'
+        options['ceph-client-options'] = (
+            '{client_oc: false, client_oc_max_dirty_age: 2.5, '
+            'client_cache_size: 1000}')
+        self.assertEqual(c._validate_ceph_client_options(), ([
+            ('client_cache_size', '1000'),
+            ('client_caps_release_delay', '10'),
+            ('client_oc', 'false'),
+            ('client_oc_max_dirty_age', '2.5'),
+            ('client_oc_max_objects', '10000'),
+            ('client_readahead_max_periods', '2'),
+        ], []))
+        # Invalid options fall back to the profile defaults.
+        options['ceph-client-profile'] = 'large-sequential'
+        options['ceph-client-options'] = (
+            '{client_oc: 1, client_cache_size: 0, client_foo: 1}')
+        pairs, errors = c._validate_ceph_client_options()
+        self.assertEqual(
+            pairs, c._format_ceph_client_options(
+                manila_ganesha.CEPH_CLIENT_PROFILES['large-sequential']))
+        self.assertEqual(errors, [
+            'ceph-client-options client_cache_size must be between 1 and '
+            '2147483647',
+            'unknown ceph-client-options key client_foo',
+            'ceph-client-options client_oc must be true or false'])
+        options['ceph-client-options'] = '{client_oc_size: 134217728}'
+        self.assertEqual(c._validate_ceph_client_options()[1], [
+            'ceph-client-options must keep client_oc_target_dirty <= '
+            'client_oc_max_dirty <= client_oc_size'])
+        options['ceph-client-options'] = '[client_oc]'
+        self.assertEqual(c._validate_ceph_client_options()[1],
+                         ['ceph-client-options must be a YAML mapping'])
+        options['ceph-client-profile'] = 'fast'
+        self.assertEqual(c.ceph_client_options, [])
+        self.log.assert_called()
+
+    def test_cache_profiles_table(self):
+        for name, profile in manila_ganesha.CACHE_PROFILES.items():
+            params = dict(profile['mdcache'])
+            self.assertEqual(len(params), len(profile['mdcache']), name)
+            for param, value in params.items():
+                minimum, maximum = manila_ganesha.MDCACHE_PARAM_RANGES[param]
+                self.assertTrue(minimum <= value <= maximum,
+                                '{}: {}={}'.format(name, param, value))
+            minimum, maximum = manila_ganesha.ATTR_EXPIRATION_TIME_RANGE
+            self.assertTrue(
+                minimum <= profile['attr_expiration_time'] <= maximum, name)
+            if params.get('Entries_HWMark') and params.get('Chunks_HWMark'):
+                self.assertLessEqual(params['Chunks_HWMark'],
+                                     params['Entries_HWMark'], name)
+        coherent = manila_ganesha.CACHE_PROFILES['coherent']
+        self.assertEqual(coherent['mdcache'], [('Dir_Chunk', 0)])
+        self.assertEqual(coherent['attr_expiration_time'], 0)
+
+    def test_cache_profile(self):
+        self.patch_object(manila_ganesha, 'config')
+        self.patch_object(manila_ganesha, 'leader_get')
+        self.leader_get.return_value = None
+        self.patch_object(manila_ganesha, 'cmp_pkgrevno')
+        self.cmp_pkgrevno.return_value = 1
+        c = manila_ganesha.ManilaGaneshaCharm()
+        self.config.return_value = {}
+        self.assertEqual(c.cache_profile,
+                         manila_ganesha.CACHE_PROFILES['coherent'])
+        self.config.return_value = {'cache-profile': 'read-mostly'}
+        self.assertEqual(c.cache_profile,
+                         manila_ganesha.CACHE_PROFILES['read-mostly'])
+        self.assertEqual(c.custom_assess_status_check(), (None, None))
+        self.config.return_value = {'cache-profile': 'bogus'}
+        self.assertEqual(c.cache_profile,
+                         manila_ganesha.CACHE_PROFILES['coherent'])
+        state, message = c.custom_assess_status_check()
+        self.assertEqual(state, 'blocked')
+        self.assertIn('cache-profile', message)
+
+    def test_export_defaults(self):
+        self.patch_object(manila_ganesha, 'config')
+        c = manila_ganesha.ManilaGaneshaCharm()
+        self.config.return_value = {}
+        self.assertEqual(c.export_defaults, [
+            ('Protocols', 4),
+            ('Transports', 'TCP'),
+            ('Attr_Expiration_Time', 0),
+        ])
+        self.config.return_value = {
+            'cache-profile': 'read-mostly',
+            'export-delegations': 'R',
+        }
+        self.assertEqual(c.export_defaults, [
+            ('Protocols', 4),
+            ('Transports', 'TCP'),
+            ('Attr_Expiration_Time', 60),
+            ('Delegations', 'R'),
+        ])
+        self.config.return_value = {
+            'cache-profile': 'read-mostly',
+            'export-attr-expiration-time': 5,
+            'export-delegations': 'R',
+            'ganesha-active-active': True,
+        }
+        self.assertEqual(c.export_defaults, [
+            ('Protocols', 4),
+            ('Transports', 'TCP'),
+            ('Attr_Expiration_Time', 5),
+        ])
+
+    def test_validate_export_defaults(self):
+        self.patch_object(manila_ganesha, 'config')
+        c = manila_ganesha.ManilaGaneshaCharm()
+        self.config.return_value = {
+            'export-attr-expiration-time': -1,
+            'export-delegations': 'R',
+        }
+        self.assertEqual(c._validate_export_defaults(), [])
+        self.config.return_value = {
+            'export-attr-expiration-time': -2,
+            'export-delegations': 'RW',
+        }
+        errors = c._validate_export_defaults()
+        self.assertEqual(len(errors), 2)
+        self.assertIn('export-attr-expiration-time', errors[0])
+        self.assertIn('export-delegations', errors[1])
+        self.config.return_value = {
+            'export-delegations': 'R',
+            'ganesha-active-active': True,
+        }
+        self.assertEqual(c._validate_export_defaults(), [
+            'export-delegations is not supported with ganesha-active-active'])
+
+    def test_watch_url(self):
+        self.patch_object(manila_ganesha, 'config')
+        self.patch_object(manila_ganesha, 'cmp_pkgrevno')
+        self.patch_object(manila_ganesha.ch_core.hookenv, 'application_name')
+        self.application_name.return_value = 'manila-ganesha'
+        self.cmp_pkgrevno.return_value = 0
+        c = manila_ganesha.ManilaGaneshaCharm()
+        self.config.return_value = {'ganesha-watch-exports': True}
+        self.assertEqual(c.watch_url,
+                         'rados://manila-ganesha/ganesha-export-index')
+        self.cmp_pkgrevno.assert_called_once_with('nfs-ganesha-ceph', '3.0')
+        self.cmp_pkgrevno.return_value = -1
+        self.assertIsNone(c.watch_url)
+        self.cmp_pkgrevno.return_value = 0
+        self.config.return_value = {'ganesha-watch-exports': False}
+        self.assertIsNone(c.watch_url)
+
+    def test_configure_export_watcher(self):
+        self.patch_object(manila_ganesha.ManilaGaneshaCharm, 'active_active',
+                          new_callable=mock.PropertyMock)
+        self.patch_object(manila_ganesha.ManilaGaneshaCharm, 'watch_url',
+                          new_callable=mock.PropertyMock)
+        self.patch_object(manila_ganesha.ManilaGaneshaCharm, 'share_backends',
+                          new_callable=mock.PropertyMock)
+        self.patch_object(manila_ganesha.ManilaGaneshaCharm,
+                          'ganesha_client_name',
+                          new_callable=mock.PropertyMock)
+        self.patch_object(manila_ganesha.ch_core.hookenv, 'application_name')
+        self.patch_object(manila_ganesha, 'install_export_watcher')
+        self.patch_object(manila_ganesha, 'remove_export_watcher')
+        self.application_name.return_value = 'manila-ganesha'
+        self.ganesha_client_name.return_value = 'manila-ganesha-0'
+        self.active_active.return_value = True
+        self.watch_url.return_value = (
+            'rados://manila-ganesha/ganesha-export-index')
+        self.share_backends.return_value = [
+            {'name': 'cephfsnfs1', 'export_index': 'ganesha-export-index'},
+            {'name': 'fast', 'export_index': 'ganesha-export-index-fast'},
+        ]
+        c = manila_ganesha.ManilaGaneshaCharm()
+        self.assertEqual(c.watched_export_indexes,
+                         ['ganesha-export-index-fast'])
+        c.configure_export_watcher()
+        self.install_export_watcher.assert_called_once_with(
+            'manila-ganesha', 'manila-ganesha-0',
+            ['ganesha-export-index-fast'])
+        self.remove_export_watcher.assert_not_called()
+        # Without peers serving the exports Ganesha is updated by manila.
+        self.install_export_watcher.reset_mock()
+        self.active_active.return_value = False
+        self.assertEqual(c.watched_export_indexes, [])
+        self.assertFalse(c.configure_export_watcher())
+        self.install_export_watcher.assert_not_called()
+        self.remove_export_watcher.assert_called_once_with()
+        self.active_active.return_value = True
+        self.watch_url.return_value = None
+        self.assertEqual(c.watched_export_indexes, [])
+
+    def test_ganesha_nfsv4_params(self):
+        self.patch_object(manila_ganesha, 'config')
+        self.patch_object(manila_ganesha, 'cmp_pkgrevno')
+        self.patch_object(manila_ganesha, 'log')
+        self.cmp_pkgrevno.return_value = 1
+        c = manila_ganesha.ManilaGaneshaCharm()
+        self.config.return_value = {}
+        self.assertEqual(c.ganesha_nfsv4_params, [])
+        self.config.return_value = {
+            'ganesha-lease-lifetime': 30,
+            'ganesha-grace-period': 40,
+        }
+        self.assertEqual(c.ganesha_nfsv4_params, [
+            ('Lease_Lifetime', 30),
+            ('Grace_Period', 40),
+        ])
+        self.log.assert_not_called()
+        # A grace period shorter than the (default) lease is rejected.
+        self.config.return_value = {'ganesha-grace-period': 40}
+        self.assertEqual(c.ganesha_nfsv4_params, [])
+        self.log.assert_called_once()
+        self.assertIn('grace period', c._validate_ganesha_nfsv4_params()[1][0])
+
+    def test_lift_grace(self):
+        self.patch_object(manila_ganesha, 'config')
+        self.patch_object(manila_ganesha.unitdata, 'kv')
+        self.kv.return_value = FakeKV()
+        self.patch_object(manila_ganesha.ch_core.hookenv, 'application_name')
+        self.patch_object(manila_ganesha.subprocess, 'check_call')
+        self.config.return_value = {}
+        self.application_name.return_value = 'manila-ganesha'
+        c = manila_ganesha.ManilaGaneshaCharm()
+        self.patch_object(c, 'grace_status')
+        self.patch_object(c, '_admin')
+        self.grace_status.return_value = {
+            'cur': 3, 'rec': 2,
+            'members': {'manila-ganesha-0': 'NE', 'manila-ganesha-1': 'E',
+                        'manila-ganesha-2': 'N'}}
+        self._admin.return_value = {'unreclaimed': {
+            'manila-ganesha-0': [], 'manila-ganesha-1': ['10.0.0.8'],
+            'manila-ganesha-2': ['10.0.0.5', '10.0.0.7']}}
+        # Clients of a flagged node are yet to reclaim.
+        with self.assertRaises(RuntimeError) as cm:
+            c.lift_grace()
+        self.assertIn('manila-ganesha-2: 10.0.0.5, 10.0.0.7',
+                      str(cm.exception))
+        self.assertNotIn('manila-ganesha-1', str(cm.exception))
+        self._admin.assert_called_once_with(
+            'reclaim', '--current-epoch', '3', '--recovery-epoch', '2')
+        self.check_call.assert_not_called()
+        self.assertEqual(c.lift_grace(force=True),
+                         ['manila-ganesha-0', 'manila-ganesha-2'])
+        self.check_call.assert_called_once_with(
+            ['ganesha-rados-grace', '--pool', 'manila-ganesha',
+             '--userid', 'manila-ganesha', 'lift', 'manila-ganesha-0',
+             'manila-ganesha-2'])
+        self.check_call.reset_mock()
+        self._admin.return_value['unreclaimed']['manila-ganesha-2'] = []
+        self.assertEqual(c.lift_grace(),
+                         ['manila-ganesha-0', 'manila-ganesha-2'])
+        self.check_call.assert_called_once()
+        self.check_call.reset_mock()
+        self._admin.reset_mock()
+        self.assertEqual(c.lift_grace(['manila-ganesha-1']),
+                         ['manila-ganesha-1'])
+        self.check_call.assert_called_once()
+        self._admin.assert_not_called()
+        self.check_call.reset_mock()
+        with self.assertRaises(ValueError):
+            c.lift_grace(['manila-ganesha-9'])
+        self.check_call.assert_not_called()
+
+
+class FakeKV(dict):
+
+    flushed = None
+
+    def set(self, key, value):
+        self[key] = value
+
+    def flush(self):
+        self.flushed = dict(self)
+
+    def unset(self, key):
+        self.pop(key, None)
+
+
+class TestManilaGaneshaCharmRender(Helper):
+
+    def setUp(self):
+        super().setUp()
+        self.patch_object(manila_ganesha.unitdata, 'kv', name='unitdata_kv')
+        self.kv = FakeKV()
+        self.unitdata_kv.return_value = self.kv
+        self.patch_object(manila_ganesha, 'atexit')
+        self.patch_object(manila_ganesha.ManilaGaneshaCharm,
+                          '_restarts_scheduled', new=False)
+
+    def test_render_with_interfaces(self):
+        self.patch_object(manila_ganesha.ch_templating, 'render')
+        self.patch_object(manila_ganesha.os_templating, 'get_loader')
+        self.patch_object(manila_ganesha, 'mkdir')
+        self.patch_object(manila_ganesha, 'write_file')
+        self.patch('os.path.isdir', name='os_path_isdir')
+        self.patch_object(manila_ganesha.ManilaGaneshaCharm,
+                          'endpoint_services',
+                          new_callable=mock.PropertyMock)
+        self.os_path_isdir.return_value = True
+        self.endpoint_services.return_value = []
+        c = manila_ganesha.ManilaGaneshaCharm()
+        self.patch_object(c, 'adapters_class')
+        self.patch_object(c, '_read_file')
+        self.render.side_effect = lambda source, **kwargs: source
+        files = {
+            manila_ganesha.GANESHA_CONF: b'ganesha.conf',
+            manila_ganesha.MANILA_CONF: b'old',
+        }
+        self._read_file.side_effect = files.get
+        self.kv[manila_ganesha.APPLIED_HASHES_KEY] = {
+            manila_ganesha.GANESHA_CONF: c._content_hash(b'ganesha.conf'),
+            manila_ganesha.MANILA_CONF: c._content_hash(b'old'),
+        }
+        changed = c.render_with_interfaces(
+            ['ep'], configs=[manila_ganesha.GANESHA_CONF,
+                             manila_ganesha.MANILA_CONF,
+                             manila_ganesha.MANILA_LOGGING_CONF])
+        self.assertEqual(changed, [manila_ganesha.MANILA_CONF,
+                                   manila_ganesha.MANILA_LOGGING_CONF])
+        self.write_file.assert_has_calls([
+            mock.call(manila_ganesha.MANILA_CONF, b'manila.conf',
+                      owner='root', group=c.group, perms=0o640),
+            mock.call(manila_ganesha.MANILA_LOGGING_CONF, b'logging.conf',
+                      owner='root', group=c.group, perms=0o640),
+        ])
+        self.assertEqual(self.kv[manila_ganesha.PENDING_RESTARTS_KEY],
+                         ['manila-share'])
+        self.assertNotIn(manila_ganesha.PENDING_RELOADS_KEY, self.kv)
+        self.atexit.assert_called_once_with(c.run_pending_restarts)
+        # Files without services are applied as soon as they are written.
+        self.assertEqual(self.kv[manila_ganesha.APPLIED_HASHES_KEY], {
+            manila_ganesha.GANESHA_CONF: c._content_hash(b'ganesha.conf'),
+            manila_ganesha.MANILA_CONF: c._content_hash(b'old'),
+            manila_ganesha.MANILA_LOGGING_CONF: c._content_hash(
+                b'logging.conf'),
+        })
+        self.assertEqual(self.kv[manila_ganesha.PENDING_HASHES_KEY], {
+            manila_ganesha.MANILA_CONF: c._content_hash(b'manila.conf'),
+        })
+
+    def _setup_render(self, files):
+        self.patch_object(manila_ganesha.ch_templating, 'render')
+        self.patch_object(manila_ganesha.os_templating, 'get_loader')
+        self.patch_object(manila_ganesha, 'write_file')
+        self.patch_object(manila_ganesha.ch_os_utils, 'is_unit_paused_set')
+        self.patch('os.path.isdir', name='os_path_isdir')
+        self.patch_object(manila_ganesha.ManilaGaneshaCharm,
+                          'endpoint_services',
+                          new_callable=mock.PropertyMock)
+        self.os_path_isdir.return_value = True
+        self.is_unit_paused_set.return_value = False
+        self.endpoint_services.return_value = []
+        self.write_file.side_effect = (
+            lambda path, content, **kwargs: files.update({path: content}))
+        c = manila_ganesha.ManilaGaneshaCharm()
+        self.patch_object(c, 'adapters_class')
+        self.patch_object(c, '_read_file')
+        self.patch_object(c, 'service_restart')
+        self._read_file.side_effect = files.get
+        return c
+
+    def test_render_with_interfaces_failed_hook(self):
+        files = {manila_ganesha.MANILA_CONF: b'old'}
+        c = self._setup_render(files)
+        self.kv[manila_ganesha.APPLIED_HASHES_KEY] = {
+            manila_ganesha.MANILA_CONF: c._content_hash(b'old')}
+        before = dict(self.kv)
+        self.render.return_value = 'new'
+        configs = [manila_ganesha.MANILA_CONF]
+        self.assertEqual(c.render_with_interfaces(['ep'], configs=configs),
+                         configs)
+        self.assertEqual(c.pending_restarts, ['manila-share'])
+        # A later handler fails: unitdata is not flushed and the restarts
+        # registered at exit are not run, but the file stays written.
+        self.kv.clear()
+        self.kv.update(before)
+        manila_ganesha.ManilaGaneshaCharm._restarts_scheduled = False
+        self.atexit.reset_mock()
+        self.assertEqual(c.render_with_interfaces(['ep'], configs=configs),
+                         [])
+        self.assertEqual(c.pending_restarts, ['manila-share'])
+        self.atexit.assert_called_once_with(c.run_pending_restarts)
+        c.run_pending_restarts()
+        self.service_restart.assert_called_once_with('manila-share')
+        self.assertEqual(
+            self.kv[manila_ganesha.APPLIED_HASHES_KEY],
+            {manila_ganesha.MANILA_CONF: c._content_hash(b'new')})
+        self.assertNotIn(manila_ganesha.PENDING_HASHES_KEY, self.kv)
+        c.render_with_interfaces(['ep'], configs=configs)
+        self.assertEqual(c.pending_restarts, [])
+
+    def test_run_pending_restarts_failing(self):
+        files = {manila_ganesha.MANILA_CONF: b'old'}
+        c = self._setup_render(files)
+        self.kv[manila_ganesha.APPLIED_HASHES_KEY] = {
+            manila_ganesha.MANILA_CONF: c._content_hash(b'old')}
+        self.render.return_value = 'new'
+        c.render_with_interfaces(['ep'],
+                                 configs=[manila_ganesha.MANILA_CONF])
+        self.service_restart.side_effect = Exception('crm failed')
+        with self.assertRaises(Exception):
+            c.run_pending_restarts()
+        self.assertEqual(
+            self.kv[manila_ganesha.APPLIED_HASHES_KEY],
+            {manila_ganesha.MANILA_CONF: c._content_hash(b'old')})
+        # Queues left in unitdata do not stop the next hook from
+        # registering the restarts.
+        self.kv[manila_ganesha.PENDING_RESTARTS_KEY] = ['manila-share']
+        self.atexit.reset_mock()
+        c.queue_restarts(['nfs-ganesha'])
+        self.atexit.assert_called_once_with(c.run_pending_restarts)
+        self.assertEqual(c.pending_restarts, ['manila-share', 'nfs-ganesha'])
+
+    def test_record_applied_hashes(self):
+        files = {manila_ganesha.GANESHA_CONF: b'ganesha.conf'}
+        c = self._setup_render(files)
+        c.record_applied_hashes()
+        self.assertEqual(
+            self.kv[manila_ganesha.APPLIED_HASHES_KEY],
+            {manila_ganesha.GANESHA_CONF: c._content_hash(b'ganesha.conf')})
+        files[manila_ganesha.GANESHA_CONF] = b'new'
+        c.record_applied_hashes()
+        self.assertEqual(
+            self.kv[manila_ganesha.APPLIED_HASHES_KEY],
+            {manila_ganesha.GANESHA_CONF: c._content_hash(b'ganesha.conf')})
+
+    def test_render_with_interfaces_reload(self):
+        self.patch_object(manila_ganesha.ch_templating, 'render')
+        self.patch_object(manila_ganesha.os_templating, 'get_loader')
+        self.patch_object(manila_ganesha, 'write_file')
+        self.patch('os.path.isdir', name='os_path_isdir')
+        self.patch_object(manila_ganesha.ManilaGaneshaCharm,
+                          'endpoint_services',
+                          new_callable=mock.PropertyMock)
+        self.os_path_isdir.return_value = True
+        self.endpoint_services.return_value = []
+        c = manila_ganesha.ManilaGaneshaCharm()
+        self.patch_object(c, 'adapters_class')
+        self.patch_object(c, '_read_file')
+        self._read_file.return_value = (
+            b'NFSv4 { Grace_Period = 90; }\n'
+            b'EXPORT_DEFAULTS { Attr_Expiration_Time = 0; }\n')
+        self.kv[manila_ganesha.APPLIED_HASHES_KEY] = {
+            manila_ganesha.GANESHA_CONF: c._content_hash(
+                self._read_file.return_value)}
+        self.render.return_value = (
+            'NFSv4 { Grace_Period = 90; }\n'
+            'EXPORT_DEFAULTS { Attr_Expiration_Time = 60; }\n')
+        c.render_with_interfaces(['ep'],
+                                 configs=[manila_ganesha.GANESHA_CONF])
+        self.assertNotIn(manila_ganesha.PENDING_RESTARTS_KEY, self.kv)
+        self.assertEqual(self.kv[manila_ganesha.PENDING_RELOADS_KEY],
+                         ['nfs-ganesha'])
+        self.render.return_value = (
+            'NFSv4 { Grace_Period = 40; }\n'
+            'EXPORT_DEFAULTS { Attr_Expiration_Time = 60; }\n')
+        c.render_with_interfaces(['ep'],
+                                 configs=[manila_ganesha.GANESHA_CONF])
+        self.assertEqual(self.kv[manila_ganesha.PENDING_RESTARTS_KEY],
+                         ['nfs-ganesha'])
+
+    def test_publish_ganesha_config(self):
+        self.patch_object(manila_ganesha, 'config')
+        self.patch_object(manila_ganesha, 'is_leader')
+        self.patch_object(manila_ganesha, 'leader_get')
+        self.patch_object(manila_ganesha, 'leader_set')
+        self.patch_object(manila_ganesha.ch_core.hookenv, 'application_name')
+        self.patch_object(manila_ganesha.subprocess, 'check_call')
+        self.patch_object(manila_ganesha.ManilaGaneshaCharm, 'watch_url',
+                          new_callable=mock.PropertyMock)
+        self.patch_object(manila_ganesha.ManilaGaneshaCharm,
+                          'render_ganesha_core')
+        self.config.return_value = {'ganesha-shared-config': True}
+        self.is_leader.return_value = True
+        self.leader_get.return_value = None
+        self.application_name.return_value = 'manila-ganesha'
+        self.watch_url.return_value = (
+            'rados://manila-ganesha/ganesha-export-index')
+        content = 'NFSv4 { Grace_Period = 90; }\nMDCACHE { Dir_Chunk = 0; }\n'
+        self.render_ganesha_core.return_value = content
+        c = manila_ganesha.ManilaGaneshaCharm()
+        self.assertTrue(c.publish_ganesha_config())
+        rados = ['rados', '-p', 'manila-ganesha', '--id', 'manila-ganesha']
+        self.check_call.assert_has_calls([
+            mock.call(rados + ['put', 'ganesha-config', mock.ANY]),
+            mock.call(rados + ['notify', 'ganesha-export-index',
+                               'ganesha-config']),
+        ])
+        digest = c._content_hash(content.encode())
+        self.leader_set.assert_called_once_with({
+            'ganesha-config-hash': digest,
+            'ganesha-config-fixed-hash': mock.ANY,
+        })
+        self.check_call.reset_mock()
+        self.leader_get.return_value = digest
+        self.assertFalse(c.publish_ganesha_config())
+        self.check_call.assert_not_called()
+        self.is_leader.return_value = False
+        self.leader_get.return_value = None
+        self.assertFalse(c.publish_ganesha_config())
+        self.check_call.assert_not_called()
+
+    def test_apply_ganesha_config(self):
+        self.patch_object(manila_ganesha, 'leader_get')
+        self.patch_object(manila_ganesha.ManilaGaneshaCharm,
+                          'ganesha_config_url',
+                          new_callable=mock.PropertyMock)
+        self.patch_object(manila_ganesha.ManilaGaneshaCharm, 'watch_url',
+                          new_callable=mock.PropertyMock)
+        settings = {'ganesha-config-hash': 'a',
+                    'ganesha-config-fixed-hash': 'f'}
+        self.leader_get.side_effect = settings.get
+        self.ganesha_config_url.return_value = None
+        self.watch_url.return_value = None
+        c = manila_ganesha.ManilaGaneshaCharm()
+        self.assertIsNone(c.apply_ganesha_config())
+        self.ganesha_config_url.return_value = (
+            'rados://manila-ganesha/ganesha-config')
+        # The first config comes with the ganesha.conf change.
+        self.assertEqual(c.apply_ganesha_config(), ['a', 'f'])
+        self.assertNotIn(manila_ganesha.PENDING_RESTARTS_KEY, self.kv)
+        self.assertNotIn(manila_ganesha.PENDING_RELOADS_KEY, self.kv)
+        settings['ganesha-config-hash'] = 'b'
+        self.assertEqual(c.apply_ganesha_config(), ['b', 'f'])
+        self.assertEqual(self.kv[manila_ganesha.PENDING_RELOADS_KEY],
+                         ['nfs-ganesha'])
+        self.assertNotIn(manila_ganesha.PENDING_RESTARTS_KEY, self.kv)
+        settings['ganesha-config-fixed-hash'] = 'g'
+        c.apply_ganesha_config()
+        self.assertEqual(self.kv[manila_ganesha.PENDING_RESTARTS_KEY],
+                         ['nfs-ganesha'])
+
+    def test_queue_and_run_pending_restarts(self):
+        self.patch_object(manila_ganesha.ch_os_utils, 'is_unit_paused_set')
+        self.is_unit_paused_set.return_value = False
+        c = manila_ganesha.ManilaGaneshaCharm()
+        self.patch_object(c, 'service_restart')
+        c.queue_restarts(['manila-share'])
+        c.queue_restarts(['nfs-ganesha', 'manila-share', 'nfs-ganesha'])
+        c.queue_restarts([])
+        self.atexit.assert_called_once_with(c.run_pending_restarts)
+        self.assertEqual(c.pending_restarts, ['manila-share', 'nfs-ganesha'])
+        c.run_pending_restarts()
+        self.service_restart.assert_has_calls([
+            mock.call('manila-share'),
+            mock.call('nfs-ganesha'),
+        ])
+        self.assertEqual(self.service_restart.call_count, 2)
+        self.assertEqual(c.pending_restarts, [])
+
+    def test_run_pending_restarts_with_reloads(self):
+        self.patch_object(manila_ganesha.ch_os_utils, 'is_unit_paused_set')
+        self.is_unit_paused_set.return_value = False
+        c = manila_ganesha.ManilaGaneshaCharm()
+        self.patch_object(c, 'service_restart')
+        self.patch_object(c, 'service_reload')
+        c.queue_reloads(['nfs-ganesha'])
+        c.queue_restarts(['manila-share'])
+        self.atexit.assert_called_once_with(c.run_pending_restarts)
+        c.run_pending_restarts()
+        self.service_restart.assert_called_once_with('manila-share')
+        self.service_reload.assert_called_once_with('nfs-ganesha')
+        self.service_reload.reset_mock()
+        self.service_restart.reset_mock()
+        c.queue_reloads(['nfs-ganesha'])
+        c.queue_restarts(['nfs-ganesha'])
+        c.run_pending_restarts()
+        self.service_restart.assert_called_once_with('nfs-ganesha')
+        self.service_reload.assert_not_called()
+
+    def test_service_reload(self):
+        self.patch_object(manila_ganesha, 'peer_units')
+        self.patch_object(manila_ganesha.ManilaGaneshaCharm,
+                          'endpoint_services',
+                          new_callable=mock.PropertyMock)
+        self.endpoint_services.return_value = []
+        self.patch_object(manila_ganesha.ch_core.host, 'service_running')
+        self.patch_object(manila_ganesha.ch_core.host, 'service_reload')
+        c = manila_ganesha.ManilaGaneshaCharm()
+        self.peer_units.return_value = []
+        c.service_reload('nfs-ganesha')
+        self.service_reload.assert_called_once_with('nfs-ganesha')
+        self.service_reload.reset_mock()
+        self.peer_units.return_value = ['manila-ganesha/1']
+        self.service_running.return_value = False
+        c.service_reload('nfs-ganesha')
+        self.service_reload.assert_not_called()
+        self.service_running.return_value = True
+        c.service_reload('nfs-ganesha')
+        self.service_reload.assert_called_once_with('nfs-ganesha')
+
+    def test_run_pending_restarts_paused(self):
+        self.patch_object(manila_ganesha.ch_os_utils, 'is_unit_paused_set')
+        self.is_unit_paused_set.return_value = True
+        c = manila_ganesha.ManilaGaneshaCharm()
+        self.patch_object(c, 'service_restart')
+        c.queue_restarts(['nfs-ganesha'])
+        c.run_pending_restarts()
+        self.service_restart.assert_not_called()
+        self.assertEqual(c.pending_restarts, [])
+
+    def test_run_pending_restarts_deferred(self):
+        self.patch_object(manila_ganesha.ch_os_utils, 'is_unit_paused_set')
+        self.patch_object(manila_ganesha, 'config')
+        self.is_unit_paused_set.return_value = False
+        self.config.return_value = {'enable-auto-restarts': False}
+        c = manila_ganesha.ManilaGaneshaCharm()
+        self.patch_object(c, 'service_restart')
+        self.patch_object(c, 'service_reload')
+        self.assertEqual(c.custom_assess_status_last_check(), (None, None))
+        c.queue_restarts(['nfs-ganesha'])
+        c.queue_reloads(['nfs-ganesha'])
+        c.run_pending_restarts()
+        c.queue_restarts(['manila-share', 'nfs-ganesha'])
+        c.run_pending_restarts()
+        self.service_restart.assert_not_called()
+        self.service_reload.assert_not_called()
+        self.assertEqual(c.deferred_restarts, ['nfs-ganesha', 'manila-share'])
+        self.assertEqual(
+            c.custom_assess_status_last_check(),
+            ('active', 'Unit is ready. Services queued for restart: '
+                       'nfs-ganesha, manila-share'))
+        c.queue_reloads(['nfs-ganesha'])
+        c.run_pending_restarts()
+        self.service_reload.assert_called_once_with('nfs-ganesha')
+        self.assertEqual(c.run_deferred_restarts(),
+                         ['nfs-ganesha', 'manila-share'])
+        self.service_restart.assert_has_calls([
+            mock.call('nfs-ganesha'),
+            mock.call('manila-share'),
+        ])
+        self.assertEqual(c.deferred_restarts, [])
+        # Actions do not flush unitdata on exit.
+        self.assertNotIn(manila_ganesha.DEFERRED_RESTARTS_KEY,
+                         self.kv.flushed)
+
+    def test_configure_ceph_keyring_unchanged(self):
+        self.patch_object(manila_ganesha.ch_core.hookenv, 'application_name')
+        self.patch('os.path.exists', name='os_path_exists')
+        self.application_name.return_value = 'manila-ganesha'
+        self.os_path_exists.return_value = True
+        c = manila_ganesha.ManilaGaneshaCharm()
+        self.kv[manila_ganesha.CEPH_KEY_HASH_KEY] = c._content_hash(b'key')
+        self.assertEqual(
+            c.configure_ceph_keyring('key'),
+            '/etc/ceph/ceph.client.manila-ganesha.keyring')
+
+
+class TestGaneshaConf(test_utils.PatchHelper):
+
+    CONF = """
+# A comment
+NFS_CORE_PARAM
+{
+    Protocols = 4;  # trailing comment
+}
+
+EXPORT_DEFAULTS { Attr_Expiration_Time = 0; }
+
+EXPORT
+{
+    Export_ID=100;
+    FSAL {
+        Name = CEPH;
+    }
+}
+
+%url rados://manila-ganesha/ganesha-export-index
+"""
+
+    def test_ganesha_conf_blocks(self):
+        self.assertEqual(manila_ganesha.ganesha_conf_blocks(self.CONF), [
+            ('NFS_CORE_PARAM', 'NFS_CORE_PARAM { Protocols = 4; }'),
+            ('EXPORT_DEFAULTS',
+             'EXPORT_DEFAULTS { Attr_Expiration_Time = 0; }'),
+            ('EXPORT', 'EXPORT { Export_ID=100; FSAL { Name = CEPH; } }'),
+            ('%url', '%url rados://manila-ganesha/ganesha-export-index'),
+        ])
+
+    def test_ganesha_conf_reloadable(self):
+        self.assertTrue(manila_ganesha.ganesha_conf_reloadable(
+            self.CONF, self.CONF.replace('# A comment', '')))
+        self.assertTrue(manila_ganesha.ganesha_conf_reloadable(
+            self.CONF, self.CONF.replace('Expiration_Time = 0',
+                                         'Expiration_Time = 60')))
+        self.assertFalse(manila_ganesha.ganesha_conf_reloadable(
+            self.CONF, self.CONF.replace('Protocols = 4', 'Protocols = 3')))
+        self.assertFalse(manila_ganesha.ganesha_conf_reloadable(
+            self.CONF, self.CONF.replace('%url', '# %url')))
+
+
+class TestWriteFileAtomic(test_utils.PatchHelper):
+
+    def test_write_file_atomic(self):
+        self.patch('pwd.getpwnam', name='getpwnam')
+        self.patch('grp.getgrnam', name='getgrnam')
+        self.patch('os.fchown', name='fchown')
+        self.getpwnam.return_value.pw_uid = 0
+        self.getgrnam.return_value.gr_gid = 0
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'cert.crt')
+            with open(path, 'wb') as f:
+                f.write(b'old')
+            manila_ganesha.write_file_atomic(path, b'new', owner='manila',
+                                             group='manila', perms=0o640)
+            with open(path, 'rb') as f:
+                self.assertEqual(f.read(), b'new')
+            self.assertEqual(os.stat(path).st_mode & 0o777, 0o640)
+            self.assertEqual(os.listdir(tmpdir), ['cert.crt'])
+        self.getpwnam.assert_called_once_with('manila')
+        self.getgrnam.assert_called_once_with('manila')
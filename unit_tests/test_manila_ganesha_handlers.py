@@ -36,6 +36,8 @@ class TestRegisteredHooks(test_utils.TestRegisteredHooks):
         hook_set = {
             'when': {
                 'ceph_connected': ('ceph.connected',),
+                'ceph_pools_changed': ('ceph.connected',
+                                       'ganesha-pool-configured',),
                 'setup_manila': ('manila-plugin.available',),
                 'configure_ident_username': ('identity-service.connected',),
                 'render_things': ('ceph.available',
@@ -49,12 +51,25 @@ class TestRegisteredHooks(test_utils.TestRegisteredHooks):
                 'enable_services_in_non_ha': ('config.rendered',
                                               'ganesha-pool-configured',),
                 'disable_services': ('cluster.connected',),
+                'update_grace_db': ('config.rendered',
+                                    'ganesha-pool-configured',),
+                'assign_share_backends': ('ganesha-pool-configured',),
+                'configure_export_watcher': ('config.rendered',
+                                             'ganesha-pool-configured',),
+                'share_ganesha_config': ('config.rendered',
+                                         'ganesha-pool-configured',),
+                'active_active_changed': (
+                    'config.changed.ganesha-active-active',),
+                'publish_export_address': ('cluster.connected',),
                 'configure_nrpe': ('nrpe-external-master.available',),
                 'update_ident_username': ('config.changed.service-user',
                                           'identity-service.connected',),
                 'install_root_ca_cert': ('certificates.ca.available',),
                 'set_client_cert_request': ('certificates.available',),
                 'update_client_cert': ('certificates.certs.available',),
+                'configure_prometheus_target': (
+                    'prometheus-target.available',),
+                'remove_prometheus_exporter': ('ganesha-exporter.installed',),
             },
             'when_not': {
                 'ceph_connected': ('ganesha-pool-configured',),
@@ -64,12 +79,27 @@ class TestRegisteredHooks(test_utils.TestRegisteredHooks):
                                               'services-started',),
                 'cluster_connected': ('ha-resources-exposed',),
                 'disable_services': ('services-disabled',),
+                'update_grace_db': ('ganesha-grace-db-updated',),
                 'remove_nrpe': ('nrpe-external-master.available',),
+                'remove_prometheus_exporter': ('prometheus-target.available',),
             },
             'when_all': {
                 'configure_ganesha': ('config.rendered',
                                       'ceph.pools.available',),
             },
+            'when_any': {
+                'ceph_pools_changed': (
+                    'config.changed.ceph-pool-replicas',
+                    'config.changed.ceph-pool-weight',
+                    'config.changed.ceph-pool-crush-rule',
+                    'config.changed.ceph-pool-app-name',
+                    'config.changed.recovery-pool',
+                    'config.changed.recovery-pool-crush-rule',),
+            },
+            'hook': {
+                'cluster_departed': ('cluster-relation-departed',),
+                'leave_grace_db': ('stop',),
+            },
         }
         # test that the hooks were registered via the
         # reactive.manila_ganesha_handlers
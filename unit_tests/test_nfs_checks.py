@@ -0,0 +1,389 @@
+# Copyright 2026 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import copy
+import json
+import os
+import socket
+import socketserver
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from unit_tests.utils import FakeBus, FakeStore, TIMESTAMP, load_script
+
+collect_nfs_checks = load_script('collect_nfs_checks',
+                                 'src/files/plugins/collect_nfs_checks')
+check_nfs_cached = load_script('check_nfs_cached',
+                               'src/files/plugins/check_nfs_cached')
+
+RPCINFO = b"""   program version netid     address            service    owner
+    100000    4    tcp6      ::.0.111           portmapper superuser
+    100003    3    tcp       0.0.0.0.8.1        nfs        superuser
+    100005    3    tcp       0.0.0.0.78.80      mountd     superuser
+"""
+
+INDEX = (
+    '%url "rados://manila-ganesha/ganesha-export-1"\n'
+    '%url "rados://manila-ganesha/ganesha-export-2"\n')
+
+
+def export_object(export_id, path):
+    return ('EXPORT {\n    Export_Id = %d;\n    Path = "%s";\n'
+            '    FSAL {\n        Name = "Ceph";\n    }\n}\n' % (
+                export_id, path))
+
+
+FS_DUMP = {
+    'default_fscid': 1,
+    'filesystems': [
+        {'id': 1, 'mdsmap': {'fs_name': 'cephfs', 'info': {
+            'gid_4100': {'name': 'mds-a', 'state': 'up:active'},
+            'gid_4200': {'name': 'mds-b', 'state': 'up:standby-replay',
+                         'laggy_since': '2026-10-18T10:00:00'},
+        }}},
+        {'id': 2, 'mdsmap': {'fs_name': 'other', 'info': {}}},
+    ],
+}
+
+
+class FakeRPCHandler(socketserver.BaseRequestHandler):
+    """Answer RPC calls like an NFS server, after server.delay seconds."""
+
+    def handle(self):
+        while True:
+            marker = self.request.recv(4)
+            if not marker:
+                return
+            size, = struct.unpack('>I', marker)
+            call = self.request.recv(size & 0x7fffffff)
+            xid, _, _, program, _, _ = struct.unpack('>6I', call[:24])
+            accept_stat = 0 if program == 100003 else 1
+            time.sleep(self.server.delay)
+            reply = struct.pack('>6I', xid, 1, 0, 0, 0, accept_stat)
+            self.request.sendall(
+                struct.pack('>I', 0x80000000 | len(reply)) + reply)
+
+
+class FakeRPCServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, delay=0.0):
+        super().__init__(('127.0.0.1', 0), FakeRPCHandler)
+        self.delay = delay
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
+
+
+class TestCollectNfsChecks(unittest.TestCase):
+
+    def test_check_nfs_null_latency(self):
+        with FakeRPCServer() as server:
+            status, message = collect_nfs_checks.check_nfs_null_latency(
+                '127.0.0.1', server.server_address[1], samples=5)
+        self.assertEqual(status, 0, message)
+        self.assertRegex(message, r'^NULL RPC latency p50 [\d.]+ms p99 '
+                                  r'[\d.]+ms over 5 calls to 127.0.0.1:')
+
+    def test_check_nfs_null_latency_slow(self):
+        with FakeRPCServer(delay=0.05) as server:
+            status, _ = collect_nfs_checks.check_nfs_null_latency(
+                '127.0.0.1', server.server_address[1], samples=3,
+                p50='10,1000', p99='1000,2000')
+            self.assertEqual(status, 1)
+            status, _ = collect_nfs_checks.check_nfs_null_latency(
+                '127.0.0.1', server.server_address[1], samples=3,
+                p50='1,5', p99='1000,2000')
+            self.assertEqual(status, 2)
+
+    def test_check_nfs_null_latency_not_accepted(self):
+        with FakeRPCServer() as server:
+            with socket.create_connection(
+                    server.server_address) as sock:
+                with self.assertRaises(collect_nfs_checks.RPCError):
+                    collect_nfs_checks.rpc_null(sock, 1, program=100005)
+
+    def test_check_nfs_null_latency_refused(self):
+        with FakeRPCServer() as server:
+            port = server.server_address[1]
+        status, message = collect_nfs_checks.check_nfs_null_latency(
+            '127.0.0.1', port)
+        self.assertEqual(status, 2)
+        self.assertIn('NULL RPC to 127.0.0.1:{} failed'.format(port),
+                      message)
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(collect_nfs_checks.percentile(values, 0.5), 50)
+        self.assertEqual(collect_nfs_checks.percentile(values, 0.99), 99)
+        self.assertEqual(collect_nfs_checks.percentile([7], 0.99), 7)
+
+    @mock.patch.object(collect_nfs_checks.subprocess, 'check_output')
+    def test_check_nfs_services(self, check_output):
+        check_output.return_value = RPCINFO
+        self.assertEqual(
+            collect_nfs_checks.check_nfs_services(),
+            (2, 'RPC processes nfs v4 not running which are required by '
+                'NFS.'))
+        check_output.assert_called_once_with(
+            ['/usr/sbin/rpcinfo'], stderr=subprocess.STDOUT, timeout=10)
+        check_output.return_value = RPCINFO.replace(b'    3    tcp  ',
+                                                    b'    4    tcp  ')
+        self.assertEqual(
+            collect_nfs_checks.check_nfs_services(),
+            (0, 'All RPC processes needed by NFS are running.'))
+
+    def test_check_nfs_exports(self):
+        store = FakeStore({
+            'ganesha-export-index': INDEX,
+            'ganesha-export-1': export_object(1, '/volumes/_nogroup/a'),
+            'ganesha-export-2': export_object(2, '/volumes/_nogroup/b'),
+        })
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache = os.path.join(tmpdir, 'nfs_exports.json')
+
+            def check(served):
+                return collect_nfs_checks.check_nfs_exports(
+                    lambda: store, lambda: FakeBus({
+                        (collect_nfs_checks.EXPORT_MGR, 'ShowExports'): (
+                            TIMESTAMP, served)}),
+                    ['ganesha-export-index'], cache)
+
+            self.assertEqual(
+                check([(0, '/'), (1, '/volumes/_nogroup/a'),
+                       (2, '/volumes/_nogroup/b')]),
+                (0, 'All 2 exports in ganesha-export-index are served.'))
+            self.assertEqual(store.reads, ['ganesha-export-index',
+                                           'ganesha-export-1',
+                                           'ganesha-export-2'])
+            self.assertTrue(store.closed)
+            self.assertEqual(
+                check([(1, '/volumes/_nogroup/a')]),
+                (2, '1 of 2 exports in ganesha-export-index are not '
+                    'served: export ids 2.'))
+            # The unchanged index is not read again.
+            self.assertEqual(len(store.reads), 3)
+
+            # Only the new export object is read.
+            store.objects['ganesha-export-index'] = INDEX + (
+                '%url "rados://manila-ganesha/ganesha-export-3"\n')
+            store.objects['ganesha-export-3'] = export_object(
+                3, '/volumes/_nogroup/c')
+            self.assertEqual(
+                check([(1, '/volumes/_nogroup/a'), (2, '/volumes/_nogroup/b'),
+                       (3, '/volumes/_nogroup/c'), (9, '/old')]),
+                (1, '1 exports are served but not in ganesha-export-index: '
+                    'export ids 9.'))
+            self.assertEqual(store.reads[3:], ['ganesha-export-index',
+                                               'ganesha-export-3'])
+
+            # The index of another share backend is cached beside it.
+            store.objects['ganesha-export-index-fast'] = (
+                '%url rados://manila-ganesha/ganesha-export-10001\n')
+            store.objects['ganesha-export-10001'] = export_object(
+                10001, '/volumes/_nogroup/d')
+            self.assertEqual(
+                collect_nfs_checks.check_nfs_exports(
+                    lambda: store, lambda: FakeBus({
+                        (collect_nfs_checks.EXPORT_MGR, 'ShowExports'): (
+                            TIMESTAMP, [(1, '/volumes/_nogroup/a'),
+                                        (2, '/volumes/_nogroup/b'),
+                                        (3, '/volumes/_nogroup/c')])}),
+                    ['ganesha-export-index', 'ganesha-export-index-fast'],
+                    cache),
+                (2, '1 of 4 exports in ganesha-export-index, '
+                    'ganesha-export-index-fast are not served: export ids '
+                    '10001.'))
+            self.assertEqual(store.reads[5:], ['ganesha-export-index-fast',
+                                               'ganesha-export-10001'])
+
+    def test_check_nfs_exports_no_ganesha(self):
+        store = FakeStore({'ganesha-export-index': ''})
+
+        def no_bus():
+            raise Exception('ServiceUnknown')
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            self.assertEqual(
+                collect_nfs_checks.check_nfs_exports(
+                    lambda: store, no_bus, ['ganesha-export-index'],
+                    os.path.join(tmpdir, 'nfs_exports.json')),
+                (3, 'cannot list the Ganesha exports over D-Bus: '
+                    'ServiceUnknown'))
+
+    def test_check_ceph_backend(self):
+        store = FakeStore({'ganesha-export-index': INDEX}, mon={
+            'fs dump': FS_DUMP,
+            'health': {'checks': {
+                'MDS_CACHE_OVERSIZED': {
+                    'severity': 'HEALTH_WARN',
+                    'summary': {'message': '1 MDSs report oversized cache'}},
+                'OSD_NEARFULL': {
+                    'severity': 'HEALTH_ERR',
+                    'summary': {'message': '1 nearfull osd(s)'}},
+            }},
+        })
+        status, message = collect_nfs_checks.check_ceph_backend(
+            lambda: store, 'ganesha-export-index')
+        self.assertEqual(status, 1)
+        self.assertRegex(
+            message,
+            r'^RADOS index_read [\d.]+ms, kv_roundtrip [\d.]+ms; MDS of '
+            r'cephfs: laggy MDS mds-b; 1 MDSs report oversized cache \| '
+            r'index_read=[\d.]+ms;100;1000 kv_roundtrip=[\d.]+ms;100;1000$')
+        self.assertEqual(store.reads, ['ganesha-export-index'])
+        self.assertEqual(list(store.omaps),
+                         ['nfs-check-' + socket.gethostname()])
+        self.assertTrue(store.closed)
+
+        store.mon['health'] = {'checks': {}}
+        status, message = collect_nfs_checks.check_ceph_backend(
+            lambda: store, 'ganesha-export-index', filesystems=['other'])
+        self.assertEqual(status, 2)
+        self.assertIn('MDS of other: no active MDS |', message)
+        status, message = collect_nfs_checks.check_ceph_backend(
+            lambda: store, 'ganesha-export-index', filesystems=['gone'])
+        self.assertEqual(status, 2)
+        self.assertIn('MDS of gone: filesystem not found |', message)
+        status, message = collect_nfs_checks.check_ceph_backend(
+            lambda: store, 'ganesha-export-index',
+            filesystems=['', 'other'])
+        self.assertEqual(status, 2)
+        self.assertIn('; MDS of cephfs: laggy MDS mds-b; MDS of other: no '
+                      'active MDS |', message)
+
+    def test_check_ceph_backend_slow(self):
+        fs_dump = copy.deepcopy(FS_DUMP)
+        del fs_dump['filesystems'][0]['mdsmap']['info']['gid_4200']
+        store = FakeStore({'ganesha-export-index': INDEX}, mon={
+            'fs dump': fs_dump, 'health': {}})
+        with mock.patch.object(collect_nfs_checks.time, 'monotonic',
+                               side_effect=[0.0, 0.05, 1.0, 2.5]):
+            self.assertEqual(
+                collect_nfs_checks.check_ceph_backend(
+                    lambda: store, 'ganesha-export-index'),
+                (2, 'RADOS index_read 50.0ms, kv_roundtrip 1500.0ms; MDS of '
+                    'cephfs: healthy | index_read=50.0ms;100;1000 '
+                    'kv_roundtrip=1500.0ms;100;1000'))
+
+    def test_check_ceph_backend_down(self):
+        def no_cluster():
+            raise Exception('[errno 110] RADOS timed out')
+
+        self.assertEqual(
+            collect_nfs_checks.check_ceph_backend(
+                no_cluster, 'ganesha-export-index'),
+            (2, 'cannot connect to Ceph: [errno 110] RADOS timed out'))
+        store = FakeStore({})
+        self.assertEqual(
+            collect_nfs_checks.check_ceph_backend(
+                lambda: store, 'ganesha-export-index'),
+            (2, "RADOS index_read failed: 'ganesha-export-index'"))
+        self.assertTrue(store.closed)
+
+    def test_rados_store_recovery_location(self):
+        rados = mock.MagicMock()
+        cluster = rados.Rados.return_value
+        pools = {}
+
+        def open_ioctx(pool):
+            ioctx = pools.setdefault(pool, mock.MagicMock())
+            ioctx.get_omap_vals_by_keys.return_value = ([('probe', b'1')],
+                                                        0)
+            return ioctx
+
+        cluster.open_ioctx.side_effect = open_ioctx
+        args = collect_nfs_checks.parse_cli([
+            '--pool', 'manila-ganesha', '--export-index', 'index',
+            '--recovery-pool', 'nfs-recovery',
+            '--recovery-namespace', 'grace'])
+        with mock.patch.dict(sys.modules, {'rados': rados}):
+            store = collect_nfs_checks.configured_checks(
+                args)['ceph_backend'].args[0]()
+            store.omap_roundtrip('nfs-check-host', 'probe', b'1')
+            store.close()
+        pools['nfs-recovery'].set_namespace.assert_called_once_with('grace')
+        pools['nfs-recovery'].operate_write_op.assert_called_with(
+            mock.ANY, 'nfs-check-host')
+        pools['manila-ganesha'].operate_write_op.assert_not_called()
+        pools['nfs-recovery'].close.assert_called_once_with()
+        pools['manila-ganesha'].close.assert_called_once_with()
+
+        pools.clear()
+        with mock.patch.dict(sys.modules, {'rados': rados}):
+            store = collect_nfs_checks.RadosStore('manila-ganesha', 'admin')
+            store.omap_roundtrip('nfs-check-host', 'probe', b'1')
+        self.assertEqual(list(pools), ['manila-ganesha'])
+        pools['manila-ganesha'].operate_write_op.assert_called_with(
+            mock.ANY, 'nfs-check-host')
+
+    @mock.patch.object(collect_nfs_checks.socket, 'create_connection')
+    def test_check_nfs_conn_refused(self, create_connection):
+        create_connection.side_effect = ConnectionRefusedError(
+            'Connection refused')
+        status, message = collect_nfs_checks.check_nfs_conn()
+        self.assertEqual(status, 2)
+        self.assertIn('port 2049: Connection refused', message)
+
+    def test_collect_and_write_cache(self):
+        def failing():
+            raise subprocess.CalledProcessError(
+                1, ['/usr/sbin/showmount'], output=b'RPC: timed out')
+
+        results = collect_nfs_checks.collect(
+            {'ok': lambda: (0, 'fine'), 'exports': failing,
+             'broken': lambda: 1 / 0},
+            now=lambda: 1000.0)
+        self.assertEqual(results, {
+            'ok': {'status': 0, 'message': 'fine', 'timestamp': 1000.0},
+            'exports': {'status': 2, 'message': 'RPC: timed out',
+                        'timestamp': 1000.0},
+            'broken': {'status': 3, 'message': 'division by zero',
+                       'timestamp': 1000.0},
+        })
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'nfs_checks.json')
+            collect_nfs_checks.write_cache(results, path)
+            with open(path) as f:
+                self.assertEqual(json.load(f), results)
+            self.assertEqual(os.listdir(tmpdir), ['nfs_checks.json'])
+
+
+class TestCheckNfsCached(unittest.TestCase):
+
+    def test_evaluate(self):
+        results = {'nfs_conn': {'status': 2, 'message': 'down',
+                                'timestamp': 1000.0}}
+        self.assertEqual(
+            check_nfs_cached.evaluate(results, 'nfs_conn', 300, 1200.0),
+            (2, 'down'))
+        self.assertEqual(
+            check_nfs_cached.evaluate(results, 'nfs_conn', 300, 1400.0),
+            (3, 'cached result of nfs_conn is 400s old, is the collector '
+                'running?'))
+        self.assertEqual(
+            check_nfs_cached.evaluate(results, 'nfs_exports', 300, 1200.0),
+            (3, 'no cached result for nfs_exports.'))
@@ -0,0 +1,92 @@
+# Copyright 2026 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Helpers shared by the tests of the scripts under src/files."""
+
+import importlib.machinery
+import importlib.util
+
+TIMESTAMP = (1700000000, 0)
+
+
+def load_script(name, path):
+    """Import a script without a .py suffix as a module."""
+    loader = importlib.machinery.SourceFileLoader(name, path)
+    spec = importlib.util.spec_from_loader(name, loader)
+    module = importlib.util.module_from_spec(spec)
+    loader.exec_module(module)
+    return module
+
+
+class FakeBus(object):
+    """Answer D-Bus calls from a {(path, method): reply} mapping."""
+
+    def __init__(self, replies):
+        self.replies = replies
+
+    def get_object(self, bus_name, path):
+        bus = self
+
+        class FakeObject(object):
+            def get_dbus_method(self, method, iface):
+                def call(*args):
+                    reply = bus.replies[(path, method) + args]
+                    if isinstance(reply, Exception):
+                        raise reply
+                    return reply
+                return call
+        return FakeObject()
+
+
+class FakeStore(object):
+    """Serve the objects, omaps and mon commands of a pool from dicts.
+
+    Has the methods of the RADOS stores of ganesha_admin and
+    collect_nfs_checks, and records the objects read.
+    """
+
+    def __init__(self, objects, omaps=None, mon=None):
+        self.objects = objects
+        self.omaps = omaps or {}
+        self.mon = mon or {}
+        self.reads = []
+        self.closed = False
+
+    def stat(self, name):
+        return [len(self.objects[name]), 1000.0]
+
+    def read(self, name):
+        self.reads.append(name)
+        return self.objects[name]
+
+    def list(self):
+        return list(self.objects) + list(self.omaps)
+
+    def get_omap(self, name):
+        return dict(self.omaps.get(name, {}))
+
+    def remove_omap_keys(self, name, keys):
+        for key in keys:
+            del self.omaps[name][key]
+
+    def omap_roundtrip(self, name, key, value):
+        omap = self.omaps.setdefault(name, {})
+        omap[key] = value
+        return omap.pop(key)
+
+    def mon_command(self, prefix, **kwargs):
+        return self.mon[prefix]
+
+    def close(self):
+        self.closed = True